@@ -3,14 +3,7 @@ from io import BytesIO
 from pathlib import Path
 from PIL import Image
 import base64
-import numpy as np
-import json
-
-# Plotting and Data Handling
-import matplotlib
-import matplotlib.pyplot as plt
-import pandas as pd
-import seaborn as sns
+import uuid
 
 # Import logic from our backend files
 import lab
@@ -119,6 +112,12 @@ def init_session_state():
     if "active_tab" not in st.session_state:
         st.session_state.active_tab = "1. Research Assistant"
     
+    # State for Research Assistant Tab
+    if 'tab1_query' not in st.session_state:
+        st.session_state.tab1_query = ''
+    if 'tab1_results' not in st.session_state:
+        st.session_state.tab1_results = None
+
     # State for Analysis Hub
     if 'hub_target_protein_data' not in st.session_state:
         st.session_state.hub_target_protein_data = None
@@ -126,8 +125,16 @@ def init_session_state():
         st.session_state.hub_design_goal = ""
     if 'hub_design_results' not in st.session_state:
         st.session_state.hub_design_results = None
+    if 'hub_design_commentary' not in st.session_state:
+        st.session_state.hub_design_commentary = None
     if 'hub_uploaded_data' not in st.session_state:
         st.session_state.hub_uploaded_data = None
+    if 'hub_uploaded_file_id' not in st.session_state:
+        st.session_state.hub_uploaded_file_id = None
+    if 'hub_screened_dataset' not in st.session_state:
+        st.session_state.hub_screened_dataset = None
+    if 'hub_meeting_transcript' not in st.session_state:
+        st.session_state.hub_meeting_transcript = None
 
     # State for AI Research Report Tab
     if 'report_generation_stage' not in st.session_state:
@@ -142,6 +149,10 @@ def init_session_state():
         st.session_state.draft_report = None
     if 'final_report' not in st.session_state:
         st.session_state.final_report = None
+    if 'report_update_summary' not in st.session_state:
+        st.session_state.report_update_summary = None
+    if 'report_id' not in st.session_state:
+        st.session_state.report_id = uuid.uuid4().hex[:12]  # scopes the report's memoized steps
 
 # --- 3. AUTHENTICATION UI ---
 def render_auth_ui():
@@ -184,9 +195,36 @@ else:
     with st.sidebar:
         st.subheader(f"Welcome, {st.session_state.user_email}")
         if st.button("Logout"):
+            lab.release_session_artifacts()
             st.session_state.user_email = None
             st.rerun()
 
+        # Process-wide latency/token/cost figures for every agent (all sessions).
+        if st.toggle("Show performance telemetry", key="show_telemetry"):
+            telemetry = lab.get_telemetry()
+            telemetry_rows = telemetry.summary()
+            if telemetry_rows:
+                st.dataframe(telemetry_rows, hide_index=True)
+            else:
+                st.caption("No agent calls recorded yet.")
+            scheduler_stats = lab.get_request_scheduler().stats()
+            st.caption(
+                f"Requests: {scheduler_stats['requests']} · Retries: {scheduler_stats['retries']} · "
+                f"Rate-limited: {scheduler_stats['rate_limited']} · Waiting: {scheduler_stats['waiting']}"
+            )
+            artifact_stats = lab.get_artifact_store().stats(lab.current_session_id())
+            st.caption(
+                f"Session artifacts: {artifact_stats['session_bytes'] / 2**20:.1f} MB in memory · "
+                f"All sessions: {artifact_stats['resident_bytes'] / 2**20:.1f} MB in memory, "
+                f"{artifact_stats['spilled_bytes'] / 2**20:.1f} MB spilled to disk · Spills: {artifact_stats['spills']}"
+            )
+            st.download_button(
+                "⬇️ Download telemetry (JSONL)",
+                data=telemetry.to_jsonl().encode('utf-8'),
+                file_name="aira_telemetry.jsonl",
+                mime="application/jsonl",
+            )
+
     show_logo()
 
     # --- NAVIGATION ---
@@ -217,21 +255,35 @@ else:
         if st.button("Run Query", key="button_tab1"):
             if user_query:
                 with st.spinner("Querying AI agents..."):
-                    results = lab.run_hierarchical_agent_system(user_query)
-                    if results.get("error"):
-                        st.error(results["error"])
-                    else:
-                        decision = results["supervisor_decision"]
-                        all_responses = results["all_responses"]
-                        st.subheader(f"Primary Analysis by the {decision} Agent")
-                        st.info(f"{all_responses.get(decision, 'No response generated.')}")
-                        with st.expander("View responses from all other specialized agents"):
-                            for agent, response in all_responses.items():
-                                if agent != decision:
-                                    st.markdown(f"**{agent}:** {response}")
+                    # Only the routed specialist is queried here; the others run on request below.
+                    st.session_state.tab1_query = user_query
+                    lab.set_session_artifact('tab1_results', lab.run_hierarchical_agent_system(user_query, consult_all=False))
             else:
                 st.warning("Please enter a query.")
 
+        results = lab.get_session_artifact('tab1_results')
+        if results:
+            if results.get("error"):
+                st.error(results["error"])
+            else:
+                decision = results["supervisor_decision"]
+                all_responses = results["all_responses"]
+                st.subheader(f"Primary Analysis by the {decision} Agent")
+                primary_response = all_responses.get(decision, 'No response generated.')
+                if primary_response.startswith("Error"):
+                    st.error(primary_response)
+                else:
+                    st.info(primary_response)
+                with st.expander("View responses from all other specialized agents"):
+                    if len(all_responses) == 1:
+                        if st.button("Consult the other specialists", key="consult_others_tab1"):
+                            with st.spinner("Querying the other specialized agents..."):
+                                all_responses = {**all_responses, **lab.run_other_specialists(st.session_state.tab1_query, decision)}
+                            lab.set_session_artifact('tab1_results', dict(results, all_responses=all_responses))
+                    for agent, response in all_responses.items():
+                        if agent != decision:
+                            st.markdown(f"**{agent}:** {response}")
+
     # ==========================================================================
     # --- TAB 2: ANALYSIS & SIMULATION HUB ---
     # ==========================================================================
@@ -245,6 +297,9 @@ else:
                 if disease_name:
                     with st.spinner(f"Searching for targets related to '{disease_name}'..."):
                         st.session_state.hub_target_protein_data = lab.fetch_protein_data(disease_name)
+                    if proteins := st.session_state.hub_target_protein_data.get("proteins"):
+                        with st.spinner(f"Downloading {len(proteins)} predicted structure(s) from AlphaFold..."):
+                            lab.prefetch_protein_structures(proteins)
                 else:
                     st.warning("Please enter a disease name.")
             
@@ -256,8 +311,15 @@ else:
                     st.success(f"Found {len(proteins)} protein target(s).")
                     for uniprot_id in proteins:
                         st.subheader(f"Structure for UniProt ID: {uniprot_id}")
-                        viewer = lab.generate_3d_protein_structure(uniprot_id)
-                        st.components.v1.html(viewer._make_html(), height=500)
+                        # Viewers are only built and sent to the browser for the structures the user opens.
+                        if st.toggle("Show 3D structure", key=f"show_structure_{uniprot_id}"):
+                            viewer_data = lab.get_protein_viewer_html(uniprot_id)
+                            if viewer_data.get("error"):
+                                st.error(viewer_data["error"])
+                            else:
+                                if viewer_data["mode"] != "full":
+                                    st.caption(f"Large structure ({viewer_data['atoms']:,} atoms): showing a reduced-detail C-alpha trace.")
+                                st.components.v1.html(viewer_data["html"], height=500)
                         if st.button(f"Use {uniprot_id} for therapeutic design", key=f"design_{uniprot_id}"):
                             st.session_state.hub_design_goal = f"Generate nanobody variants with high binding affinity to protein {uniprot_id}."
                             st.success(f"Goal set! Go to Module 2 to design your therapeutic.")
@@ -269,43 +331,129 @@ else:
             with st.form(key="designer_form"):
                 nanobody_name = st.selectbox("Select Base Nanobody", options=list(lab.NANOBODY_SEQUENCES.keys()))
                 design_goal_input = st.text_input("Enter or Refine Design Goal", value=st.session_state.hub_design_goal)
+                design_engine = st.radio("Design Engine", ["AI Designer", "Local Mutational Scan"], horizontal=True)
+                scan_col1, scan_col2 = st.columns(2)
+                max_order = scan_col1.selectbox("Mutations per variant (scan only)", [1, 2, 3], index=1)
+                top_k = scan_col2.number_input("Variants to keep (scan only)", min_value=5, max_value=500, value=20)
+                ai_positions = st.checkbox("Let the AI choose which positions to mutate (scan only; default: all CDR positions)")
+                ai_commentary = st.checkbox("Ask the AI to comment on the top variants (scan only)")
                 if st.form_submit_button('Generate and Analyze Candidates'):
                     if design_goal_input:
-                        with st.spinner("AI Designer is generating and analyzing sequences..."):
-                            design_data = lab.run_nanobody_designer(nanobody_name, design_goal_input)
-                            if "candidates" in design_data:
-                                candidates = design_data.get("candidates", [])
-                                wildtype_seq = design_data.get("wildtype")
-                                analysis_df = lab.run_nanobody_analysis(candidates, wildtype_seq)
-                                st.session_state.hub_design_results = analysis_df
+                        st.session_state.hub_design_commentary = None
+                        if design_engine == "AI Designer":
+                            with st.spinner("AI Designer is generating and analyzing sequences..."):
+                                design_data = lab.run_nanobody_designer(nanobody_name, design_goal_input)
+                                if "candidates" in design_data:
+                                    candidates = design_data.get("candidates", [])
+                                    wildtype_seq = design_data.get("wildtype")
+                                    analysis_df = lab.run_nanobody_analysis(candidates, wildtype_seq)
+                                    lab.set_session_artifact('hub_design_results', analysis_df)
+                        else:
+                            with st.spinner("Scanning and scoring mutations..."):
+                                scan = lab.run_nanobody_mutational_scan(nanobody_name, design_goal_input, max_order=max_order, top_k=int(top_k), ai_positions=ai_positions, ai_commentary=ai_commentary)
+                            if scan.get("error"):
+                                st.error(scan["error"])
+                            else:
+                                st.success(f"Scored {scan['variants_scored']:,} variants.")
+                                lab.set_session_artifact('hub_design_results', scan["results"])
+                                st.session_state.hub_design_commentary = scan.get("commentary")
                     else:
                         st.warning("Please enter a design goal.")
             
-            if st.session_state.hub_design_results is not None:
+            design_results = lab.get_session_artifact('hub_design_results')
+            if design_results is not None:
                 st.subheader("Design Campaign Results")
-                st.dataframe(st.session_state.hub_design_results)
+                st.dataframe(design_results)
+                if st.session_state.hub_design_commentary:
+                    st.info(st.session_state.hub_design_commentary)
 
         with st.expander("📊 Module 3: Custom Data Validation"):
             uploaded_file = st.file_uploader("Upload your CSV file", type=["csv"])
-            if uploaded_file is not None:
-                try:
-                    df = pd.read_csv(uploaded_file)
-                    st.session_state.hub_uploaded_data = df
+            # The uploader hands back the same file on every rerun; convert it only when a new one arrives.
+            if uploaded_file is not None and uploaded_file.file_id != st.session_state.hub_uploaded_file_id:
+                with st.spinner("Reading the file into the columnar cache..."):
+                    dataset = lab.ingest_uploaded_dataset(uploaded_file)
+                if isinstance(dataset, dict):
+                    st.error(dataset["error"])
+                else:
+                    st.session_state.hub_uploaded_data = dataset
+                    st.session_state.hub_uploaded_file_id = uploaded_file.file_id
                     st.success("File uploaded successfully!")
-                    st.dataframe(df.head())
-                except Exception as e:
-                    st.error(f"Error reading file: {e}")
             if st.session_state.hub_uploaded_data is not None:
+                dataset = st.session_state.hub_uploaded_data
+                st.caption(f"{dataset.name}: {dataset.rows:,} rows × {len(dataset.columns)} columns "
+                           f"({dataset.source_bytes / 2**20:.1f} MB CSV, {dataset.stored_bytes / 2**20:.1f} MB cached)")
+                st.dataframe(lab.get_dataset_store().load(dataset, rows=5))
                 st.subheader("Create a Correlation Plot")
-                df = st.session_state.hub_uploaded_data
-                columns = df.columns.tolist()
-                col1, col2 = st.columns(2)
-                x_axis = col1.selectbox("Select X-axis", columns, index=0)
-                y_axis = col2.selectbox("Select Y-axis", columns, index=min(1, len(columns)-1))
-                if st.button("Generate Plot"):
-                    fig, ax = plt.subplots()
-                    sns.regplot(data=df, x=x_axis, y=y_axis, ax=ax, scatter_kws={'alpha':0.6})
-                    st.pyplot(fig)
+                columns = dataset.numeric_columns
+                if not columns:
+                    st.warning("The file has no numeric columns to plot.")
+                else:
+                    col1, col2 = st.columns(2)
+                    x_axis = col1.selectbox("Select X-axis", columns, index=0)
+                    y_axis = col2.selectbox("Select Y-axis", columns, index=min(1, len(columns)-1))
+                    if st.button("Generate Plot"):
+                        with st.spinner("Plotting..."):
+                            plot = lab.render_correlation_plot(dataset.key, x_axis, y_axis)
+                        if "error" in plot:
+                            st.error(plot["error"])
+                        else:
+                            st.image(plot["png"])
+                            if plot["mode"] == "hexbin":
+                                st.caption(f"{plot['n']:,} rows are shown as a density plot; the shaded band is the 95% confidence interval of the fit.")
+
+                if len(columns) >= 2:
+                    st.subheader("Screen All Column Pairs")
+                    n_pairs = len(columns) * (len(columns) - 1) // 2
+                    st.caption(f"Pearson and Spearman correlations for all {n_pairs:,} pairs of numeric columns, "
+                               "with Benjamini-Hochberg corrected significance.")
+                    if st.button("Screen All Numeric Columns"):
+                        st.session_state.hub_screened_dataset = dataset.key
+                    if st.session_state.hub_screened_dataset == dataset.key:
+                        with st.spinner(f"Correlating {n_pairs:,} column pairs..."):
+                            screen = lab.screen_dataset_correlations(dataset.key)
+                        if "error" in screen:
+                            st.error(screen["error"])
+                        else:
+                            fdr_col, filter_col = st.columns(2)
+                            alpha = fdr_col.select_slider("False discovery rate", options=[0.001, 0.01, 0.05, 0.1], value=0.05)
+                            only_significant = filter_col.checkbox("Only show significant pairs", value=True)
+                            table = screen["table"]
+                            table = table.assign(significant=(table["pearson_q"] < alpha) | (table["spearman_q"] < alpha))
+                            st.write(f"**{int(table['significant'].sum()):,}** of {len(table):,} pairs are significant at FDR {alpha}.")
+                            st.dataframe(table[table["significant"]] if only_significant else table, hide_index=True)
+                            st.image(screen["heatmap_png"], caption="Pearson correlations, columns in clustered order")
+
+        with st.expander("🧑‍🔬 Module 4: AI Team Meeting"):
+            st.caption("The Principal Investigator opens each round, then the Immunologist, Machine Learning Specialist "
+                       "and Computational Biologist answer in parallel. Turns appear as soon as they are written.")
+            with st.form(key="team_meeting_form"):
+                agenda = st.text_area("Meeting Agenda", value=st.session_state.hub_design_goal)
+                num_rounds = st.number_input("Rounds", min_value=1, max_value=10, value=2)
+                start_meeting = st.form_submit_button("Start Team Meeting")
+
+            def show_meeting_turn(turn):
+                label = "Summary" if turn["round"] == "summary" else f"Round {turn['round']}"
+                with st.chat_message("assistant" if turn["agent"] == lab.principal_investigator.title else "user"):
+                    st.markdown(f"**{turn['agent']}** · {label}")
+                    if turn["message"].startswith("Error"):
+                        st.error(turn["message"])
+                    else:
+                        st.markdown(turn["message"])
+
+            if start_meeting:
+                if agenda:
+                    transcript = []
+                    with st.spinner("The team is meeting..."):
+                        for turn in lab.run_team_meeting(agenda, int(num_rounds)):
+                            transcript.append(turn)
+                            show_meeting_turn(turn)
+                    lab.set_session_artifact('hub_meeting_transcript', transcript)
+                else:
+                    st.warning("Please enter a meeting agenda.")
+            elif transcript := lab.get_session_artifact('hub_meeting_transcript'):
+                for turn in transcript:
+                    show_meeting_turn(turn)
 
     # ==========================================================================
     # --- TAB 3: AI RESEARCH REPORT ---
@@ -317,10 +465,12 @@ else:
         def reset_report_workflow():
             st.session_state.report_generation_stage = 'start'
             st.session_state.research_question = ''
-            st.session_state.report_outline = None
-            st.session_state.research_data = None
-            st.session_state.draft_report = None
-            st.session_state.final_report = None
+            lab.set_session_artifact('report_outline', None)
+            lab.set_session_artifact('research_data', None)
+            lab.set_session_artifact('draft_report', None)
+            lab.set_session_artifact('final_report', None)
+            st.session_state.report_update_summary = None
+            st.session_state.report_id = uuid.uuid4().hex[:12]  # a new report never reuses the old one's steps
             st.rerun()
 
         def format_outline_as_text(outline_json):
@@ -342,10 +492,114 @@ else:
                 markdown_output.append("")
             return "\n".join(markdown_output)
 
+        def format_section_for_editing(outline_json, section_title):
+            descriptions = outline_json.get('descriptions', {}).get(section_title, {})
+            lines = []
+            for sub_title in outline_json.get('subsections', {}).get(section_title, []):
+                description_text = descriptions.get(sub_title)
+                lines.append(f"{sub_title}: {description_text}" if description_text else sub_title)
+            return "\n".join(lines)
+
+        def update_outline_section(outline_json, section_title, new_title, subsections_text):
+            """Returns a copy of the outline with one section renamed and its subsections replaced."""
+            sub_titles, sub_descriptions = [], {}
+            for line in subsections_text.splitlines():
+                sub_title, _, description_text = line.partition(":")
+                if sub_title.strip():
+                    sub_titles.append(sub_title.strip())
+                    if description_text.strip():
+                        sub_descriptions[sub_title.strip()] = description_text.strip()
+            sections = [new_title if title == section_title else title for title in outline_json.get('sections', [])]
+            subsections = {title: subs for title, subs in outline_json.get('subsections', {}).items() if title != section_title}
+            descriptions = {title: descs for title, descs in outline_json.get('descriptions', {}).items() if title != section_title}
+            subsections[new_title] = sub_titles
+            descriptions[new_title] = sub_descriptions
+            return dict(outline_json, sections=sections, subsections=subsections, descriptions=descriptions)
+
+        # --- Background report jobs ---
+        # Jobs run in a runner shared by all sessions and store every finished step
+        # on disk, so they survive tab switches and reconnects.
+        job_runner = lab.get_report_job_runner()
+        job_stage_to_workflow_stage = [
+            ('final', 'editing_complete'),
+            ('draft', 'writing_complete'),
+            ('research', 'research_gathered'),
+            ('outline', 'outline_generated'),
+        ]
+
+        def is_active_job(job):
+            return job["status"] in ("queued", "running")
+
+        def load_report_job(job_id):
+            job = job_runner.status(job_id)
+            outputs = job_runner.outputs(job_id)
+            st.session_state.research_question = job["question"]
+            st.session_state.report_id = job_id  # edits reuse the steps the job memoized
+            lab.set_session_artifact('report_outline', outputs.get('outline'))
+            lab.set_session_artifact('research_data', outputs.get('research'))
+            lab.set_session_artifact('draft_report', outputs.get('draft'))
+            lab.set_session_artifact('final_report', outputs.get('final'))
+            st.session_state.report_generation_stage = next(
+                (workflow_stage for job_stage, workflow_stage in job_stage_to_workflow_stage if job_stage in outputs), 'start'
+            )
+
+        def submit_report_job(outputs=None):
+            job_runner.submit(st.session_state.research_question, owner=st.session_state.user_email, outputs=outputs)
+            reset_report_workflow()
+
+        jobs_were_active = any(is_active_job(job) for job in job_runner.list_jobs(owner=st.session_state.user_email))
+
+        # Poll only while a job is queued or running.
+        @st.fragment(run_every=2 if jobs_were_active else None)
+        def show_report_jobs():
+            jobs = job_runner.list_jobs(owner=st.session_state.user_email)
+            if jobs_were_active and not any(is_active_job(job) for job in jobs):
+                st.rerun()  # a job just finished; refresh the page and stop polling
+            if not jobs:
+                return
+            with st.expander("🗂️ Background Report Jobs", expanded=jobs_were_active):
+                for job in jobs[:10]:
+                    st.markdown(f"**{job['question'][:100]}** — `{job['status']}`")
+                    if is_active_job(job):
+                        st.progress(job["progress"], text=job["message"])
+                    elif job["status"] == "completed":
+                        if st.button("Open Report", key=f"open_job_{job['id']}"):
+                            load_report_job(job["id"])
+                            st.rerun()
+                    else:
+                        st.error(job["error"] or "The job was interrupted by a server restart.")
+                        col1, col2 = st.columns(2)
+                        if col1.button("Resume Job", key=f"resume_job_{job['id']}"):
+                            job_runner.resume(job["id"])
+                            st.rerun()
+                        if col2.button("Open Partial Results", key=f"open_partial_job_{job['id']}"):
+                            load_report_job(job["id"])
+                            st.rerun()
+                    if job["warnings"]:
+                        with st.popover(f"{len(job['warnings'])} warning(s)"):
+                            for warning in job["warnings"]:
+                                st.warning(warning)
+
+        show_report_jobs()
+
+        # Every step below reruns the script once it has stored its result, so these stay current.
+        report_outline = lab.get_session_artifact('report_outline')
+        research_data = lab.get_session_artifact('research_data')
+        draft_report = lab.get_session_artifact('draft_report')
+        final_report = lab.get_session_artifact('final_report')
+
         if st.session_state.report_generation_stage == 'start':
             st.subheader("Step 3.1: Define Your Research Question")
             research_q = st.text_area("Enter your research question here:", height=100, key="report_q_input", value=st.session_state.research_question)
-            if st.button("Generate Report Outline"):
+            run_in_background = st.toggle("Run all steps in the background", help="Generates the full report without stopping for review. You can leave this tab and come back to it.")
+            if run_in_background:
+                if st.button("Generate Full Report in Background"):
+                    if research_q:
+                        st.session_state.research_question = research_q
+                        submit_report_job()
+                    else:
+                        st.warning("Please enter a research question.")
+            elif st.button("Generate Report Outline"):
                 if research_q:
                     st.session_state.research_question = research_q
                     with st.spinner("Generating a detailed report outline..."):
@@ -354,7 +608,7 @@ else:
                         if "error" in outline:
                             st.error(outline["error"])
                         else:
-                            st.session_state.report_outline = outline
+                            lab.set_session_artifact('report_outline', outline)
                             st.session_state.report_generation_stage = 'outline_generated'
                             st.rerun()
                 else:
@@ -362,82 +616,147 @@ else:
 
         if st.session_state.report_generation_stage in ['outline_generated', 'research_gathered', 'writing_complete', 'editing_complete']:
             st.subheader("Report Outline")
-            if st.session_state.report_outline:
-                st.markdown(format_outline_as_text(st.session_state.report_outline))
-                if st.session_state.report_generation_stage == 'outline_generated':
-                    if st.button("Step 3.2: Gather Research Data"):
-                        with st.spinner("Research Agent is gathering cited information... This may take a minute."):
-                            research = lab.run_research_agent(st.session_state.research_question, json.dumps(st.session_state.report_outline))
-                            if research.startswith("Error"):
-                                st.error(research)
+            if report_outline:
+                st.markdown(format_outline_as_text(report_outline))
+
+                # Every step is keyed by its inputs, so an edit re-runs only the steps it affects.
+                with st.expander("✏️ Edit the Question or a Section"):
+                    edit_section = st.selectbox("Section to edit", report_outline.get('sections', []))
+                    with st.form("edit_report_form"):
+                        new_question = st.text_input("Research question", value=st.session_state.research_question)
+                        new_title = st.text_input("Section title", value=edit_section or "", key=f"edit_title_{edit_section}")
+                        new_subsections = st.text_area("Subsections, one per line (`Title: description`)", height=150,
+                                                       value=format_section_for_editing(report_outline, edit_section),
+                                                       key=f"edit_subsections_{edit_section}")
+                        rerun_everything = st.checkbox("Re-run every step instead of reusing unchanged ones")
+                        if st.form_submit_button("Apply and Update the Report"):
+                            new_question = new_question.strip() or st.session_state.research_question
+                            new_outline = report_outline
+                            if edit_section:
+                                new_outline = update_outline_section(report_outline, edit_section, new_title.strip() or edit_section, new_subsections)
+                            through = {'research_gathered': 'research', 'writing_complete': 'draft', 'editing_complete': 'final'}.get(st.session_state.report_generation_stage)
+                            report_id = uuid.uuid4().hex[:12] if rerun_everything else st.session_state.report_id
+                            update = {}
+                            if through:
+                                update_progress = st.progress(0, text="Updating the report...")
+                                update = lab.regenerate_report(new_question, new_outline, through, report_id=report_id,
+                                                               on_progress=lambda fraction, message: update_progress.progress(fraction, text=message))
+                            if update.get("error"):
+                                st.error(update["error"])
                             else:
-                                st.session_state.research_data = research
-                                st.session_state.report_generation_stage = 'research_gathered'
+                                st.session_state.research_question = new_question
+                                st.session_state.report_id = report_id
+                                lab.set_session_artifact('report_outline', new_outline)
+                                if through:
+                                    lab.set_session_artifact('research_data', update["research"])
+                                    lab.set_session_artifact('draft_report', update["draft"])
+                                    lab.set_session_artifact('final_report', update["final"])
+                                    st.session_state.report_update_summary = {k: update[k] for k in ("reused", "rerun", "warnings")}
                                 st.rerun()
+
+                # Shown once, right after the update.
+                if summary := st.session_state.pop('report_update_summary', None):
+                    st.success(f"Report updated: re-ran {len(summary['rerun'])} step(s) and reused {len(summary['reused'])}.")
+                    if summary['rerun']:
+                        st.caption("Re-ran: " + ", ".join(summary['rerun']))
+                    for warning in summary['warnings']:
+                        st.warning(warning)
+
+                if st.session_state.report_generation_stage == 'outline_generated':
+                    if st.button("Step 3.2: Gather Research Data"):
+                        st.caption("Research Agent is gathering cited information...")
+                        research_stream = lab.stream_research_stage(st.session_state.research_question, report_outline, st.session_state.report_id)
+                        st.write_stream(research_stream)
+                        research = research_stream.text
+                        if research.startswith("Error"):
+                            st.error(research)
+                        else:
+                            lab.set_session_artifact('research_data', research)
+                            st.session_state.report_generation_stage = 'research_gathered'
+                            st.rerun()
         
         if st.session_state.report_generation_stage in ['research_gathered', 'writing_complete', 'editing_complete']:
             st.subheader("Collected Research Data")
-            if st.session_state.research_data:
+            if research_data:
                 with st.expander("View Collected Research", expanded=False):
-                    st.markdown(st.session_state.research_data)
+                    st.markdown(research_data)
                 if st.session_state.report_generation_stage == 'research_gathered':
                     if st.button("Step 3.3: Write Full Draft Report"):
-                        outline = st.session_state.report_outline
-                        sections = outline.get('sections', [])
-                        full_draft = ""
-                        writer_progress = st.progress(0, text="Writer Agent is starting...")
-                        for i, section_title in enumerate(sections):
-                            writer_progress.progress((i) / len(sections), text=f"Writing section: {section_title}...")
-                            section_outline_details = { "subsections": outline.get('subsections', {}).get(section_title, []), "descriptions": outline.get('descriptions', {}).get(section_title, {}) }
-                            section_content = lab.run_writer_agent(section_title, json.dumps(section_outline_details), st.session_state.research_data)
-                            if section_content.startswith("Error"):
-                                st.error(section_content)
-                                full_draft = None
-                                break
-                            full_draft += f"\n\n## {section_title}\n\n{section_content}"
-                        writer_progress.progress(1.0, text="Draft writing complete!")
+                        writer_progress = st.progress(0, text="Writer Agent is writing all sections in parallel...")
+
+                        def update_writer_progress(section_title, completed, total):
+                            writer_progress.progress(completed / total, text=f"Finished section: {section_title} ({completed}/{total})")
+
+                        writer_stream = lab.stream_writer_stage(report_outline, research_data, st.session_state.report_id, on_section_complete=update_writer_progress)
+                        st.write_stream(writer_stream)
+                        for section_title, error in writer_stream.errors.items():
+                            st.error(error)
+                        full_draft = writer_stream.draft
                         if full_draft:
-                            st.session_state.draft_report = full_draft
+                            writer_progress.progress(1.0, text="Draft writing complete!")
+                            lab.set_session_artifact('draft_report', full_draft)
                             st.session_state.report_generation_stage = 'writing_complete'
                             st.rerun()
 
         if st.session_state.report_generation_stage in ['writing_complete', 'editing_complete']:
             st.subheader("Generated Draft Report")
-            if st.session_state.draft_report:
+            if draft_report:
                 with st.expander("View Full Draft", expanded=False):
-                    st.markdown(st.session_state.draft_report)
+                    st.markdown(draft_report)
                 if st.session_state.report_generation_stage == 'writing_complete':
                     if st.button("Step 3.4: Edit and Finalize Report"):
-                        with st.spinner("Editor Agent is reviewing and polishing the final report..."):
-                            final_version = lab.run_editor_agent(st.session_state.research_question, st.session_state.draft_report)
-                            if final_version.startswith("Error"):
-                                st.error(final_version)
-                            else:
-                                st.session_state.final_report = final_version
-                                st.session_state.report_generation_stage = 'editing_complete'
-                                st.rerun()
+                        if len(draft_report) <= lab.EDITOR_SINGLE_PASS_MAX_CHARS:
+                            st.caption("Editor Agent is reviewing and polishing the final report...")
+                            editor_stream = lab.stream_editor_stage(st.session_state.research_question, draft_report, st.session_state.report_id)
+                            st.write_stream(editor_stream)
+                            final_version = editor_stream.text
+                        else:
+                            # Long drafts exceed a single completion, so sections are edited in parallel.
+                            editor_progress = st.progress(0, text="Editor Agent is editing all sections in parallel...")
+
+                            def update_editor_progress(section_title, completed, total):
+                                editor_progress.progress(completed / total, text=f"Edited section: {section_title} ({completed}/{total})")
+
+                            with st.spinner("Editor Agent is polishing the report..."):
+                                editor_results = lab.run_editor_agents_parallel(st.session_state.research_question, report_outline, draft_report, on_section_complete=update_editor_progress, report_id=st.session_state.report_id)
+                            for warning in editor_results["warnings"]:
+                                st.warning(warning)
+                            final_version = editor_results["report"]
+                        if final_version.startswith("Error"):
+                            st.error(final_version)
+                        else:
+                            lab.set_session_artifact('final_report', final_version)
+                            st.session_state.report_generation_stage = 'editing_complete'
+                            st.rerun()
 
         if st.session_state.report_generation_stage == 'editing_complete':
             st.subheader("Final Polished Report")
             st.success("Your research report has been generated successfully!")
-            if st.session_state.final_report:
-                st.markdown(st.session_state.final_report)
+            if final_report:
+                st.markdown(final_report)
                 
                 st.download_button(
                     label="⬇️ Download Report as Markdown",
-                    data=st.session_state.final_report.encode('utf-8'),
+                    data=final_report.encode('utf-8'),
                     file_name=f"research_report_{st.session_state.research_question[:20].replace(' ', '_')}.md",
                     mime='text/markdown',
                 )
                 if st.button("Email Final Report to Myself"):
                     subject = f"Your AIRA Research Report: {st.session_state.research_question}"
-                    body = st.session_state.final_report
+                    body = final_report
                     success, msg = local_auth.send_email_notification(st.session_state.user_email, subject, body)
                     if success:
                         st.success(msg)
 
         if st.session_state.report_generation_stage != 'start':
             st.divider()
+            if st.session_state.report_generation_stage != 'editing_complete':
+                if st.button("Finish This Report in the Background"):
+                    submit_report_job({
+                        'outline': report_outline,
+                        'research': research_data,
+                        'draft': draft_report,
+                    })
             if st.button("Start a New Report"):
                 reset_report_workflow()
 
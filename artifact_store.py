@@ -0,0 +1,257 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, NamedTuple, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------------
+# --- SESSION ARTIFACT STORE ---
+# --------------------------------------------------------------------------
+# Large per-session values (result tables, research notes, drafts, reports)
+# are kept here instead of in `st.session_state`, which then holds only a
+# small handle. Artifacts are content-addressed: the key is the SHA-256 of the
+# pickled value, so identical values from different sessions are stored once.
+#
+# Every artifact is written to disk when it is stored. Recently used artifacts
+# are also kept in memory. Memory is bounded by two caps:
+# - a per-session cap on the bytes each session keeps resident
+# - a global cap on all resident bytes
+# Going over a cap spills the least recently used artifacts (of that session,
+# or overall) from memory; reading one again loads it back from disk. When a
+# session goes over its cap, an artifact another session also holds is not
+# spilled; it just stops counting against the session that went over. The disk
+# copy is bounded too: once it is over its cap, the oldest files that neither
+# are resident nor back a live session's handle are deleted.
+#
+# A session's handles count as live until it is released (e.g. on logout) or,
+# if `is_live_session` is given, until that says the session is gone and the
+# session hasn't used the store for `ARTIFACT_REFERENCE_GRACE_SECONDS` (so a
+# briefly disconnected browser keeps its artifacts).
+
+ARTIFACT_SESSION_MAX_BYTES = 64 * 2**20
+ARTIFACT_GLOBAL_MAX_BYTES = 512 * 2**20
+ARTIFACT_DISK_MAX_BYTES = 4 * 2**30
+ARTIFACT_REFERENCE_GRACE_SECONDS = 3600
+
+class ArtifactHandle(NamedTuple):
+    """What `st.session_state` keeps instead of the value itself."""
+    key: str
+    size: int               # bytes of the pickled value
+    type_name: str
+
+class _Resident:
+    __slots__ = ("value", "size", "sessions")
+
+    def __init__(self, value: Any, size: int) -> None:
+        self.value = value
+        self.size = size
+        self.sessions: Set[str] = set()
+
+class ArtifactStore:
+    """Thread-safe, content-addressed store with LRU spill from memory to disk."""
+
+    def __init__(self, cache_dir: Path, session_max_bytes: int = ARTIFACT_SESSION_MAX_BYTES,
+                 global_max_bytes: int = ARTIFACT_GLOBAL_MAX_BYTES, disk_max_bytes: int = ARTIFACT_DISK_MAX_BYTES,
+                 is_live_session: Optional[Callable[[str], bool]] = None,
+                 reference_grace_seconds: float = ARTIFACT_REFERENCE_GRACE_SECONDS) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.session_max_bytes = session_max_bytes
+        self.global_max_bytes = global_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.is_live_session = is_live_session
+        self.reference_grace_seconds = reference_grace_seconds
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._resident: "OrderedDict[str, _Resident]" = OrderedDict()   # global LRU order
+        self._sessions: Dict[str, "OrderedDict[str, None]"] = {}        # per-session LRU order
+        self._session_bytes: Dict[str, int] = {}
+        self._references: Dict[str, Counter] = {}                       # keys behind each session's handles
+        self._last_seen: Dict[str, float] = {}
+        self._resident_bytes = 0
+        self._disk_bytes = sum(path.stat().st_size for path in self.cache_dir.glob("*/*.pkl"))
+        self._counters = {"puts": 0, "memory_hits": 0, "disk_loads": 0, "spills": 0, "missing": 0, "disk_evictions": 0}
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.pkl"
+
+    # --- memory bookkeeping (callers hold the lock) ---
+
+    def _attach(self, session_id: str, key: str, value: Any, size: int) -> None:
+        entry = self._resident.get(key)
+        if entry is None:
+            entry = self._resident[key] = _Resident(value, size)
+            self._resident_bytes += size
+        self._resident.move_to_end(key)
+        keys = self._sessions.setdefault(session_id, OrderedDict())
+        if session_id not in entry.sessions:
+            entry.sessions.add(session_id)
+            self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + size
+        keys[key] = None
+        keys.move_to_end(key)
+
+        while self._session_bytes.get(session_id, 0) > self.session_max_bytes and keys:
+            oldest = next(iter(keys))
+            if len(self._resident[oldest].sessions) > 1:
+                self._detach(session_id, oldest)
+            else:
+                self._spill(oldest)
+        while self._resident_bytes > self.global_max_bytes and self._resident:
+            self._spill(next(iter(self._resident)))
+
+    def _spill(self, key: str) -> None:
+        entry = self._resident.pop(key)
+        self._resident_bytes -= entry.size
+        for session_id in entry.sessions:
+            keys = self._sessions[session_id]
+            keys.pop(key, None)
+            self._session_bytes[session_id] -= entry.size
+            if not keys:
+                # Streamlit doesn't say when a session ends; forget sessions with nothing resident.
+                del self._sessions[session_id], self._session_bytes[session_id]
+        self._counters["spills"] += 1
+
+    def _detach(self, session_id: str, key: str) -> None:
+        """Stops counting a resident artifact against one session; it stays resident for any others."""
+        entry = self._resident.get(key)
+        if entry is None or session_id not in entry.sessions:
+            return
+        entry.sessions.discard(session_id)
+        keys = self._sessions[session_id]
+        keys.pop(key, None)
+        self._session_bytes[session_id] -= entry.size
+        if not keys:
+            del self._sessions[session_id], self._session_bytes[session_id]
+
+    def _drop_dead_references(self) -> None:
+        if self.is_live_session is None:
+            return
+        cutoff = time.time() - self.reference_grace_seconds
+        for session_id in list(self._references):
+            if self._last_seen.get(session_id, 0) < cutoff and not self.is_live_session(session_id):
+                del self._references[session_id]
+                self._last_seen.pop(session_id, None)
+
+    def _prune_disk(self) -> None:
+        if self._disk_bytes <= self.disk_max_bytes:
+            return
+        self._drop_dead_references()
+        referenced = set().union(*self._references.values())
+        files = sorted(self.cache_dir.glob("*/*.pkl"), key=lambda path: path.stat().st_mtime)
+        for path in files:
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            if path.stem in self._resident or path.stem in referenced:
+                continue
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            self._disk_bytes -= size
+            self._counters["disk_evictions"] += 1
+
+    # --- public API ---
+
+    def put(self, session_id: str, value: Any) -> ArtifactHandle:
+        """
+        Stores `value` for a session and returns the handle to keep in session
+        state. Its file is kept until the session `discard`s the handle or is released.
+        """
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        with self._lock:
+            self._counters["puts"] += 1
+            if path.exists():
+                os.utime(path)
+            else:
+                path.parent.mkdir(exist_ok=True)
+                fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_name, path)
+                self._disk_bytes += len(data)
+            self._references.setdefault(session_id, Counter())[key] += 1
+            self._last_seen[session_id] = time.time()
+            self._attach(session_id, key, value, len(data))
+            self._prune_disk()
+        return ArtifactHandle(key, len(data), type(value).__name__)
+
+    def get(self, session_id: str, handle: ArtifactHandle, default: Any = None) -> Any:
+        """
+        The value behind `handle`, from memory or disk; `default` (with a logged
+        warning) if its file is gone, e.g. because the session was released.
+        """
+        with self._lock:
+            self._last_seen[session_id] = time.time()
+            entry = self._resident.get(handle.key)
+            if entry is not None:
+                self._counters["memory_hits"] += 1
+                self._attach(session_id, handle.key, entry.value, entry.size)
+                return entry.value
+        try:
+            data = self._path(handle.key).read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self._counters["missing"] += 1
+            logger.warning("Artifact %s (%s, %d bytes) of session %s is missing from %s",
+                           handle.key, handle.type_name, handle.size, session_id, self.cache_dir)
+            return default
+        value = pickle.loads(data)
+        with self._lock:
+            self._counters["disk_loads"] += 1
+            self._attach(session_id, handle.key, value, len(data))
+        return value
+
+    def discard(self, session_id: str, handle: ArtifactHandle) -> None:
+        """Drops one of a session's handles (e.g. when it is replaced), so its file may be evicted."""
+        with self._lock:
+            keys = self._references.get(session_id)
+            if not keys or not keys[handle.key]:
+                return
+            keys[handle.key] -= 1
+            if not keys[handle.key]:
+                del keys[handle.key]
+                if session_id in self._sessions:
+                    self._detach(session_id, handle.key)
+
+    def release(self, session_id: str) -> None:
+        """
+        Forgets a session (e.g. on logout): its artifacts no longer count against
+        it, and their files may be evicted once the disk is over its cap.
+        """
+        with self._lock:
+            self._references.pop(session_id, None)
+            self._last_seen.pop(session_id, None)
+            for key in self._sessions.pop(session_id, {}):
+                entry = self._resident.get(key)
+                if entry is not None:
+                    entry.sessions.discard(session_id)
+                    if not entry.sessions:
+                        self._resident.pop(key)
+                        self._resident_bytes -= entry.size
+            self._session_bytes.pop(session_id, None)
+
+    def stats(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """Resident versus spilled bytes, artifact counts and hit/spill counters (plus one session's usage)."""
+        with self._lock:
+            stats = {
+                "resident_bytes": self._resident_bytes,
+                "resident_artifacts": len(self._resident),
+                "disk_bytes": self._disk_bytes,
+                "spilled_bytes": max(0, self._disk_bytes - self._resident_bytes),
+                "sessions": len(self._sessions),
+                "referenced_artifacts": len(set().union(*self._references.values())),
+                "largest_session_bytes": max(self._session_bytes.values(), default=0),
+                "session_max_bytes": self.session_max_bytes,
+                "global_max_bytes": self.global_max_bytes,
+                **self._counters,
+            }
+            if session_id is not None:
+                stats["session_bytes"] = self._session_bytes.get(session_id, 0)
+                stats["session_artifacts"] = len(self._sessions.get(session_id, ()))
+            return stats
@@ -0,0 +1,172 @@
+"""
+Headless batch generation of AI Research Reports.
+
+Runs the full Tab 3 pipeline (outline -> research -> draft -> final) for every
+question in a file, several questions at a time, under global request and
+token limits. Each question becomes a resumable job under <output>/jobs, so
+re-running the same command after a crash or a failed stage only repeats the
+work that didn't finish. Finished reports are written to <output>/<id>.md and
+one line per question (status, attempts, per-stage timings) to
+<output>/manifest.jsonl.
+
+Run it from the app directory so `.streamlit/secrets.toml` and the completion
+cache are found:
+
+    python batch_reports.py questions.txt --output reports --concurrency 4 --rpm 60 --tpm 200000
+
+Questions files can be plain text (one question per line, '#' comments),
+JSON Lines ({"question": ..., "id": ...}) or CSV with a `question` column
+(and optionally `id`).
+"""
+import argparse
+import csv
+import hashlib
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import lab
+from report_pipeline import JOB_COMPLETED, JOB_FAILED, JOB_INTERRUPTED, ReportJobRunner
+
+BATCH_MAX_CONCURRENCY = 4
+BATCH_MAX_ATTEMPTS = 3
+BATCH_RETRY_DELAY = 10.0
+
+def question_id(question: str) -> str:
+    """Returns a stable, filesystem-safe ID for a question: a short slug plus a hash of the full text."""
+    slug = re.sub(r"[^a-z0-9]+", "-", question.lower()).strip("-")[:50].strip("-")
+    digest = hashlib.sha1(question.encode("utf-8")).hexdigest()[:8]
+    return f"{slug}-{digest}" if slug else digest
+
+def load_questions(path: Path) -> List[Dict[str, str]]:
+    """Reads questions from a .txt, .jsonl or .csv file. Returns a list of {"id", "question"} dicts."""
+    path = Path(path)
+    if path.suffix.lower() == ".jsonl":
+        with path.open(encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    elif path.suffix.lower() == ".csv":
+        with path.open(encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with path.open(encoding="utf-8") as f:
+            rows = [{"question": line} for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+    questions, seen = [], set()
+    for row in rows:
+        question = (row.get("question") or "").strip()
+        if not question:
+            continue
+        # User-supplied IDs (strings or JSON numbers) become file and directory names, so they are slugged too.
+        job_id = question_id(str(row["id"])) if row.get("id") not in (None, "") else question_id(question)
+        if job_id in seen:
+            continue
+        seen.add(job_id)
+        questions.append({"id": job_id, "question": question})
+    return questions
+
+def _job_id(item: Dict[str, str]) -> str:
+    # A job resumes from its stored stage outputs, so its ID covers the question text as well as the
+    # question's ID: editing a question in the file starts a new job instead of reusing the old answers.
+    digest = hashlib.sha1(item["question"].encode("utf-8")).hexdigest()[:8]
+    return item["id"] if item["id"].endswith(digest) else f"{item['id']}-{digest}"
+
+def _manifest_row(item: Dict[str, str], record: Dict[str, Any], report_path: Optional[Path], wall_seconds: float,
+                  reused: bool) -> Dict[str, Any]:
+    return {
+        "id": item["id"],
+        "job_id": record["id"],
+        "question": record["question"],
+        "status": record["status"],
+        "error": record.get("error"),
+        "report": str(report_path) if report_path else None,
+        "reused": reused,
+        "wall_seconds": round(wall_seconds, 3),
+        "stage_seconds": record.get("timings", {}),
+        "attempts": record.get("attempts", {}),
+        "warnings": record.get("warnings", []),
+    }
+
+def run_batch(questions: List[Dict[str, str]], output_dir: Path, concurrency: int = BATCH_MAX_CONCURRENCY,
+              requests_per_minute: float = None, tokens_per_minute: float = None,
+              max_attempts: int = BATCH_MAX_ATTEMPTS, retry_delay: float = BATCH_RETRY_DELAY,
+              on_result: Callable[[Dict[str, Any]], None] = None) -> List[Dict[str, Any]]:
+    """
+    Generates a report for every question and returns the manifest rows (also
+    written to `output_dir/manifest.jsonl`). `questions` is a list of
+    {"id", "question"} dicts as returned by `load_questions`.
+    Reports finished by an earlier run are reused; failed or interrupted ones
+    are resumed from their first unfinished stage. A question whose text
+    changed since the earlier run gets a new job.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if requests_per_minute or tokens_per_minute:
+        lab.set_request_limits(requests_per_minute, tokens_per_minute)
+    runner = ReportJobRunner(output_dir / "jobs", lab.REPORT_STAGES, max_workers=concurrency,
+                             max_attempts=max_attempts, retry_delay=retry_delay)
+
+    job_ids = {item["id"]: _job_id(item) for item in questions}
+    started: Dict[str, float] = {}
+    reused = set()
+    for item in questions:
+        job_id = job_ids[item["id"]]
+        record = runner.status(job_id)
+        started[item["id"]] = time.perf_counter()
+        if record is None:
+            runner.submit(item["question"], job_id=job_id)
+        elif record["status"] == JOB_COMPLETED:
+            reused.add(item["id"])
+        elif record["status"] in (JOB_FAILED, JOB_INTERRUPTED):
+            runner.resume(job_id)
+
+    rows = []
+    with (output_dir / "manifest.jsonl").open("w", encoding="utf-8") as manifest:
+        for item in questions:
+            record = runner.wait(job_ids[item["id"]])
+            wall_seconds = time.perf_counter() - started[item["id"]]
+            report_path = None
+            if record["status"] == JOB_COMPLETED:
+                report_path = output_dir / f"{item['id']}.md"
+                final_report = runner.outputs(record["id"])["final"]
+                report_path.write_text(f"# {item['question']}\n\n{final_report}\n", encoding="utf-8")
+            row = _manifest_row(item, record, report_path, wall_seconds, item["id"] in reused)
+            manifest.write(json.dumps(row, ensure_ascii=False) + "\n")
+            manifest.flush()
+            rows.append(row)
+            if on_result:
+                on_result(row)
+    return rows
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", type=Path, help="File of research questions (.txt, .jsonl or .csv).")
+    parser.add_argument("--output", type=Path, default=Path("reports"), help="Output directory (default: reports).")
+    parser.add_argument("--concurrency", type=int, default=BATCH_MAX_CONCURRENCY, help="Reports generated at the same time.")
+    parser.add_argument("--rpm", type=float, default=None, help="Global limit on API requests per minute.")
+    parser.add_argument("--tpm", type=float, default=None, help="Global limit on API tokens per minute.")
+    parser.add_argument("--max-attempts", type=int, default=BATCH_MAX_ATTEMPTS, help="Attempts per stage before a report is marked failed.")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    if not questions:
+        print(f"No questions found in {args.questions}.", file=sys.stderr)
+        return 1
+
+    def report_result(row):
+        detail = row["report"] if row["status"] == JOB_COMPLETED else row["error"]
+        print(f"[{row['status']:>11}] {row['wall_seconds']:8.1f}s  {row['id']}  {detail}", flush=True)
+
+    print(f"Generating {len(questions)} report(s) into {args.output} ...", flush=True)
+    start = time.perf_counter()
+    rows = run_batch(questions, args.output, concurrency=args.concurrency, requests_per_minute=args.rpm,
+                     tokens_per_minute=args.tpm, max_attempts=args.max_attempts, on_result=report_result)
+    failed = sum(row["status"] != JOB_COMPLETED for row in rows)
+    print(f"Done in {time.perf_counter() - start:.1f}s: {len(rows) - failed} completed, {failed} failed. "
+          f"Manifest: {args.output / 'manifest.jsonl'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Login latency of the local user store as the number of accounts grows.
+
+Creates throwaway user databases with 1k, 10k and 100k accounts and times
+`login_user_local` (successful and failed lookups) and `sign_up_user_local`
+against each. Because lookups go through the indexed `email` column, the
+per-call latency should stay flat as the account count grows.
+
+Usage:
+    python benchmarks/bench_auth_store.py [--sizes 1000 10000 100000] [--calls 2000]
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import local_auth  # noqa: E402
+
+def populate(db_path: Path, n_accounts: int):
+    # Bulk-load directly; creating 100k accounts through sign_up_user_local
+    # one by one would only measure the setup.
+    local_auth.USERS_DB = db_path
+    conn = local_auth._connect()
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (email, password) VALUES (?, ?)",
+            ((f"user{i}@example.com", f"password{i}") for i in range(n_accounts)),
+        )
+
+def time_calls(fn, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--calls", type=int, default=2_000)
+    args = parser.parse_args()
+
+    # Point the legacy file somewhere empty so no real accounts are migrated.
+    local_auth.USERS_FILE = Path(tempfile.gettempdir()) / "aira-bench-no-users.json"
+    rng = random.Random(0)
+    print(f"{'accounts':>10} {'login ok p50/p95 (us)':>24} {'login miss p50/p95 (us)':>26} {'sign-up p50/p95 (us)':>22}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_accounts in args.sizes:
+            db_path = Path(tmp) / f"users_{n_accounts}.db"
+            populate(db_path, n_accounts)
+            hits = [(f"user{i}@example.com", f"password{i}") for i in (rng.randrange(n_accounts) for _ in range(args.calls))]
+            misses = [(f"nobody{i}@example.com", "x") for i in range(args.calls)]
+            signups = [(f"new{i}@example.com", "pw") for i in range(args.calls)]
+            ok = time_calls(local_auth.login_user_local, hits)
+            miss = time_calls(local_auth.login_user_local, misses)
+            new = time_calls(local_auth.sign_up_user_local, signups)
+            print(f"{n_accounts:>10} {ok[0]:>12.1f}/{ok[1]:<11.1f} {miss[0]:>13.1f}/{miss[1]:<12.1f} {new[0]:>10.1f}/{new[1]:<11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+End-to-end latency of the three tabs against a mock Azure OpenAI server.
+
+Starts benchmarks/mock_openai_server.py, points `lab` at it through a
+throwaway secrets.toml, and times three flows:
+- tab1: the Research Assistant as the "Run Query" button runs it, i.e. the
+  local router picks one specialist (`consult_all=False`), and the LLM
+  supervisor is only asked when the router is unsure
+- tab2: the design flow, i.e. protein lookup, AI designer and sequence analysis
+- tab3: the full report pipeline, i.e. outline, research, draft and final edit
+
+Each flow runs at 1, 8 and 32 concurrent users. Every user runs `--iterations`
+flows back to back with unique prompts, and the completion cache is bypassed
+unless `--with-cache` is given. Mock latency, injected failures and the seed
+are all recorded in the output file. Runs with the same options therefore
+send the same requests and see the same failures, and two result files can be
+compared with `--compare`.
+
+Usage:
+    python benchmarks/bench_flows.py [--flows tab1 tab2 tab3] [--users 1 8 32] [--iterations 2]
+        [--first-token-ms 150] [--per-token-ms 2] [--completion-tokens 300]
+        [--rate-429 0.0] [--rate-timeout 0.0] [--seed 0] [--with-cache]
+        [--output benchmarks/results/latest.json] [--compare benchmarks/results/baseline.json]
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from mock_openai_server import MockConfig  # noqa: E402
+from telemetry import percentile  # noqa: E402
+
+FLOWS = ["tab1", "tab2", "tab3"]
+
+SECRETS_TEMPLATE = """\
+AZURE_ENDPOINT = "http://127.0.0.1:{port}"
+AZURE_API_KEY = "benchmark"
+API_VERSION = "2024-02-01"
+DEPLOYMENT_NAME = "mock"
+"""
+
+def start_mock_server(config: MockConfig):
+    """Starts the mock server in a subprocess (so it doesn't share our GIL). Returns (process, port)."""
+    args = [sys.executable, str(Path(__file__).with_name("mock_openai_server.py")), "--port", "0"]
+    for field, value in config._asdict().items():
+        args += [f"--{field.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline().strip().rsplit(":", 1)[1])
+    return process, port
+
+def mock_request(port: int, path: str, method: str = "GET"):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=b"" if method == "POST" else None, method=method)
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read() or b"{}")
+
+def run_tab1(lab, tag: str) -> bool:
+    # Same call as the Tab 1 "Run Query" button: the routed specialist only.
+    result = lab.run_hierarchical_agent_system(f"Which targets look most promising for early Alzheimer's disease? {tag}",
+                                               consult_all=False)
+    return "error" not in result and not any(r.startswith("Error") for r in result["all_responses"].values())
+
+def run_tab2(lab, tag: str) -> bool:
+    proteins = lab.fetch_protein_data(f"Parkinson's disease {tag}")
+    if "error" in proteins:
+        return False
+    design = lab.run_nanobody_designer("Nb21", f"Increase binding affinity to {proteins['proteins'][0]}. {tag}")
+    if "error" in design:
+        return False
+    analysis = lab.run_nanobody_analysis(design["candidates"], design["wildtype"])
+    return "error" not in analysis.columns
+
+def run_tab3(lab, tag: str) -> bool:
+    from report_pipeline import StageContext
+
+    outputs, warnings = {}, []
+    context = StageContext(f"How does the gut microbiome influence neuroinflammation? {tag}", outputs,
+                           lambda fraction, message: None, warnings.append)
+    for stage in lab.REPORT_STAGES:
+        outputs[stage.name] = stage.run(context)
+    return True
+
+FLOW_FUNCTIONS = {"tab1": run_tab1, "tab2": run_tab2, "tab3": run_tab3}
+
+def run_level(lab, port: int, flow: str, users: int, iterations: int):
+    """Runs `users` concurrent users, each doing `iterations` flows. Returns one result row."""
+    run_flow = FLOW_FUNCTIONS[flow]
+    run_flow(lab, f"[{flow} warm-up {users}]")  # client start-up and lazy imports are not part of the timing
+    mock_request(port, "/reset", "POST")
+    lab.get_telemetry().reset()
+    scheduler_before = lab.get_request_scheduler().stats()
+
+    def user_session(user: int):
+        samples = []
+        for iteration in range(iterations):
+            start = time.perf_counter()
+            try:
+                ok = run_flow(lab, f"[{flow} user {user} run {iteration} of {users}]")
+            except Exception:
+                ok = False
+            samples.append(((time.perf_counter() - start) * 1000, ok))
+        return samples
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=users) as executor:
+        samples = [s for user_samples in executor.map(user_session, range(users)) for s in user_samples]
+    wall = time.perf_counter() - start
+
+    latencies = [ms for ms, ok in samples if ok]
+    scheduler_after = lab.get_request_scheduler().stats()
+    server = mock_request(port, "/stats")
+    return {
+        "flow": flow,
+        "users": users,
+        "iterations": iterations,
+        "runs": len(samples),
+        "errors": sum(not ok for _, ok in samples),
+        "wall_seconds": round(wall, 3),
+        "flows_per_minute": round(len(samples) / wall * 60, 2),
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "max": round(max(latencies), 2) if latencies else None,
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        },
+        "requests": server.get("requests", 0),
+        "prompt_tokens": server.get("prompt_tokens", 0),
+        "completion_tokens": server.get("completion_tokens", 0),
+        "injected_429": server.get("injected_429", 0),
+        "injected_timeouts": server.get("injected_timeouts", 0),
+        "retries": scheduler_after["retries"] - scheduler_before["retries"],
+        "agents": lab.get_telemetry().summary(),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results, baseline_path: Path):
+    baseline = {(r["flow"], r["users"]): r for r in json.loads(baseline_path.read_text())["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'flow':<6} {'users':>5} {'p50 before':>11} {'p50 after':>10} {'change':>8} {'p95 before':>11} {'p95 after':>10} {'change':>8}")
+    for row in results:
+        before = baseline.get((row["flow"], row["users"]))
+        if not before:
+            continue
+        cells = []
+        for key in ("p50", "p95"):
+            old, new = before["latency_ms"][key], row["latency_ms"][key]
+            change = f"{(new - old) / old * 100:+.1f}%" if old and new else "n/a"
+            cells.append(f"{old or 0:>11.0f} {new or 0:>10.0f} {change:>8}")
+        print(f"{row['flow']:<6} {row['users']:>5} {' '.join(cells)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flows", nargs="+", choices=FLOWS, default=FLOWS)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--iterations", type=int, default=2)
+    for field, default in MockConfig._field_defaults.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    parser.add_argument("--with-cache", action="store_true", help="Leave the completion cache on.")
+    parser.add_argument("--output", type=Path, default=REPO_ROOT / "benchmarks" / "results" / "latest.json")
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier result file to compare against.")
+    args = parser.parse_args()
+    config = MockConfig(**{field: getattr(args, field) for field in MockConfig._fields})
+
+    process, port = start_mock_server(config)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / ".streamlit").mkdir()
+            (Path(tmp) / ".streamlit" / "secrets.toml").write_text(SECRETS_TEMPLATE.format(port=port))
+            os.chdir(tmp)  # lab reads secrets and keeps its caches relative to the working directory
+            import lab
+
+            if not args.with_cache:
+                lab.CACHE_BYPASS_TEMPERATURE = 0.0
+
+            print(f"{'flow':<6} {'users':>5} {'runs':>5} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'flows/min':>10} {'requests':>9} {'retries':>8}")
+            results = []
+            for flow in args.flows:
+                for users in args.users:
+                    row = run_level(lab, port, flow, users, args.iterations)
+                    results.append(row)
+                    latency = row["latency_ms"]
+                    print(f"{flow:<6} {users:>5} {row['runs']:>5} {row['errors']:>6} {latency['p50'] or 0:>9.0f} "
+                          f"{latency['p95'] or 0:>9.0f} {row['flows_per_minute']:>10.1f} {row['requests']:>9} {row['retries']:>8}",
+                          flush=True)
+            os.chdir(REPO_ROOT)
+    finally:
+        process.terminate()
+        process.wait()
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps({
+        "config": dict(config._asdict(), flows=args.flows, users=args.users, iterations=args.iterations,
+                       with_cache=args.with_cache),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "commit": git_commit()},
+        "results": results,
+    }, indent=2))
+    print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
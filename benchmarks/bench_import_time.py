@@ -0,0 +1,96 @@
+"""
+Cold-start cost of `import lab`.
+
+Imports `lab` in fresh interpreters with `python -X importtime`, reports the
+median wall time and the slowest modules, and checks that none of the heavy
+dependencies that `lab` only needs on first use (openai, pandas, py3Dmol, ...)
+are pulled in at import time. Exits with status 1 if the median exceeds the
+budget or a heavy module is imported, so it can be used as a CI gate.
+
+Usage:
+    python benchmarks/bench_import_time.py [--runs 5] [--budget-ms 1500] [--top 15]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Top-level packages that must not be imported by `import lab`.
+HEAVY_MODULES = [
+    "openai", "pandas", "numpy", "requests", "py3Dmol",
+    "rdkit", "datamol", "matplotlib", "seaborn", "PIL", "pyarrow", "scipy",
+]
+
+# lab.py reads DEPLOYMENT_NAME from st.secrets at import time, so each import
+# runs against this harmless secrets file instead of the real one.
+DUMMY_SECRETS = """\
+AZURE_ENDPOINT = "http://127.0.0.1:9"
+AZURE_API_KEY = "benchmark"
+API_VERSION = "2024-02-01"
+DEPLOYMENT_NAME = "benchmark"
+"""
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def import_once(workdir: Path):
+    """Imports lab in a fresh interpreter. Returns (wall ms, {module: cumulative us})."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(REPO_ROOT), os.environ.get("PYTHONPATH", "")]))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import lab"],
+        cwd=workdir, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        sys.exit(f"`import lab` failed:\n{proc.stderr[-2000:]}")
+
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return wall_ms, cumulative
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        (workdir / ".streamlit").mkdir()
+        (workdir / ".streamlit" / "secrets.toml").write_text(DUMMY_SECRETS)
+        import_once(workdir)  # warm the bytecode cache; only the interpreter should be cold
+        runs = [import_once(workdir) for _ in range(args.runs)]
+
+    wall = statistics.median(ms for ms, _ in runs)
+    cumulative = runs[-1][1]
+    print(f"import lab: median {wall:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"\n{'module':<48} {'cumulative (ms)':>16}")
+    for module, us in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{module:<48} {us / 1000:>16.1f}")
+
+    heavy = sorted({m.split(".")[0] for m in cumulative} & set(HEAVY_MODULES))
+    failed = False
+    if heavy:
+        print(f"\nFAIL: heavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if wall > args.budget_ms:
+        print(f"\nFAIL: median import time {wall:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print("\nOK")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+A local stand-in for the Azure OpenAI chat completions API.
+
+Serves POST /openai/deployments/<name>/chat/completions (blocking and
+streaming) with simulated latency (time to first token plus a per-token
+delay). Responses are shaped like what each `lab` agent expects:
+- the report outline
+- the nanobody designer's candidates
+- mutation positions
+- UniProt IDs
+- the global editor pass
+- the supervisor's agent name
+- cited markdown for everything else
+
+429s (with Retry-After) and hung connections can be injected at a given rate.
+Each response and injected failure is derived from a hash of the request and
+the seed, so runs with the same settings see the same responses and failures
+regardless of request order. GET /stats returns request counters and
+POST /reset clears them.
+
+Usage:
+    python benchmarks/mock_openai_server.py [--port 8089] [--first-token-ms 150] [--per-token-ms 2]
+        [--completion-tokens 300] [--rate-429 0.0] [--rate-timeout 0.0] [--seed 0]
+
+Point the app at it with AZURE_ENDPOINT = "http://127.0.0.1:<port>" in secrets.toml.
+"""
+import argparse
+import hashlib
+import http.server
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple
+
+AGENT_NAMES = ["Bioinformatics", "Pharmacokinetics", "Pharmacodynamics", "Clinical Trials", "Toxicology", "Regulatory Affairs"]
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+WORDS = (
+    "protein binding pathway expression receptor signaling cohort inhibitor microbiome inflammation neuronal "
+    "assay kinase mutation variant clinical efficacy toxicity metabolite sequencing antibody structure affinity "
+    "trial dose response mechanism biomarker model analysis cell tissue regulation"
+).split()
+
+class MockConfig(NamedTuple):
+    first_token_ms: float = 150.0
+    per_token_ms: float = 2.0
+    completion_tokens: int = 300
+    rate_429: float = 0.0
+    retry_after: float = 1.0
+    rate_timeout: float = 0.0
+    hang_seconds: float = 5.0
+    seed: int = 0
+
+def _rng(config: MockConfig, *parts: Any) -> random.Random:
+    digest = hashlib.sha256(json.dumps([config.seed, *parts], sort_keys=True, default=str).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+def _sentences(rng: random.Random, n_tokens: int, cite: bool = True) -> str:
+    words = []
+    while len(words) < n_tokens:
+        sentence = [rng.choice(WORDS) for _ in range(rng.randint(8, 16))]
+        if cite and rng.random() < 0.4:
+            year = rng.randint(2020, 2025)
+            sentence.append(f"[Smith et al., {year}](https://doi.org/10.1000/mock.{rng.randint(1, 60)})")
+        words.extend(sentence)
+        words[-1] += "."
+    return " ".join(words[:n_tokens]).capitalize()
+
+def _candidates(rng: random.Random, prompt: str) -> Dict[str, Any]:
+    match = re.search(r"sequence: '([A-Z]+)'", prompt)
+    wildtype = match.group(1) if match else "QVQLVESGGGLVQAGGSLRLSCAASGRTFSSYAMGWFRQAPGKEREFVAAISWSGGSTYYADSVKGRFTISRDNAKNTVYLQMNSLKPEDTAVYYCAA"
+    candidates = []
+    for _ in range(8):
+        sequence = list(wildtype)
+        for position in rng.sample(range(len(sequence)), 3):
+            sequence[position] = rng.choice(AMINO_ACIDS)
+        candidates.append("".join(sequence))
+    return {"candidates": candidates}
+
+def build_content(config: MockConfig, messages: List[Dict[str, str]], json_mode: bool, max_tokens: int) -> str:
+    """Returns the completion text for a request, shaped by which agent sent it."""
+    prompt = "\n".join(message.get("content") or "" for message in messages)
+    rng = _rng(config, prompt)
+    n_tokens = min(max_tokens, config.completion_tokens)
+    if json_mode:
+        if "Create a detailed outline" in prompt:
+            sections = ["Introduction", "Literature Review", "Methods", "Results", "Discussion", "Conclusion"]
+            subsections = {s: [f"{s} {rng.choice(WORDS)} {i}" for i in range(1, 3)] for s in sections}
+            descriptions = {s: {sub: _sentences(rng, 12, cite=False) for sub in subs} for s, subs in subsections.items()}
+            return json.dumps({"sections": sections, "subsections": subsections, "descriptions": descriptions})
+        if "`candidates`" in prompt:
+            return json.dumps(_candidates(rng, prompt))
+        if "`positions`" in prompt:
+            return json.dumps({"positions": sorted(rng.sample(range(26, 115), 6))})
+        if "`proteins`" in prompt:
+            return json.dumps({"proteins": rng.sample(["P05067", "P10636", "P37840", "P04637", "P00533", "Q9Y6K9"], 3)})
+        if "`transitions`" in prompt:
+            return json.dumps({"transitions": {}, "conclusion": ""})
+        return json.dumps({"result": _sentences(rng, 40)})
+    if "respond with ONLY the name" in prompt:
+        return rng.choice(AGENT_NAMES)
+    if "Conduct comprehensive interdisciplinary research" in prompt:
+        return "\n\n".join(f"### {heading}\n\n{_sentences(rng, n_tokens // 3)}" for heading in ("Background", "Findings", "Methods"))
+    return _sentences(rng, n_tokens)
+
+class MockOpenAIServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: MockConfig) -> None:
+        super().__init__(address, MockHandler)
+        self.config = config
+        self.lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+        self.seen: Dict[str, int] = {}  # request hash -> times seen, so a retry can succeed
+
+    def count(self, key: str, amount: int = 1) -> None:
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+class MockHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockOpenAIServer
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/stats"):
+            with self.server.lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/reset"):
+            with self.server.lock:
+                self.server.stats.clear()
+                self.server.seen.clear()
+            self._send_json(200, {})
+            return
+        if "/chat/completions" not in self.path:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        config = self.server.config
+        request = json.loads(body or b"{}")
+        request_hash = hashlib.sha256(body).hexdigest()
+        with self.server.lock:
+            attempt = self.server.seen.get(request_hash, 0)
+            self.server.seen[request_hash] = attempt + 1
+        self.server.count("requests")
+        fault = _rng(config, request_hash, attempt, "fault").random()
+
+        if fault < config.rate_429:
+            self.server.count("injected_429")
+            self._send_json(429, {"error": {"code": "429", "message": "Rate limit is exceeded. Try again later."}},
+                            {"Retry-After": f"{config.retry_after:g}"})
+            return
+        if fault < config.rate_429 + config.rate_timeout:
+            self.server.count("injected_timeouts")
+            time.sleep(config.hang_seconds)
+            self.close_connection = True
+            return
+
+        messages = request.get("messages", [])
+        json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+        content = build_content(config, messages, json_mode, int(request.get("max_tokens") or 1000))
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        completion_tokens = max(1, len(content) // 4)
+        self.server.count("prompt_tokens", prompt_tokens)
+        self.server.count("completion_tokens", completion_tokens)
+
+        time.sleep(config.first_token_ms / 1000)
+        if request.get("stream"):
+            self._stream(request, content)
+            return
+        time.sleep(completion_tokens * config.per_token_ms / 1000)
+        self._send_json(200, {
+            "id": f"chatcmpl-{request_hash[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _stream(self, request: Dict[str, Any], content: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data: str) -> None:
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        pieces = re.findall(r"\S+\s*", content) or [content]
+        for i in range(0, len(pieces), 8):
+            chunk = "".join(pieces[i:i + 8])
+            send_event(json.dumps({
+                "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}],
+            }))
+            time.sleep(max(1, len(chunk) // 4) * self.server.config.per_token_ms / 1000)
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+def start_server(port: int = 0, config: MockConfig = MockConfig()) -> MockOpenAIServer:
+    """Starts the mock server on a daemon thread and returns it (`server.server_address[1]` is the port)."""
+    server = MockOpenAIServer(("127.0.0.1", port), config)
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089, help="0 picks a free port (printed on startup).")
+    for field, default in MockConfig._field_defaults.items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+    config = MockConfig(**{field: getattr(args, field) for field in MockConfig._fields})
+    server = MockOpenAIServer(("127.0.0.1", args.port), config)
+    print(f"Mock Azure OpenAI server listening on http://127.0.0.1:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import heapq
+import itertools
+import re
+from math import comb
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------------------------------
+# --- LOCAL, VECTORIZED BIOPHYSICS SCORING FOR NANOBODY VARIANTS ---
+# --------------------------------------------------------------------------
+# Sequences are encoded into a (n_sequences, length) integer matrix and every
+# metric is computed for the whole batch with NumPy array operations. The
+# scores are deterministic, interpretable proxies (substitution-matrix
+# log-odds, hydrophobicity, charge and CDR composition relative to the
+# wildtype); they rank candidates quickly but are not physics-based predictions.
+
+AMINO_ACIDS = "ARNDCQEGHILKMFPSTWYV"
+GAP_INDEX = len(AMINO_ACIDS)  # padding and unknown residues
+
+# BLOSUM62 in AMINO_ACIDS order (half-bit log-odds).
+_BLOSUM62_ROWS = [
+    [4, -1, -2, -2, 0, -1, -1, 0, -2, -1, -1, -1, -1, -2, -1, 1, 0, -3, -2, 0],
+    [-1, 5, 0, -2, -3, 1, 0, -2, 0, -3, -2, 2, -1, -3, -2, -1, -1, -3, -2, -3],
+    [-2, 0, 6, 1, -3, 0, 0, 0, 1, -3, -3, 0, -2, -3, -2, 1, 0, -4, -2, -3],
+    [-2, -2, 1, 6, -3, 0, 2, -1, -1, -3, -4, -1, -3, -3, -1, 0, -1, -4, -3, -3],
+    [0, -3, -3, -3, 9, -3, -4, -3, -3, -1, -1, -3, -1, -2, -3, -1, -1, -2, -2, -1],
+    [-1, 1, 0, 0, -3, 5, 2, -2, 0, -3, -2, 1, 0, -3, -1, 0, -1, -2, -1, -2],
+    [-1, 0, 0, 2, -4, 2, 5, -2, 0, -3, -3, 1, -2, -3, -1, 0, -1, -3, -2, -2],
+    [0, -2, 0, -1, -3, -2, -2, 6, -2, -4, -4, -2, -3, -3, -2, 0, -2, -2, -3, -3],
+    [-2, 0, 1, -1, -3, 0, 0, -2, 8, -3, -3, -1, -2, -1, -2, -1, -2, -2, 2, -3],
+    [-1, -3, -3, -3, -1, -3, -3, -4, -3, 4, 2, -3, 1, 0, -3, -2, -1, -3, -1, 3],
+    [-1, -2, -3, -4, -1, -2, -3, -4, -3, 2, 4, -2, 2, 0, -3, -2, -1, -2, -1, 1],
+    [-1, 2, 0, -1, -3, 1, 1, -2, -1, -3, -2, 5, -1, -3, -1, 0, -1, -3, -2, -2],
+    [-1, -1, -2, -3, -1, 0, -2, -3, -2, 1, 2, -1, 5, 0, -2, -1, -1, -1, -1, 1],
+    [-2, -3, -3, -3, -2, -3, -3, -3, -1, 0, 0, -3, 0, 6, -4, -2, -2, 1, 3, -1],
+    [-1, -2, -2, -1, -3, -1, -1, -2, -2, -3, -3, -1, -2, -4, 7, -1, -1, -4, -3, -2],
+    [1, -1, 1, 0, -1, 0, 0, 0, -1, -2, -2, 0, -1, -2, -1, 4, 1, -3, -2, -2],
+    [0, -1, 0, -1, -1, -1, -1, -2, -2, -1, -1, -1, -1, -2, -1, 1, 5, -2, -2, 0],
+    [-3, -3, -4, -4, -2, -2, -3, -2, -2, -3, -2, -3, -1, 1, -4, -3, -2, 11, 2, -3],
+    [-2, -2, -2, -3, -2, -1, -2, -3, 2, -1, -1, -2, -1, 3, -3, -2, -2, 2, 7, -1],
+    [0, -3, -3, -3, -1, -2, -2, -3, -3, 3, 1, -2, 1, -1, -2, -2, 0, -3, -1, 4],
+]
+GAP_SCORE = -4
+
+BLOSUM62 = np.full((GAP_INDEX + 1, GAP_INDEX + 1), GAP_SCORE, dtype=np.float32)
+BLOSUM62[:GAP_INDEX, :GAP_INDEX] = _BLOSUM62_ROWS
+BLOSUM62[GAP_INDEX, GAP_INDEX] = 0
+
+# Kyte-Doolittle hydropathy and side-chain charge at pH 7.4 (gap = 0).
+KYTE_DOOLITTLE = np.array(
+    [1.8, -4.5, -3.5, -3.5, 2.5, -3.5, -3.5, -0.4, -3.2, 4.5, 3.8, -3.9, 1.9, 2.8, -1.6, -0.8, -0.7, -0.9, -1.3, 4.2, 0.0],
+    dtype=np.float32,
+)
+CHARGE = np.zeros(GAP_INDEX + 1, dtype=np.float32)
+CHARGE[[AMINO_ACIDS.index("K"), AMINO_ACIDS.index("R")]] = 1.0
+CHARGE[[AMINO_ACIDS.index("D"), AMINO_ACIDS.index("E")]] = -1.0
+CHARGE[AMINO_ACIDS.index("H")] = 0.1
+AROMATIC = np.zeros(GAP_INDEX + 1, dtype=np.float32)
+AROMATIC[[AMINO_ACIDS.index(aa) for aa in "FWY"]] = 1.0
+
+# Byte -> residue index lookup used by `encode_sequences`.
+_ENCODING = np.full(256, GAP_INDEX, dtype=np.uint8)
+for _index, _aa in enumerate(AMINO_ACIDS):
+    _ENCODING[ord(_aa)] = _index
+    _ENCODING[ord(_aa.lower())] = _index
+
+# Weights of the heuristic proxies. Wildtype anchors are the values a
+# nanobody with no mutations gets.
+WILDTYPE_PLDDT = 90.0
+WILDTYPE_DG = -27.5
+_LOG_ODDS_SCALE = np.log(2) / 2  # BLOSUM half-bits -> natural log units
+
+def encode_sequences(sequences: Sequence[str], length: int = None) -> np.ndarray:
+    """
+    Encodes sequences into a (n, length) uint8 matrix of residue indices.
+    Shorter sequences are padded with `GAP_INDEX`; longer ones are truncated.
+    """
+    if length is None:
+        length = max((len(seq) for seq in sequences), default=0)
+    buffer = b"".join(seq.encode("ascii", "replace")[:length].ljust(length, b"-") for seq in sequences)
+    codes = np.frombuffer(buffer, dtype=np.uint8).reshape(len(sequences), length)
+    return _ENCODING[codes]
+
+def find_cdr_regions(wildtype: str) -> Dict[str, slice]:
+    """
+    Locates CDR1-3 of a VHH from its conserved framework anchors (the two
+    cysteines, the W-x-R-Q motif and the W-G-x-G motif), using IMGT-like
+    boundaries. Regions that cannot be found are omitted.
+    """
+    regions: Dict[str, slice] = {}
+    first_cys = wildtype.find("C")
+    wxrq = re.search(r"W.RQ", wildtype[first_cys + 1:]) if first_cys >= 0 else None
+    if wxrq:
+        w = first_cys + 1 + wxrq.start()
+        regions["CDR1"] = slice(first_cys + 4, w - 2)
+        regions["CDR2"] = slice(w + 15, min(w + 23, len(wildtype)))
+        second_cys = wildtype.find("C", w)
+        if second_cys >= 0:
+            wgxg = re.search(r"WG.G", wildtype[second_cys:])
+            if wgxg:
+                regions["CDR3"] = slice(second_cys + 1, second_cys + wgxg.start())
+    return {name: region for name, region in regions.items() if region.stop > region.start}
+
+def _cdr_mask(wildtype: str, length: int) -> np.ndarray:
+    mask = np.zeros(length, dtype=bool)
+    for region in find_cdr_regions(wildtype).values():
+        mask[region] = True
+    return mask
+
+def _rounded(values: np.ndarray, decimals: int) -> np.ndarray:
+    # Metrics are computed in float32 for speed and reported as float64.
+    return np.round(np.asarray(values, dtype=np.float64), decimals)
+
+def _score_encoded(seqs: np.ndarray, wt: np.ndarray, cdr_mask: np.ndarray) -> Dict[str, np.ndarray]:
+    """Computes every metric for an encoded (n, length) batch against an encoded wildtype."""
+    mutated = seqs != wt
+    substitution = BLOSUM62[wt, seqs] - BLOSUM62[wt, wt]
+    esm_llr = substitution.sum(axis=1) * _LOG_ODDS_SCALE
+
+    hydro = KYTE_DOOLITTLE[seqs]
+    charge = CHARGE[seqs]
+    residues = np.maximum((seqs != GAP_INDEX).sum(axis=1), 1)
+    cdr_delta_hydro = (hydro - KYTE_DOOLITTLE[wt])[:, cdr_mask].sum(axis=1)
+    cdr_delta_charge = (charge - CHARGE[wt])[:, cdr_mask].sum(axis=1)
+    cdr_delta_aromatic = (AROMATIC[seqs] - AROMATIC[wt])[:, cdr_mask].sum(axis=1)
+
+    framework_mutations = (mutated & ~cdr_mask).sum(axis=1)
+    cdr_mutations = (mutated & cdr_mask).sum(axis=1)
+    # Framework changes (and destabilizing substitutions) lower structural
+    # confidence more than CDR changes do.
+    plddt = WILDTYPE_PLDDT - 1.5 * framework_mutations - 0.5 * cdr_mutations + 0.25 * np.minimum(substitution, 0).sum(axis=1)
+    # Aromatic and hydrophobic gains in the CDRs favour binding; large charge
+    # swings at the paratope are penalized.
+    dG = WILDTYPE_DG - 0.8 * cdr_delta_aromatic - 0.15 * cdr_delta_hydro + 0.3 * np.abs(cdr_delta_charge)
+
+    return {
+        "esm_llr": _rounded(esm_llr, 3),
+        "plddt": _rounded(np.clip(plddt, 0, 100), 2),
+        "dG_separated": _rounded(dG, 3),
+        "n_mutations": mutated.sum(axis=1),
+        "cdr_mutations": cdr_mutations,
+        "hydrophobicity": _rounded(hydro.sum(axis=1) / residues, 3),
+        "net_charge": _rounded(charge.sum(axis=1), 2),
+        "cdr_delta_hydrophobicity": _rounded(cdr_delta_hydro, 3),
+        "cdr_delta_charge": _rounded(cdr_delta_charge, 2),
+    }
+
+def score_sequences(sequences: Sequence[str], wildtype: str) -> pd.DataFrame:
+    """
+    Scores every sequence against `wildtype` in one vectorized batch.
+
+    Returns one row per sequence with the proxy metrics used by the designer
+    (`esm_llr`, `plddt`, `dG_separated`; see the module comment) and the
+    descriptors they are derived from: mutation counts, hydrophobicity,
+    net charge and per-CDR deltas relative to the wildtype.
+    """
+    sequences = [seq.strip().upper() for seq in sequences]
+    length = max([len(wildtype)] + [len(seq) for seq in sequences])
+    wt = encode_sequences([wildtype], length)[0]
+    seqs = encode_sequences(sequences, length)
+
+    scores = pd.DataFrame({"sequence": sequences, **_score_encoded(seqs, wt, _cdr_mask(wildtype, length))})
+    mutated = seqs != wt
+    for name, region in find_cdr_regions(wildtype).items():
+        scores[f"{name.lower()}_mutations"] = mutated[:, region].sum(axis=1)
+    return scores
+
+# --------------------------------------------------------------------------
+# --- IN-SILICO MUTAGENESIS ---
+# --------------------------------------------------------------------------
+# Variants are enumerated lazily as (positions, residues) index arrays, applied
+# to a tiled copy of the encoded wildtype and scored in fixed-size batches.
+# Only a bounded top-k heap survives between batches, so memory stays flat
+# however many variants a deep mutational scan visits.
+
+# Weights of the combined objective used to rank variants (higher is better).
+DEFAULT_OBJECTIVE_WEIGHTS = {"esm_llr": 1.0, "plddt": 0.1, "dG_separated": -1.0}
+
+def count_variants(n_positions: int, max_order: int, alphabet_size: int = len(AMINO_ACIDS) - 1) -> int:
+    """Number of variants with 1..max_order substitutions at `n_positions` sites."""
+    return sum(comb(n_positions, order) * alphabet_size ** order for order in range(1, max_order + 1))
+
+def _variant_batches(wt: np.ndarray, positions: Sequence[int], alphabet: np.ndarray, max_order: int,
+                     batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yields (position_index, residue_index) arrays of shape (batch, order), one order at a time."""
+    for order in range(1, max_order + 1):
+        pos_chunks, aa_chunks, buffered = [], [], 0
+        for combo in itertools.combinations(positions, order):
+            # Every non-wildtype residue at each chosen position.
+            choices = [alphabet[alphabet != wt[p]] for p in combo]
+            grids = np.meshgrid(*choices, indexing="ij")
+            aa_idx = np.stack([grid.ravel() for grid in grids], axis=1)
+            pos_chunks.append(np.broadcast_to(np.array(combo), aa_idx.shape))
+            aa_chunks.append(aa_idx)
+            buffered += len(aa_idx)
+            if buffered >= batch_size:
+                yield np.concatenate(pos_chunks), np.concatenate(aa_chunks)
+                pos_chunks, aa_chunks, buffered = [], [], 0
+        if buffered:
+            yield np.concatenate(pos_chunks), np.concatenate(aa_chunks)
+
+def mutational_scan(wildtype: str, positions: Sequence[int] = None, alphabet: str = AMINO_ACIDS, max_order: int = 2,
+                    top_k: int = 50, batch_size: int = 50_000, weights: Dict[str, float] = None) -> pd.DataFrame:
+    """
+    Enumerates all single up to `max_order`-fold substitutions at `positions`
+    (0-based; defaults to every CDR position) and returns the `top_k` variants
+    ranked by the weighted `objective`.
+
+    The returned frame has the `score_sequences` metrics plus `mutations`
+    (e.g. "S31Y,A33W", 1-based) and `objective`; `attrs["variants_scored"]`
+    records how many variants were evaluated. Ties on `objective` go to the
+    variant enumerated first (fewer substitutions, then earlier positions and
+    residues in `AMINO_ACIDS` order), so the result is the head of a stable sort.
+    """
+    weights = weights or DEFAULT_OBJECTIVE_WEIGHTS
+    length = len(wildtype)
+    wt = encode_sequences([wildtype], length)[0]
+    cdr_mask = _cdr_mask(wildtype, length)
+    if positions is None:
+        positions = np.flatnonzero(cdr_mask).tolist()
+    positions = sorted({p for p in positions if 0 <= p < length})
+    alphabet_idx = np.unique(encode_sequences([alphabet])[0])
+    alphabet_idx = alphabet_idx[alphabet_idx != GAP_INDEX]
+
+    heap: List[Tuple[float, int, Tuple[int, ...], Tuple[int, ...]]] = []   # (objective, -enumeration index, ...)
+    scored = 0
+    for pos_idx, aa_idx in _variant_batches(wt, positions, alphabet_idx, max_order, batch_size):
+        variants = np.tile(wt, (len(pos_idx), 1))
+        variants[np.arange(len(pos_idx))[:, None], pos_idx] = aa_idx
+        metrics = _score_encoded(variants, wt, cdr_mask)
+        objective = sum(weight * metrics[name] for name, weight in weights.items())
+
+        # Only the batch's own top-k can enter the global top-k. argpartition
+        # picks arbitrarily among values tied with the k-th, so take all of them
+        # and keep the earliest.
+        keep = np.arange(len(objective))
+        if len(objective) > top_k:
+            threshold = np.partition(objective, len(objective) - top_k)[len(objective) - top_k]
+            keep = np.flatnonzero(objective >= threshold)
+            if len(keep) > top_k:
+                keep = keep[np.lexsort((keep, -objective[keep]))[:top_k]]
+        for row in keep:
+            # The heap's smallest entry is the worst: lowest objective, then latest enumerated.
+            entry = (float(objective[row]), -(scored + int(row)), tuple(pos_idx[row].tolist()), tuple(aa_idx[row].tolist()))
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        scored += len(pos_idx)
+
+    winners = sorted(heap, reverse=True)
+    sequences, mutations = [], []
+    for _, _, pos, aas in winners:
+        residues = list(wildtype)
+        labels = []
+        for p, a in zip(pos, aas):
+            residues[p] = AMINO_ACIDS[a]
+            labels.append(f"{wildtype[p]}{p + 1}{AMINO_ACIDS[a]}")
+        sequences.append("".join(residues))
+        mutations.append(",".join(labels))
+
+    results = score_sequences(sequences, wildtype)
+    results.insert(1, "mutations", mutations)
+    results["objective"] = np.round([entry[0] for entry in winners], 3)
+    results.attrs["variants_scored"] = scored
+    return results
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# --------------------------------------------------------------------------
+# --- PERSISTENT CACHE FOR AZURE OPENAI CHAT COMPLETIONS ---
+# --------------------------------------------------------------------------
+# Completions are stored in a single SQLite file keyed by a SHA-256 hash of
+# everything that determines the model output (deployment, messages,
+# temperature, max_tokens and response_format). Entries expire after a
+# per-call TTL and the least recently used ones are evicted once the cache
+# grows past `max_bytes`.
+
+class CompletionCache:
+    """A size-bounded, TTL-aware, on-disk LRU cache for chat completion text."""
+
+    def __init__(self, path: Path, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY,"
+                " agent TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " expires REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_last_access ON completions (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(deployment: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int,
+                 response_format: Optional[Dict[str, Any]] = None) -> str:
+        """Returns the content hash identifying a chat completion request."""
+        payload = json.dumps(
+            {
+                "deployment": deployment,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "response_format": response_format,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, agent: str = "default") -> Optional[str]:
+        """Returns the cached completion for `key`, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, expires FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._misses[agent] = self._misses.get(agent, 0) + 1
+                return None
+            conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+            self._hits[agent] = self._hits.get(agent, 0) + 1
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float, agent: str = "default") -> None:
+        """Stores a completion for `ttl` seconds and evicts old entries if the cache is over its size bound."""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, agent, value, size, created, expires, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, agent, value, size, now, now + ttl, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM completions WHERE expires < ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM completions ORDER BY last_access ASC").fetchall():
+            conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self) -> None:
+        """Removes every cached completion and resets the counters."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM completions")
+            self._hits.clear()
+            self._misses.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters (overall and per agent) and the current cache size."""
+        with self._lock, self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+            agents = sorted(set(self._hits) | set(self._misses))
+            return {
+                "hits": sum(self._hits.values()),
+                "misses": sum(self._misses.values()),
+                "entries": entries,
+                "bytes": size,
+                "per_agent": {
+                    agent: {"hits": self._hits.get(agent, 0), "misses": self._misses.get(agent, 0)}
+                    for agent in agents
+                },
+            }
@@ -0,0 +1,427 @@
+import io
+import math
+import tempfile
+from pathlib import Path
+from statistics import NormalDist
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Tuple
+
+import numpy as np
+
+try:
+    from scipy import stats as scipy_stats
+except ImportError:  # scipy is optional; the approximations below are used without it
+    scipy_stats = None
+
+# --------------------------------------------------------------------------
+# --- CORRELATION PLOTS FOR LARGE DATASETS ---
+# --------------------------------------------------------------------------
+# seaborn's regplot draws one marker per row and bootstraps its confidence band
+# (1000 refits of the full data), which takes minutes on a few hundred thousand
+# rows. Here the least-squares fit and its confidence band come from one pass of
+# sums over the data, using the textbook closed form for the standard error of
+# the mean prediction. Up to SCATTER_MAX_POINTS rows are drawn as a scatter;
+# larger datasets are drawn as a hexbin density with a log colour scale, which
+# costs the same whether there are 10^5 or 10^7 points.
+
+SCATTER_MAX_POINTS = 5_000
+HEXBIN_GRID_SIZE = 80
+CONFIDENCE_LEVEL = 0.95
+_BAND_POINTS = 100
+
+def t_critical(confidence: float, dof: int) -> float:
+    """Two-sided Student t critical value (Cornish-Fisher expansion when scipy isn't installed)."""
+    if scipy_stats is not None:
+        return float(scipy_stats.t.ppf(0.5 + confidence / 2, dof))
+    if dof <= 0:
+        return math.inf
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    return z + (z ** 3 + z) / (4 * dof) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+
+class LinearFit(NamedTuple):
+    n: int
+    slope: float
+    intercept: float
+    r: float
+    x_mean: float
+    sxx: float                  # sum of squared deviations of x
+    residual_std: float         # standard error of the regression
+
+    def band(self, x: np.ndarray, confidence: float = CONFIDENCE_LEVEL) -> tuple:
+        """The fitted line and the lower/upper confidence limits of the mean response at `x`."""
+        fitted = self.intercept + self.slope * x
+        half_width = (t_critical(confidence, self.n - 2) * self.residual_std
+                      * np.sqrt(1 / self.n + (x - self.x_mean) ** 2 / self.sxx))
+        return fitted, fitted - half_width, fitted + half_width
+
+def finite_pairs(x: Any, y: Any) -> tuple:
+    """Both columns as float64 arrays, keeping only rows where both values are finite."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.isfinite(x) & np.isfinite(y)
+    return x[keep], y[keep]
+
+def linear_fit(x: np.ndarray, y: np.ndarray) -> LinearFit:
+    """Ordinary least squares of y on x. Needs at least three points and some spread in x."""
+    n = len(x)
+    if n < 3:
+        raise ValueError("At least three rows with values in both columns are needed for a fit.")
+    x_mean, y_mean = x.mean(), y.mean()
+    dx, dy = x - x_mean, y - y_mean
+    sxx, syy, sxy = float(dx @ dx), float(dy @ dy), float(dx @ dy)
+    if sxx == 0:
+        raise ValueError("The X column has the same value in every row.")
+    slope = sxy / sxx
+    r = sxy / math.sqrt(sxx * syy) if syy > 0 else 0.0
+    residual_ss = max(syy - slope * sxy, 0.0)
+    return LinearFit(n, slope, float(y_mean - slope * x_mean), r, float(x_mean), sxx, math.sqrt(residual_ss / (n - 2)))
+
+def correlation_plot_png(x: Any, y: Any, x_label: str, y_label: str, max_scatter_points: int = SCATTER_MAX_POINTS,
+                         dpi: int = 100) -> Dict[str, Any]:
+    """
+    Renders y against x with the least-squares line and its confidence band.
+    Returns {"png": bytes, "mode": "scatter" | "hexbin", "n", "slope", "intercept", "r"}.
+    Raises ValueError if the data can't be fitted.
+    """
+    from matplotlib.figure import Figure  # no pyplot: figures are rendered off-screen and safe to use from threads
+
+    x, y = finite_pairs(x, y)
+    fit = linear_fit(x, y)
+
+    fig = Figure(figsize=(6.4, 4.8))
+    ax = fig.subplots()
+    if fit.n <= max_scatter_points:
+        mode = "scatter"
+        ax.scatter(x, y, s=12, alpha=0.6, color="C0", linewidths=0)
+    else:
+        mode = "hexbin"
+        density = ax.hexbin(x, y, gridsize=HEXBIN_GRID_SIZE, bins="log", mincnt=1, cmap="viridis")
+        fig.colorbar(density, ax=ax, label="rows per bin")
+    grid = np.linspace(x.min(), x.max(), _BAND_POINTS)
+    fitted, lower, upper = fit.band(grid)
+    line_color = "C0" if mode == "scatter" else "C3"
+    ax.plot(grid, fitted, color=line_color, linewidth=2)
+    ax.fill_between(grid, lower, upper, color=line_color, alpha=0.2, linewidth=0)
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.set_title(f"r = {fit.r:.3f}, slope = {fit.slope:.3g}, n = {fit.n:,}")
+    fig.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    return {"png": buffer.getvalue(), "mode": mode, "n": fit.n, "slope": fit.slope, "intercept": fit.intercept, "r": fit.r}
+
+# --------------------------------------------------------------------------
+# --- ALL-PAIRS CORRELATION SCREENING ---
+# --------------------------------------------------------------------------
+# Pearson and Spearman correlations for every pair of numeric columns.
+# The data is read in row blocks, so tables taller than memory work too.
+# Each block updates the pairwise-complete sums (counts, sums, sums of
+# squares, cross products) with one p x p cross product. A pair only uses
+# rows where both of its columns have a value. The rows where one column is
+# missing are then taken back out, with extra products restricted to the
+# columns that have gaps in that block.
+#
+# Spearman is Pearson on ranks. Each column is ranked once, ignoring missing
+# values, and the ranks go through the same accumulation. Ranks are held in
+# memory when they fit in SCREEN_IN_MEMORY_BYTES, and spilled to a temporary
+# memory-mapped file otherwise. Where one column of a pair has values on rows
+# the other is missing, those column ranks aren't the pair's ranks, so the
+# pair is ranked again over its complete rows. The column ranks are read in
+# blocks of columns; each column is sorted once per block, and its ranks on any
+# pair follow from running counts of the pair's complete rows in that order.
+# Spearman is then exact and pairwise-complete like Pearson.
+#
+# p-values come from the t distribution with n - 2 degrees of freedom. Without
+# scipy, Fisher's z approximation is used instead. Both are corrected for
+# multiple testing with Benjamini-Hochberg.
+
+SCREEN_BLOCK_ROWS = 100_000
+SCREEN_IN_MEMORY_BYTES = 256 * 2**20
+SCREEN_RANK_CELLS = 4_000_000
+SCREEN_SPARSE_GAP_FRACTION = 0.05
+SCREEN_ALPHA = 0.05
+HEATMAP_MAX_LABELS = 60
+
+class _PairwiseMoments:
+    """Pairwise-complete sums for every column pair, accumulated block by block."""
+
+    def __init__(self, shift: np.ndarray) -> None:
+        p = len(shift)
+        self.shift = shift  # subtracting a rough column mean keeps the sums well conditioned
+        self.n = np.zeros((p, p))
+        self.sx = np.zeros((p, p))      # sx[i, j]: sum of column i over rows where j is also present
+        self.sxx = np.zeros((p, p))
+        self.sxy = np.zeros((p, p))
+
+    def add(self, block: np.ndarray) -> None:
+        values = block - self.shift
+        missing = ~np.isfinite(values)
+        gap_counts = missing.sum(axis=0)
+        gappy = np.flatnonzero(gap_counts)
+        if len(gappy):
+            values[missing] = 0.0
+        squares = values * values
+        # Start from all rows, without the ones where either column is missing...
+        self.n += len(values) - gap_counts[:, None] - gap_counts[None, :]
+        self.sx += values.sum(axis=0)[:, None]
+        self.sxx += squares.sum(axis=0)[:, None]
+        self.sxy += values.T @ values
+        if not len(gappy):
+            return
+        # ...then, for every column j with gaps, take its missing rows out of
+        # column i's sums (and add back the rows where both are missing).
+        # Columns with few gaps gather those rows directly; columns with many
+        # use matrix products.
+        few = gappy[gap_counts[gappy] <= SCREEN_SPARSE_GAP_FRACTION * len(values)]
+        many = gappy[gap_counts[gappy] > SCREEN_SPARSE_GAP_FRACTION * len(values)]
+        if len(few):
+            _, gap_rows = np.nonzero(missing[:, few].T)
+            for j, rows in zip(few, np.split(gap_rows, np.cumsum(gap_counts[few])[:-1])):
+                self.n[:, j] += missing[rows].sum(axis=0)
+                self.sx[:, j] -= values[rows].sum(axis=0)
+                self.sxx[:, j] -= squares[rows].sum(axis=0)
+        if len(many):
+            absent = missing[:, many].astype(np.float64)
+            self.n[:, many] += missing.T.astype(np.float64) @ absent
+            self.sx[:, many] -= values.T @ absent
+            self.sxx[:, many] -= squares.T @ absent
+
+    def correlation(self) -> tuple:
+        n, sx, sy, sxx, syy = self.n, self.sx, self.sx.T, self.sxx, self.sxx.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = (n * self.sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+        r[~np.isfinite(r) | (n < 3)] = np.nan
+        np.clip(r, -1.0, 1.0, out=r)
+        return r, n.astype(np.int64)
+
+def correlation_p_values(r: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """Two-sided p-values for correlations `r` measured on `n` rows (NaN where undefined)."""
+    r = np.asarray(r, dtype=np.float64)
+    n = np.asarray(n, dtype=np.float64)
+    p = np.full(r.shape, np.nan)
+    valid = np.isfinite(r) & (n > 3)
+    rv, nv = r[valid], n[valid]
+    if scipy_stats is not None:
+        with np.errstate(divide="ignore"):
+            t = rv * np.sqrt((nv - 2) / np.maximum(1 - rv * rv, 1e-300))
+        p[valid] = 2 * scipy_stats.t.sf(np.abs(t), nv - 2)
+    else:
+        z = np.abs(np.arctanh(np.clip(rv, -1 + 1e-15, 1 - 1e-15))) * np.sqrt(nv - 3)
+        p[valid] = np.frompyfunc(math.erfc, 1, 1)(z / math.sqrt(2)).astype(np.float64)
+    return p
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values (q-values); NaNs are ignored and stay NaN."""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    q = np.full(p_values.shape, np.nan)
+    valid = np.flatnonzero(np.isfinite(p_values))
+    if len(valid) == 0:
+        return q
+    order = valid[np.argsort(p_values[valid])]
+    scaled = p_values[order] * len(order) / np.arange(1, len(order) + 1)
+    q[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return q
+
+def average_ranks(values: np.ndarray) -> np.ndarray:
+    """Ranks every column of a 2-D array (1-based, ties get their average rank, NaN stays NaN)."""
+    missing = np.isnan(values)
+    # One contiguous row per column, with NaN as +inf: numpy's fast sort paths skip arrays with NaNs.
+    keys = np.ascontiguousarray(np.where(missing, np.inf, values).T)
+    order = np.argsort(keys, axis=1)
+    ordered = np.take_along_axis(keys, order, axis=1)
+    length = keys.shape[1]
+    position = np.arange(length)
+    starts_group = np.ones(ordered.shape, dtype=bool)
+    starts_group[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ends_group = np.ones(ordered.shape, dtype=bool)
+    ends_group[:, :-1] = starts_group[:, 1:]
+    first = np.maximum.accumulate(np.where(starts_group, position, 0), axis=1)
+    last = np.minimum.accumulate(np.where(ends_group, position, length - 1)[:, ::-1], axis=1)[:, ::-1]
+    ranks = np.empty(keys.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=1)
+    ranks = ranks.T
+    ranks[missing] = np.nan
+    return ranks
+
+def _rank_columns(read_columns: Callable[[List[str]], np.ndarray], columns: List[str], rows: int,
+                  spill_dir: str) -> np.ndarray:
+    # float64 keeps ranks and average ranks of ties exact up to 2^53 rows.
+    shape = (rows, len(columns))
+    if rows * len(columns) * 8 <= SCREEN_IN_MEMORY_BYTES:
+        ranks = np.empty(shape)
+    else:
+        ranks = np.memmap(Path(spill_dir) / "ranks.f64", dtype=np.float64, mode="w+", shape=shape)
+    # Rank a few columns at a time, so the sort's temporaries stay around SCREEN_RANK_CELLS cells.
+    step = max(1, SCREEN_RANK_CELLS // max(rows, 1))
+    for start in range(0, len(columns), step):
+        block = np.asarray(read_columns(columns[start:start + step]), dtype=np.float64)
+        ranks[:, start:start + step] = average_ranks(np.where(np.isfinite(block), block, np.nan))
+    return ranks
+
+def _tie_groups(ranks: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Sort order of one column of ranks (NaN last), its inverse, and the first and last sorted
+    # position of each value's ties.
+    order = np.argsort(ranks)
+    ordered = ranks[order]
+    position = np.arange(len(ordered))
+    starts_group = np.ones(len(ordered), dtype=bool)
+    starts_group[1:] = ordered[1:] != ordered[:-1]
+    ends_group = np.ones(len(ordered), dtype=bool)
+    ends_group[:-1] = starts_group[1:]
+    first = np.maximum.accumulate(np.where(starts_group, position, 0))
+    last = np.minimum.accumulate(np.where(ends_group, position, len(ordered) - 1)[::-1])[::-1]
+    inverse = np.empty_like(order)
+    inverse[order] = position
+    return order, inverse, first, last
+
+def _pair_ranks(groups: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], complete: np.ndarray) -> np.ndarray:
+    # Average ranks of one column over the complete rows in each row of `complete`, from its
+    # _tie_groups. With below[k] complete rows among the first k sorted, a value's ties hold the
+    # ranks below[first] + 1 ... below[last + 1], so their average is half the sum of both ends.
+    order, inverse, first, last = groups
+    below = np.zeros((len(complete), len(order) + 1), dtype=np.int64)
+    np.cumsum(np.take(complete, order, axis=1), axis=1, out=below[:, 1:])
+    ends = np.take(below, first, axis=1)
+    ends += np.take(below, last + 1, axis=1)
+    ends += 1
+    return np.take(ends, inverse, axis=1) / 2
+
+def _rerank_gappy_pairs(spearman: np.ndarray, n: np.ndarray, ranks: np.ndarray) -> None:
+    # A pair needs its own ranks when either column has values outside the pair's complete rows.
+    present = np.diag(n)
+    gappy = (n < present[:, None]) | (n < present[None, :])
+    columns = len(present)
+    rows = ranks.shape[0]
+    # Square blocks of columns, so a block pair's ranks stay around SCREEN_RANK_CELLS cells.
+    step = max(1, int(math.sqrt(SCREEN_RANK_CELLS / max(rows, 1))))
+    for a_start in range(0, columns, step):
+        a = np.arange(a_start, min(a_start + step, columns))
+        x = np.asarray(ranks[:, a])
+        x_groups = [_tie_groups(x[:, k]) for k in range(len(a))]
+        for b_start in range(a_start, columns, step):
+            b = np.arange(b_start, min(b_start + step, columns))
+            wanted = gappy[np.ix_(a, b)] & (a[:, None] < b[None, :])
+            if not wanted.any():
+                continue
+            y = x if b_start == a_start else np.asarray(ranks[:, b])
+            y_groups = x_groups if b_start == a_start else [_tie_groups(y[:, l]) for l in range(len(b))]
+            # complete[k, l]: the rows where both a[k] and b[l] have a value.
+            complete = ~np.isnan(x.T)[:, None, :] & ~np.isnan(y.T)[None, :, :]
+            count = complete.sum(axis=2)
+            mean = (count + 1) / 2
+            dx = np.empty((len(a), len(b), rows))
+            dy = np.empty((len(a), len(b), rows))
+            for k in range(len(a)):
+                dx[k] = _pair_ranks(x_groups[k], complete[k])
+            for l in range(len(b)):
+                dy[:, l] = _pair_ranks(y_groups[l], complete[:, l])
+            for d in (dx, dy):
+                d -= mean[:, :, None]
+                d *= complete
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r = np.einsum("klr,klr->kl", dx, dy) / np.sqrt(
+                    np.einsum("klr,klr->kl", dx, dx) * np.einsum("klr,klr->kl", dy, dy))
+            r[~np.isfinite(r) | (count < 3)] = np.nan
+            np.clip(r, -1.0, 1.0, out=r)
+            k, l = np.nonzero(wanted)
+            spearman[a[k], b[l]] = spearman[b[l], a[k]] = r[k, l]
+
+def screen_correlations(read_blocks: Callable[[], Iterator[np.ndarray]], read_columns: Callable[[List[str]], np.ndarray],
+                        columns: List[str], rows: int, alpha: float = SCREEN_ALPHA,
+                        block_rows: int = SCREEN_BLOCK_ROWS) -> Dict[str, Any]:
+    """
+    Screens every pair of `columns` for Pearson and Spearman correlation.
+
+    `read_blocks()` must return an iterator over row blocks of the columns
+    (2-D float arrays, NaN for missing values). `read_columns(names)` returns
+    whole columns as one 2-D array. Returns a dict with:
+    - "table": one row per pair, most significant first
+    - "pearson", "spearman": the full r matrices
+    - "order": a clustered column order for heatmaps
+    """
+    import pandas as pd
+
+    pearson_moments = None
+    for block in read_blocks():
+        if pearson_moments is None:
+            present = np.isfinite(block)
+            first_means = np.where(present, block, 0.0).sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+            pearson_moments = _PairwiseMoments(first_means)
+        pearson_moments.add(block)
+    if pearson_moments is None:
+        raise ValueError("The dataset has no rows.")
+    pearson, n = pearson_moments.correlation()
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        ranks = _rank_columns(read_columns, columns, rows, spill_dir)
+        spearman_moments = _PairwiseMoments(np.full(len(columns), (rows + 1) / 2))
+        for start in range(0, rows, block_rows):
+            spearman_moments.add(np.array(ranks[start:start + block_rows]))
+        spearman, _ = spearman_moments.correlation()
+        _rerank_gappy_pairs(spearman, n, ranks)
+        del ranks
+
+    i, j = np.triu_indices(len(columns), k=1)
+    table = pd.DataFrame({
+        "column_x": np.asarray(columns, dtype=object)[i],
+        "column_y": np.asarray(columns, dtype=object)[j],
+        "n": n[i, j],
+        "pearson_r": pearson[i, j],
+        "pearson_p": correlation_p_values(pearson[i, j], n[i, j]),
+        "spearman_r": spearman[i, j],
+        "spearman_p": correlation_p_values(spearman[i, j], n[i, j]),
+    })
+    table.insert(5, "pearson_q", benjamini_hochberg(table["pearson_p"].to_numpy()))
+    table["spearman_q"] = benjamini_hochberg(table["spearman_p"].to_numpy())
+    table["significant"] = (table["pearson_q"] < alpha) | (table["spearman_q"] < alpha)
+    best_q = table[["pearson_q", "spearman_q"]].min(axis=1)
+    strength = table[["pearson_r", "spearman_r"]].abs().max(axis=1)
+    table = table.assign(_q=best_q, _s=-strength).sort_values(["_q", "_s"], na_position="last")
+    table = table.drop(columns=["_q", "_s"]).reset_index(drop=True)
+    return {"table": table, "pearson": pearson, "spearman": spearman, "order": cluster_order(pearson)}
+
+def cluster_order(r: np.ndarray) -> np.ndarray:
+    """
+    A column order that puts strongly correlated columns next to each other:
+    average-linkage clustering on 1 - |r| with scipy, otherwise a spectral ordering.
+    """
+    p = len(r)
+    if p < 3:
+        return np.arange(p)
+    similarity = np.nan_to_num(np.abs(r), nan=0.0)
+    np.fill_diagonal(similarity, 1.0)
+    if scipy_stats is not None:
+        from scipy.cluster.hierarchy import leaves_list, linkage
+        from scipy.spatial.distance import squareform
+
+        distance = 1.0 - similarity
+        np.fill_diagonal(distance, 0.0)
+        return leaves_list(linkage(squareform(distance, checks=False), method="average"))
+    # Sorting by the Fiedler vector of the similarity graph's Laplacian groups connected columns.
+    laplacian = np.diag(similarity.sum(axis=1)) - similarity
+    _, vectors = np.linalg.eigh(laplacian)
+    return np.argsort(vectors[:, 1], kind="stable")
+
+def correlation_heatmap_png(r: np.ndarray, columns: List[str], order: np.ndarray, title: str = "Pearson r",
+                            dpi: int = 100) -> bytes:
+    """Renders the correlation matrix in the given (clustered) order as a PNG."""
+    from matplotlib.figure import Figure
+
+    p = len(columns)
+    size = min(12.0, max(5.0, 0.18 * p + 3))
+    fig = Figure(figsize=(size + 1.5, size))
+    ax = fig.subplots()
+    image = ax.imshow(r[np.ix_(order, order)], cmap="RdBu_r", vmin=-1, vmax=1, interpolation="nearest")
+    fig.colorbar(image, ax=ax, label=title, shrink=0.8)
+    if p <= HEATMAP_MAX_LABELS:
+        labels = [columns[k] for k in order]
+        ax.set_xticks(range(p), labels, rotation=90, fontsize=7)
+        ax.set_yticks(range(p), labels, fontsize=7)
+    else:
+        ax.set_xticks([])
+        ax.set_yticks([])
+        ax.set_xlabel(f"{p} columns (clustered order)")
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    return buffer.getvalue()
@@ -0,0 +1,263 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# --------------------------------------------------------------------------
+# --- COLUMNAR STORE FOR UPLOADED DATASETS ---
+# --------------------------------------------------------------------------
+# Uploaded CSVs are converted once into compact Arrow IPC files and read back
+# through a memory map. The file is keyed by the SHA-256 of the CSV bytes, so
+# re-uploading the same file (or rerunning the script) never parses it again.
+#
+# The CSV is read in chunks, in two passes, so peak memory is about one chunk:
+# 1. Infer a dtype for every column: the smallest integer type that holds its
+#    range, float32 where that loses nothing, bool, a category for repetitive
+#    text, plain strings otherwise.
+# 2. Convert each chunk to that schema and append it to the Arrow file.
+# Callers load just the columns they need (`load`), so selecting plot axes
+# touches a few megabytes of the mapped file, not the whole dataset.
+# Only the most recently read tables stay open (`TABLE_CACHE_SIZE`); older ones
+# are dropped so their mappings, and the pages read through them, are released.
+
+CSV_CHUNK_ROWS = 250_000
+CATEGORY_MAX_UNIQUES = 1_000    # text columns with more distinct values stay plain strings
+CATEGORY_MAX_RATIO = 0.5        # ...as do columns where most values are distinct
+TABLE_CACHE_SIZE = 4            # open memory-mapped tables kept per store
+_HASH_BLOCK_BYTES = 1 << 20
+
+Source = Union[str, Path, IO[bytes]]
+
+class DatasetHandle(NamedTuple):
+    """A converted dataset. Small and picklable, so it can live in `st.session_state`."""
+    key: str                    # SHA-256 of the source bytes (first 32 hex digits)
+    name: str
+    path: Path
+    rows: int
+    columns: Dict[str, str]     # column name -> stored dtype
+    source_bytes: int
+    stored_bytes: int
+
+    @property
+    def numeric_columns(self) -> List[str]:
+        return [name for name, dtype in self.columns.items() if dtype.startswith(("int", "float"))]
+
+_KIND_RANK = {"empty": 0, "bool": 1, "int": 2, "float": 3, "text": 4}
+
+class _ColumnStats:
+    """What pass 1 has learned about one column."""
+
+    def __init__(self) -> None:
+        self.kind = "empty"
+        self.has_null = False
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.float32_exact = True
+        self.uniques: Optional[set] = set()
+
+    def update(self, series: pd.Series) -> None:
+        values = series.dropna()
+        self.has_null = self.has_null or len(values) < len(series)
+        if values.empty:
+            return
+        if pd.api.types.is_bool_dtype(values):
+            kind = "bool"
+        elif pd.api.types.is_integer_dtype(values):
+            kind = "int"
+        elif pd.api.types.is_float_dtype(values):
+            kind = "float"
+        else:
+            kind = "text"
+
+        previous = self.kind
+        if "text" in (kind, previous) or ("bool" in (kind, previous) and {kind, previous} - {"bool", "empty"}):
+            # Mixed columns are stored as text. Values that other chunks parsed as
+            # numbers can't be mapped back to their original spelling, so such
+            # columns are never turned into categories.
+            if kind != "text" or previous not in ("empty", "text"):
+                self.uniques = None
+            self.kind = "text"
+            if self.uniques is not None:
+                self.uniques.update(values.astype(str).unique())
+                if len(self.uniques) > CATEGORY_MAX_UNIQUES:
+                    self.uniques = None
+            return
+
+        self.kind = max(previous, kind, key=_KIND_RANK.get)
+        if kind == "bool":
+            return
+        array = values.to_numpy(dtype=np.float64)
+        self.minimum = min(self.minimum, float(array.min()))
+        self.maximum = max(self.maximum, float(array.max()))
+        if self.float32_exact:
+            as32 = array.astype(np.float32).astype(np.float64)
+            # Whole numbers (counts, IDs) must survive float32 exactly; measurements
+            # may lose digits past the sixth significant one.
+            if kind == "int" or np.array_equal(array, np.floor(array)):
+                self.float32_exact = bool(np.array_equal(as32, array))
+            else:
+                self.float32_exact = bool(np.allclose(as32, array, rtol=1e-6, atol=0))
+
+    def dtype(self, rows: int) -> str:
+        if self.kind == "empty":
+            return "float32"
+        if self.kind == "bool":
+            return "bool"
+        if self.kind == "int" and not self.has_null:
+            for dtype in ("int8", "int16", "int32"):
+                info = np.iinfo(dtype)
+                if info.min <= self.minimum and self.maximum <= info.max:
+                    return dtype
+            return "int64"
+        if self.kind in ("int", "float"):
+            # Integer columns with gaps are stored as floats, like pandas reads them.
+            return "float32" if self.float32_exact else "float64"
+        if self.uniques is not None and len(self.uniques) <= max(1, rows * CATEGORY_MAX_RATIO):
+            return "category"
+        return "string"
+
+def _arrow_type(dtype: str) -> pa.DataType:
+    if dtype == "category":
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype == "string":
+        return pa.string()
+    if dtype == "bool":
+        return pa.bool_()
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+class DatasetStore:
+    """Content-addressed, memory-mapped Arrow copies of uploaded CSV files."""
+
+    def __init__(self, cache_dir: Path, chunk_rows: int = CSV_CHUNK_ROWS, max_tables: int = TABLE_CACHE_SIZE) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.chunk_rows = chunk_rows
+        self.max_tables = max_tables
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._tables: "OrderedDict[str, pa.Table]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- ingestion ---
+
+    @staticmethod
+    def _rewind(source: Source) -> Any:
+        if isinstance(source, (str, Path)):
+            return open(source, "rb")
+        source.seek(0)
+        return source
+
+    def _hash(self, source: Source) -> tuple:
+        digest, size = hashlib.sha256(), 0
+        stream = self._rewind(source)
+        try:
+            for block in iter(lambda: stream.read(_HASH_BLOCK_BYTES), b""):
+                digest.update(block)
+                size += len(block)
+        finally:
+            if isinstance(source, (str, Path)):
+                stream.close()
+        return digest.hexdigest()[:32], size
+
+    def _chunks(self, source: Source, dtype: Optional[Dict[str, Any]] = None):
+        stream = self._rewind(source)
+        try:
+            yield from pd.read_csv(stream, chunksize=self.chunk_rows, dtype=dtype, low_memory=False)
+        finally:
+            if isinstance(source, (str, Path)):
+                stream.close()
+
+    def ingest(self, source: Source, name: Optional[str] = None) -> DatasetHandle:
+        """
+        Converts a CSV (path or binary file object) into the store, unless a
+        copy of the same bytes is already there, and returns its handle.
+        """
+        name = name or getattr(source, "name", None) or Path(str(source)).name
+        key, source_bytes = self._hash(source)
+        path = self.cache_dir / f"{key}.arrow"
+        if path.exists():
+            return self.open(key)
+
+        # Pass 1: infer the narrowest dtype for every column.
+        stats: Dict[str, _ColumnStats] = {}
+        rows = 0
+        for chunk in self._chunks(source):
+            rows += len(chunk)
+            for column in chunk.columns:
+                stats.setdefault(column, _ColumnStats()).update(chunk[column])
+        dtypes = {column: s.dtype(rows) for column, s in stats.items()}
+        categories = {column: sorted(stats[column].uniques) for column, dtype in dtypes.items() if dtype == "category"}
+        schema = pa.schema([pa.field(str(column), _arrow_type(dtype)) for column, dtype in dtypes.items()],
+                           metadata={"name": name, "rows": str(rows), "source_bytes": str(source_bytes)})
+
+        # Pass 2: parse again with the final dtypes and append every chunk to a
+        # temporary file, which is moved into place once complete.
+        parse_dtypes = {
+            column: pd.CategoricalDtype(categories[column]) if dtype == "category" else (str if dtype == "string" else dtype)
+            for column, dtype in dtypes.items()
+        }
+        fd, tmp_name = tempfile.mkstemp(dir=self.cache_dir, suffix=".arrow.tmp")
+        os.close(fd)
+        try:
+            with pa.OSFile(tmp_name, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                for chunk in self._chunks(source, dtype=parse_dtypes):
+                    chunk.columns = [str(column) for column in chunk.columns]
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            os.replace(tmp_name, path)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+        return self.open(key)
+
+    # --- reading ---
+
+    def _table(self, key: str) -> pa.Table:
+        with self._lock:
+            table = self._tables.get(key)
+            if table is None:
+                # Zero-copy: column buffers point into the mapped file and are paged in on demand.
+                with pa.memory_map(str(self.cache_dir / f"{key}.arrow")) as source:
+                    table = pa.ipc.open_file(source).read_all()
+                self._tables[key] = table
+                while len(self._tables) > self.max_tables:
+                    self._tables.popitem(last=False)
+            else:
+                self._tables.move_to_end(key)
+            return table
+
+    def open(self, key: str) -> DatasetHandle:
+        """The handle of a dataset already in the store (raises FileNotFoundError otherwise)."""
+        path = self.cache_dir / f"{key}.arrow"
+        table = self._table(key)
+        metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+        columns = {}
+        for field in table.schema:
+            if pa.types.is_dictionary(field.type):
+                columns[field.name] = "category"
+            elif pa.types.is_string(field.type):
+                columns[field.name] = "string"
+            else:
+                columns[field.name] = field.type.to_pandas_dtype().__name__
+        return DatasetHandle(key, metadata.get("name", key), path, int(metadata.get("rows", table.num_rows)), columns,
+                             int(metadata.get("source_bytes", 0)), path.stat().st_size)
+
+    def load(self, handle: DatasetHandle, columns: Optional[List[str]] = None, rows: Optional[int] = None) -> pd.DataFrame:
+        """Reads the given columns (default: all) and optionally only the first `rows` rows as a DataFrame."""
+        table = self._table(handle.key)
+        if columns is not None:
+            table = table.select(list(dict.fromkeys(columns)))
+        if rows is not None:
+            table = table.slice(0, rows)
+        return table.to_pandas()
+
+    def iter_blocks(self, handle: DatasetHandle, columns: List[str], block_rows: int = CSV_CHUNK_ROWS) -> Iterator[np.ndarray]:
+        """Yields numeric columns in row blocks, as 2-D float64 arrays with NaN for missing values."""
+        table = self._table(handle.key).select(columns)
+        for batch in table.to_batches(max_chunksize=block_rows):
+            yield np.column_stack([column.to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+                                   for column in batch.columns])
@@ -1,48 +1,36 @@
+import concurrent.futures
 import json
+import queue
 import re
 import time
-from typing import List, Dict, Any
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 # Third-party libraries
-import py3Dmol
-import requests
-from openai import AzureOpenAI
-import pandas as pd
-import numpy as np
 import streamlit as st
-import concurrent.futures
-import json
-import uuid
-import requests
-import os
-from datetime import datetime
-from pathlib import Path
-from openai import AzureOpenAI
-import time
-import re
-
-# RDKit and Datamol
-import rdkit
-from rdkit import Chem
-from rdkit.Chem import Draw
-from rdkit.Chem import AllChem
-import datamol as dm
-
-# Py3Dmol for 3D viewing
-import py3Dmol
-
-# Plotting and Data Handling
-import matplotlib
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-import seaborn as sns
-
-# Image Handling
-from PIL import Image
-import base64
-from io import BytesIO
-from typing import Iterable, List
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from agent_router import AgentRouter, match_agent_name
+from artifact_store import ArtifactHandle, ArtifactStore
+from completion_cache import CompletionCache
+from report_memo import StageMemo
+from report_pipeline import ReportJobRunner, ReportStage, StageContext, StageFailed
+from report_retrieval import ResearchIndex
+from request_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, RequestScheduler, estimate_tokens
+from team_meeting import MeetingMemory, excerpt
+from telemetry import Telemetry
+
+# Heavy dependencies are imported on first use, inside the functions that need
+# them, so that importing `lab` (and rendering the login screen, Tab 1 or Tab 3)
+# doesn't pay for them:
+#   openai                           -> get_azure_openai_client
+#   pandas, numpy (biophysics)       -> the nanobody designer and analysis
+#   requests (structure_store), py3Dmol -> the protein structure viewer
+# benchmarks/bench_import_time.py checks that this stays true.
+if TYPE_CHECKING:
+    import pandas as pd
+    from dataset_store import DatasetStore
+    from structure_store import AlphaFoldStructureStore
 
 # --------------------------------------------------------------------------
 # --- 1. SECURE AZURE OPENAI CONFIGURATION ---
@@ -56,11 +44,14 @@ def get_azure_openai_client():
     Initializes and returns an AzureOpenAI client using credentials
     stored in Streamlit's secrets management.
     """
+    from openai import AzureOpenAI
+
     try:
         client = AzureOpenAI(
             azure_endpoint=st.secrets["AZURE_ENDPOINT"],
             api_key=st.secrets["AZURE_API_KEY"],
             api_version=st.secrets["API_VERSION"],
+            max_retries=0,  # retries are handled by the request scheduler (section 1c)
         )
         return client
     except Exception as e:
@@ -70,6 +61,295 @@ def get_azure_openai_client():
 # Centralized deployment name from secrets
 DEPLOYMENT_NAME = st.secrets.get("DEPLOYMENT_NAME")
 
+# --------------------------------------------------------------------------
+# --- 1b. COMPLETION CACHE ---
+# --------------------------------------------------------------------------
+# Every chat completion goes through `chat_completion`, which serves repeated
+# requests (Streamlit reruns, demo replays, identical queries) from an on-disk
+# cache instead of paying for another Azure round-trip.
+CACHE_DIR = Path(".aira_cache")
+COMPLETION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# How long (in seconds) a cached completion stays valid for each calling agent.
+COMPLETION_CACHE_TTLS = {
+    "run_agent": 24 * 3600,
+    "fetch_protein_data": 7 * 24 * 3600,
+    "get_web_research_summary": 24 * 3600,
+    "run_outline_agent": 24 * 3600,
+    "run_research_agent": 24 * 3600,
+    "run_writer_agent": 24 * 3600,
+    "run_editor_agent": 24 * 3600,
+}
+DEFAULT_COMPLETION_CACHE_TTL = 24 * 3600
+
+# Calls at or above this temperature are "creative" (designer, team meeting)
+# and bypass the cache unless explicitly requested, so users get fresh output.
+CACHE_BYPASS_TEMPERATURE = 0.7
+
+@st.cache_resource
+def get_completion_cache() -> CompletionCache:
+    """Returns the process-wide completion cache shared by all sessions."""
+    return CompletionCache(CACHE_DIR / "completions.sqlite3", max_bytes=COMPLETION_CACHE_MAX_BYTES)
+
+# --------------------------------------------------------------------------
+# --- 1c. REQUEST SCHEDULER ---
+# --------------------------------------------------------------------------
+# Every call that misses the cache is admitted by one process-wide
+# `RequestScheduler`, shared by all sessions. It keeps the app under the
+# deployment's quota (the optional RATE_LIMIT_RPM / RATE_LIMIT_TPM secrets).
+# It also retries 429s and transient errors, honouring Retry-After, and lets
+# interactive calls go ahead of bulk report-generation calls.
+
+# Agents whose calls wait behind interactive ones; all others are interactive.
+AGENT_PRIORITIES = {
+    "run_writer_agent": PRIORITY_BULK,
+    "run_editor_agent": PRIORITY_BULK,
+    "run_section_editor_agent": PRIORITY_BULK,
+    "run_global_editor_pass": PRIORITY_BULK,
+}
+
+@st.cache_resource
+def get_request_scheduler() -> RequestScheduler:
+    """Returns the process-wide request scheduler, limited by the deployment quota in secrets (if set)."""
+    return RequestScheduler(
+        requests_per_minute=st.secrets.get("RATE_LIMIT_RPM"),
+        tokens_per_minute=st.secrets.get("RATE_LIMIT_TPM"),
+    )
+
+def set_request_limits(requests_per_minute: float = None, tokens_per_minute: float = None) -> None:
+    """Overrides the requests and tokens per minute this process may use (None means unlimited)."""
+    get_request_scheduler().configure(requests_per_minute, tokens_per_minute)
+
+# --------------------------------------------------------------------------
+# --- 1d. TELEMETRY ---
+# --------------------------------------------------------------------------
+# Every chat completion and AlphaFold fetch is recorded (agent, wall time,
+# time to first token, tokens, cache hit, error class) by one process-wide
+# `Telemetry`. Optional secrets:
+#   TELEMETRY_JSONL                 also append every record to this file
+#   TELEMETRY_PROMETHEUS_PORT       serve Prometheus metrics at :PORT/metrics
+#   PRICE_PER_1K_PROMPT_TOKENS      prices used for the cost estimate
+#   PRICE_PER_1K_COMPLETION_TOKENS
+@st.cache_resource
+def get_telemetry() -> Telemetry:
+    """Returns the process-wide telemetry recorder shared by all sessions."""
+    telemetry = Telemetry(
+        jsonl_path=st.secrets.get("TELEMETRY_JSONL"),
+        prompt_price_per_1k=float(st.secrets.get("PRICE_PER_1K_PROMPT_TOKENS", 0.0)),
+        completion_price_per_1k=float(st.secrets.get("PRICE_PER_1K_COMPLETION_TOKENS", 0.0)),
+    )
+    port = st.secrets.get("TELEMETRY_PROMETHEUS_PORT")
+    if port:
+        try:
+            telemetry.serve_prometheus(int(port))
+        except OSError as e:
+            st.warning(f"Could not serve Prometheus metrics on port {port}: {e}")
+    return telemetry
+
+def chat_completion(agent: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float,
+                    response_format: Dict[str, Any] = None, use_cache: bool = None, client=None, priority: int = None,
+                    deadline: float = None) -> str:
+    """
+    Runs a chat completion against `DEPLOYMENT_NAME` and returns the message content.
+
+    `agent` names the calling function; it selects the cache TTL and labels the
+    hit/miss counters. `use_cache=None` caches everything below
+    `CACHE_BYPASS_TEMPERATURE`; pass True/False to force the decision.
+    `priority` defaults to the agent's entry in `AGENT_PRIORITIES`. With a
+    `deadline` (a `time.monotonic()` value) every attempt's HTTP timeout is the
+    time left, and the scheduler neither queues nor retries past it.
+    API errors that survive the scheduler's retries are raised to the caller,
+    which formats its own error message.
+    """
+    client = client or get_azure_openai_client()
+    if use_cache is None:
+        use_cache = temperature < CACHE_BYPASS_TEMPERATURE
+
+    with get_telemetry().span(agent, "chat") as call:
+        cache = get_completion_cache() if use_cache else None
+        if cache is not None:
+            key = CompletionCache.make_key(DEPLOYMENT_NAME, messages, temperature, max_tokens, response_format)
+            cached = cache.get(key, agent)
+            if cached is not None:
+                call["cache_hit"] = True
+                return cached
+
+        request = dict(model=DEPLOYMENT_NAME, messages=messages, max_tokens=max_tokens, temperature=temperature)
+        if response_format is not None:
+            request["response_format"] = response_format
+        if priority is None:
+            priority = AGENT_PRIORITIES.get(agent, PRIORITY_INTERACTIVE)
+        def send():
+            if deadline is None:
+                return client.chat.completions.create(**request)
+            return client.chat.completions.create(**request, timeout=max(0.1, deadline - time.monotonic()))
+
+        response = get_request_scheduler().call(send, estimate_tokens(messages, max_tokens), priority, deadline)
+        content = response.choices[0].message.content
+        usage = getattr(response, "usage", None)
+        call["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+        call["completion_tokens"] = getattr(usage, "completion_tokens", None)
+
+        if cache is not None and content:
+            cache.set(key, content, COMPLETION_CACHE_TTLS.get(agent, DEFAULT_COMPLETION_CACHE_TTL), agent)
+        return content
+
+def stream_chat_completion(agent: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float,
+                           use_cache: bool = None, client=None, priority: int = None) -> Iterator[str]:
+    """
+    Streaming counterpart of `chat_completion`: yields text deltas as they arrive.
+    A cache hit is yielded as a single chunk; a completed stream is written to the cache.
+    Only opening the stream is retried; an error mid-stream is raised.
+    """
+    client = client or get_azure_openai_client()
+    if use_cache is None:
+        use_cache = temperature < CACHE_BYPASS_TEMPERATURE
+
+    with get_telemetry().span(agent, "chat_stream") as call:
+        start = time.perf_counter()
+        cache = get_completion_cache() if use_cache else None
+        if cache is not None:
+            key = CompletionCache.make_key(DEPLOYMENT_NAME, messages, temperature, max_tokens, None)
+            cached = cache.get(key, agent)
+            if cached is not None:
+                call["cache_hit"] = True
+                yield cached
+                return
+
+        if priority is None:
+            priority = AGENT_PRIORITIES.get(agent, PRIORITY_INTERACTIVE)
+        stream = get_request_scheduler().stream(
+            lambda: client.chat.completions.create(
+                model=DEPLOYMENT_NAME, messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True
+            ),
+            estimate_tokens(messages, max_tokens),
+            priority,
+            prompt_tokens=estimate_tokens(messages, 0),
+        )
+        parts = []
+        for chunk in stream:
+            # Azure sends an initial chunk with no choices (content filter results).
+            if not chunk.choices or chunk.choices[0].delta is None:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    call["ttft_ms"] = (time.perf_counter() - start) * 1000
+                parts.append(delta)
+                yield delta
+
+        # Streams don't report usage, so tokens are estimated (~4 characters per token).
+        content = "".join(parts)
+        call["prompt_tokens"] = estimate_tokens(messages, 0)
+        call["completion_tokens"] = len(content) // 4
+        call["tokens_estimated"] = True
+        if cache is not None and content:
+            cache.set(key, content, COMPLETION_CACHE_TTLS.get(agent, DEFAULT_COMPLETION_CACHE_TTL), agent)
+
+class CompletionStream:
+    """
+    An iterable of text deltas for `st.write_stream`.
+
+    Once iteration finishes, `text` holds exactly what the matching blocking
+    agent would have returned: the stripped completion, or an "Error..." string
+    if the request failed. On failure the error message is also yielded so it
+    appears in the streamed output. With a `stage` and a `report_id`, a stored
+    output for `stage_inputs` is yielded at once (and `reused` is set) and a
+    completed stream is stored (see `get_stage_memo`).
+    """
+    def __init__(self, agent: str, messages: List[Dict[str, str]], max_tokens: int, temperature: float, error_prefix: str,
+                 stage: str = None, stage_inputs: Any = None, report_id: str = None) -> None:
+        self.agent = agent
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.error_prefix = error_prefix
+        self.stage = stage
+        self.stage_inputs = stage_inputs
+        self.report_id = report_id
+        self.text = None
+        self.reused = False
+
+    def __iter__(self) -> Iterator[str]:
+        if self.stage:
+            stored = get_stage_memo().get(self.report_id, self.stage, self.stage_inputs)
+            if stored is not None:
+                self.text = stored
+                self.reused = True
+                yield stored
+                return
+
+        client = get_azure_openai_client()
+        if not client:
+            self.text = "Error: Azure OpenAI client is not available."
+            yield self.text
+            return
+
+        parts = []
+        try:
+            for delta in stream_chat_completion(self.agent, self.messages, self.max_tokens, self.temperature, client=client):
+                parts.append(delta)
+                yield delta
+        except Exception as e:
+            self.text = f"{self.error_prefix}{e}"
+            yield ("\n\n" if parts else "") + self.text
+            return
+        self.text = "".join(parts).strip()
+        if self.stage and self.text:
+            get_stage_memo().set(self.report_id, self.stage, self.stage_inputs, self.text)
+
+# --------------------------------------------------------------------------
+# --- 1e. SESSION ARTIFACTS ---
+# --------------------------------------------------------------------------
+# Large results (Tab 1 answers, design tables, report outline, research notes,
+# drafts) are kept in one process-wide `ArtifactStore` instead of in
+# `st.session_state`, which holds only their handles. Memory per session and
+# overall is capped; least recently used artifacts spill to disk and are read
+# back when needed. Files behind a live session's handles are never evicted
+# from disk. Optional secrets (in MB):
+#   ARTIFACT_SESSION_MAX_MB, ARTIFACT_GLOBAL_MAX_MB, ARTIFACT_DISK_MAX_MB
+def _is_live_session(session_id: str) -> bool:
+    from streamlit import runtime
+
+    return runtime.exists() and runtime.get_instance().is_active_session(session_id)
+
+@st.cache_resource
+def get_artifact_store() -> ArtifactStore:
+    """Returns the process-wide session artifact store, with memory caps from secrets (if set)."""
+    return ArtifactStore(
+        CACHE_DIR / "artifacts",
+        session_max_bytes=int(float(st.secrets.get("ARTIFACT_SESSION_MAX_MB", 64)) * 2**20),
+        global_max_bytes=int(float(st.secrets.get("ARTIFACT_GLOBAL_MAX_MB", 512)) * 2**20),
+        disk_max_bytes=int(float(st.secrets.get("ARTIFACT_DISK_MAX_MB", 4096)) * 2**20),
+        is_live_session=_is_live_session,
+    )
+
+def current_session_id() -> str:
+    """The Streamlit session running this script ("default" outside a script run)."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "default"
+
+def set_session_artifact(name: str, value: Any) -> None:
+    """Stores `value` in the artifact store and keeps only its handle in `st.session_state[name]`."""
+    store, session_id = get_artifact_store(), current_session_id()
+    previous = st.session_state.get(name)
+    st.session_state[name] = None if value is None else store.put(session_id, value)
+    if isinstance(previous, ArtifactHandle):
+        store.discard(session_id, previous)
+
+def get_session_artifact(name: str, default: Any = None) -> Any:
+    """The value stored with `set_session_artifact`, or `default` if unset (or evicted from disk)."""
+    handle = st.session_state.get(name)
+    if handle is None:
+        return default
+    return get_artifact_store().get(current_session_id(), handle, default)
+
+def release_session_artifacts() -> None:
+    """Drops every artifact handle of this session (e.g. on logout) and releases its memory."""
+    for name in [name for name, value in st.session_state.items() if isinstance(value, ArtifactHandle)]:
+        st.session_state[name] = None
+    get_artifact_store().release(current_session_id())
+
 # --------------------------------------------------------------------------
 # --- 2. HELPER FUNCTIONS ---
 # --------------------------------------------------------------------------
@@ -89,72 +369,182 @@ def extract_json(text: str) -> dict:
         st.error("Failed to decode JSON from the API response.")
         return {}
 
+def make_executor(max_workers: int) -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Creates a thread pool whose workers share the calling script's Streamlit
+    context, so cached resources, secrets and `st.*` calls keep working inside them.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_workers, initializer=add_script_run_ctx, initargs=(None, ctx)
+    )
+
 # --------------------------------------------------------------------------
 # --- 3. LOGIC FOR EACH TAB ---
 # --------------------------------------------------------------------------
 
 # --- Logic for Tab 1: Research Assistant ---
 
-def run_agent(system_prompt: str, user_query: str, agent_task_prompt: str):
-    """Generic function to run a single agent turn with the Azure OpenAI API."""
+def run_agent(system_prompt: str, user_query: str, agent_task_prompt: str, timeout: float = None, deadline: float = None):
+    """
+    Generic function to run a single agent turn with the Azure OpenAI API.
+    The call, including queueing and retries, stops after `timeout` seconds or
+    at `deadline` (a `time.monotonic()` value).
+    """
     client = get_azure_openai_client()
     if not client:
         return "Error: Azure OpenAI client is not available."
+    if deadline is None and timeout is not None:
+        deadline = time.monotonic() + timeout
 
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"{agent_task_prompt}\n\nUser Query: '{user_query}'"}
     ]
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=800,
-            temperature=0.2
-        )
-        return response.choices[0].message.content.strip()
+        content = chat_completion("run_agent", messages, max_tokens=800, temperature=0.2, client=client, deadline=deadline)
+        return content.strip()
     except Exception as e:
         return f"Error: An API error occurred: {e}"
 
-def run_hierarchical_agent_system(user_query: str):
+# Bounds for the concurrent fan-out: at most this many Azure calls in flight
+# per query, and each agent gets this many seconds before it is reported as
+# timed out (the other agents are unaffected). The deadline is passed down to
+# the request scheduler, so a timed-out agent also stops queueing and retrying.
+AGENT_MAX_WORKERS = 7
+AGENT_TIMEOUT_SECONDS = 90
+
+def run_agents_concurrently(user_query: str, agents: Dict[str, tuple], max_workers: int = AGENT_MAX_WORKERS, timeout: float = AGENT_TIMEOUT_SECONDS) -> Dict[str, str]:
     """
-    Manages the hierarchical agent workflow for the Research Assistant tab.
-    A supervisor agent first delegates the task to the most relevant specialist.
+    Runs several `run_agent` calls on a bounded thread pool.
+    `agents` maps a name to a `(system_prompt, task_prompt)` pair. Every agent is
+    isolated: a failure or timeout becomes an "Error: ..." string for that name only.
+    Results keep the insertion order of `agents`.
     """
-    supervisor_prompt = (
-        "You are a supervisor agent managing a team of specialized AI assistants for drug discovery. "
-        "Your team consists of: Bioinformatics, Pharmacokinetics, Pharmacodynamics, Clinical Trials, Toxicology, and Regulatory Affairs. "
-        "Based on the user's query, your task is to identify and respond with ONLY the name of the single most relevant agent to handle the query (e.g., respond with 'Bioinformatics')."
-    )
-    supervisor_decision = run_agent("You are a supervisor agent.", user_query, supervisor_prompt)
-
-    if supervisor_decision.startswith("Error:"):
-        return {"error": supervisor_decision}
-
-    agent_prompts = {
-        "Bioinformatics": ("You are a bioinformatics assistant.", "Your expertise includes gene target identification, sequence analysis, and structural bioinformatics. Provide a detailed analysis based on the user's query."),
-        "Pharmacokinetics": ("You are a pharmacokinetics (ADME) assistant.", "Your expertise includes modeling drug Absorption, Distribution, Metabolism, and Excretion. Analyze the query from an ADME perspective."),
-        "Pharmacodynamics": ("You are a pharmacodynamics assistant.", "Your expertise includes receptor binding, dose-response relationships, and mechanism of action. Address the query based on these principles."),
-        "Clinical Trials": ("You are a clinical trials assistant.", "Your expertise includes trial design, patient recruitment, statistical analysis, and regulatory phases. Frame your response in the context of clinical trials."),
-        "Toxicology": ("You are a toxicology assistant.", "Your expertise includes evaluating toxicity profiles, identifying potential adverse effects, and risk assessment. Analyze the query for toxicological relevance."),
-        "Regulatory Affairs": ("You are a regulatory affairs assistant.", "Your expertise includes navigating FDA/EMA guidelines, submission processes, and compliance. Provide insights on the regulatory aspects of the query."),
-    }
+    client = get_azure_openai_client()
+    if not client:
+        return {name: "Error: Azure OpenAI client is not available." for name in agents}
 
-    responses = {}
-    # To improve efficiency, you could choose to run only the selected agent.
-    # However, running all provides a multi-faceted view.
-    for name, (system_prompt, task_prompt) in agent_prompts.items():
-        responses[name] = run_agent(system_prompt, user_query, task_prompt)
+    executor = make_executor(max(1, min(max_workers, len(agents))))
+    try:
+        deadline = time.monotonic() + timeout
+        futures = {
+            name: executor.submit(run_agent, system_prompt, user_query, task_prompt, deadline=deadline)
+            for name, (system_prompt, task_prompt) in agents.items()
+        }
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                results[name] = f"Error: The {name} agent timed out after {timeout:.0f} seconds."
+            except Exception as e:
+                results[name] = f"Error: An API error occurred: {e}"
+        return results
+    finally:
+        # Don't block on stragglers that already timed out.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+SUPERVISOR_PROMPT = (
+    "You are a supervisor agent managing a team of specialized AI assistants for drug discovery. "
+    "Your team consists of: Bioinformatics, Pharmacokinetics, Pharmacodynamics, Clinical Trials, Toxicology, and Regulatory Affairs. "
+    "Based on the user's query, your task is to identify and respond with ONLY the name of the single most relevant agent to handle the query (e.g., respond with 'Bioinformatics')."
+)
 
-    # Clean the supervisor's decision to ensure it matches a key
-    cleaned_decision = supervisor_decision.replace('.', '').strip()
-    if cleaned_decision not in agent_prompts:
-        # Fallback if the supervisor's response is not a valid agent name
-        cleaned_decision = next(iter(agent_prompts))
+SPECIALIST_AGENTS = {
+    "Bioinformatics": ("You are a bioinformatics assistant.", "Your expertise includes gene target identification, sequence analysis, and structural bioinformatics. Provide a detailed analysis based on the user's query."),
+    "Pharmacokinetics": ("You are a pharmacokinetics (ADME) assistant.", "Your expertise includes modeling drug Absorption, Distribution, Metabolism, and Excretion. Analyze the query from an ADME perspective."),
+    "Pharmacodynamics": ("You are a pharmacodynamics assistant.", "Your expertise includes receptor binding, dose-response relationships, and mechanism of action. Address the query based on these principles."),
+    "Clinical Trials": ("You are a clinical trials assistant.", "Your expertise includes trial design, patient recruitment, statistical analysis, and regulatory phases. Frame your response in the context of clinical trials."),
+    "Toxicology": ("You are a toxicology assistant.", "Your expertise includes evaluating toxicity profiles, identifying potential adverse effects, and risk assessment. Analyze the query for toxicological relevance."),
+    "Regulatory Affairs": ("You are a regulatory affairs assistant.", "Your expertise includes navigating FDA/EMA guidelines, submission processes, and compliance. Provide insights on the regulatory aspects of the query."),
+}
+
+# Domain vocabulary for the local router, added to each specialist's task prompt.
+SPECIALIST_KEYWORDS = {
+    "Bioinformatics": "gene genes genome genomic sequence sequencing alignment target identification protein structure "
+                      "structural bioinformatics omics transcriptomics proteomics rna-seq gwas variant mutation snp crispr "
+                      "pathway enrichment expression expressed differential homology docking alphafold database biomarker discovery",
+    "Pharmacokinetics": "pharmacokinetics adme absorption distribution metabolism excretion clearance half-life "
+                        "bioavailability plasma concentration cmax auc volume of distribution cyp cyp450 cytochrome metabolize metabolized "
+                        "oral dosing interval elimination renal hepatic metabolism drug-drug interaction blood-brain barrier",
+    "Pharmacodynamics": "pharmacodynamics receptor binding affinity dose-response ec50 ic50 mechanism of action agonist "
+                        "antagonist potency efficacy target engagement signaling inhibitor occupancy kinetics allosteric",
+    "Clinical Trials": "clinical trial trials phase randomized placebo controlled cohort patients recruitment enrollment "
+                       "endpoint primary endpoint sample size power statistical analysis inclusion exclusion criteria "
+                       "double-blind arm interim analysis real-world evidence",
+    "Toxicology": "toxicology toxicity toxic adverse effects adverse events safety risk assessment hepatotoxicity "
+                  "cardiotoxicity herg ld50 noael genotoxicity carcinogenicity side effects off-target dose-limiting "
+                  "overdose poisoning safety margin",
+    "Regulatory Affairs": "regulatory fda ema approval ind nda bla submission guideline guidance compliance label "
+                          "orphan designation breakthrough accelerated approval gmp glp ich dossier post-marketing "
+                          "pharmacovigilance reimbursement",
+}
+
+# Tab 1 answers with the routed specialist first; the others run on request.
+# Set ROUTER_USE_LLM_FALLBACK to False to never consult the LLM supervisor.
+ROUTER_USE_LLM_FALLBACK = True
+
+@st.cache_resource
+def get_agent_router() -> AgentRouter:
+    """Returns the local query router built from the specialist prompts and keywords."""
+    return AgentRouter({
+        name: f"{task_prompt} {SPECIALIST_KEYWORDS.get(name, '')}"
+        for name, (_, task_prompt) in SPECIALIST_AGENTS.items()
+    })
+
+def route_query(user_query: str, use_llm_fallback: bool = None) -> Dict[str, Any]:
+    """
+    Chooses the specialist for a query. The local router decides when it is
+    confident; otherwise the LLM supervisor is asked, and its answer is matched
+    against the agent names (falling back to the router's best guess).
+    Returns `agent`, `method` ("local" or "llm") and the router `confidence`.
+    """
+    if use_llm_fallback is None:
+        use_llm_fallback = ROUTER_USE_LLM_FALLBACK
+    router = get_agent_router()
+    decision = router.route(user_query)
+    if router.is_confident(decision) or not use_llm_fallback:
+        return {"agent": decision.agent, "method": "local", "confidence": decision.confidence}
+
+    supervisor_decision = run_agent("You are a supervisor agent.", user_query, SUPERVISOR_PROMPT)
+    agent = None if supervisor_decision.startswith("Error:") else match_agent_name(supervisor_decision, list(SPECIALIST_AGENTS))
+    return {"agent": agent or decision.agent, "method": "llm" if agent else "local", "confidence": decision.confidence}
+
+def run_other_specialists(user_query: str, exclude: str) -> Dict[str, str]:
+    """Runs every specialist except `exclude` concurrently (the 'all other agents' view of Tab 1)."""
+    others = {name: prompts for name, prompts in SPECIALIST_AGENTS.items() if name != exclude}
+    return run_agents_concurrently(user_query, others)
+
+def run_hierarchical_agent_system(user_query: str, parallel: bool = True, consult_all: bool = True):
+    """
+    Manages the hierarchical agent workflow for the Research Assistant tab.
+    The query is routed to the most relevant specialist by `route_query`
+    (locally, with the LLM supervisor only for ambiguous queries).
 
+    With `consult_all=False` only the chosen specialist is queried, so the tab
+    waits for one completion; use `run_other_specialists` for the rest. With
+    `consult_all=True` all six are queried, concurrently if `parallel=True`.
+    """
+    route = route_query(user_query)
+    decision = route["agent"]
+
+    if not consult_all:
+        system_prompt, task_prompt = SPECIALIST_AGENTS[decision]
+        responses = {decision: run_agent(system_prompt, user_query, task_prompt, AGENT_TIMEOUT_SECONDS)}
+    elif parallel:
+        responses = run_agents_concurrently(user_query, SPECIALIST_AGENTS)
+    else:
+        responses = {}
+        for name, (system_prompt, task_prompt) in SPECIALIST_AGENTS.items():
+            responses[name] = run_agent(system_prompt, user_query, task_prompt)
 
     return {
-        "supervisor_decision": cleaned_decision,
+        "supervisor_decision": decision,
+        "routing": route,
         "all_responses": responses
     }
 
@@ -209,66 +599,111 @@ team_members = [
     ),
 ]
 
-def initialize_team_discussion(agenda: str) -> List[Dict[str, str]]:
-    """Kicks off the simulated team meeting with the Principal Investigator's opening statement."""
+# Bounds for the team meeting. Each turn's prompt is the agenda, the rolling
+# meeting memory (at most MEETING_MEMORY_MAX_CHARS) and a fixed number of
+# excerpts of at most MEETING_EXCERPT_MAX_CHARS each. It therefore stays the same
+# size in round 10 as in round 2.
+MEETING_MEMORY_MAX_CHARS = 1500
+MEETING_EXCERPT_MAX_CHARS = 600
+MEETING_TURN_TIMEOUT_SECONDS = 90
+
+def run_meeting_turn(agent: Agent, prompt_text: str, timeout: float = MEETING_TURN_TIMEOUT_SECONDS) -> str:
+    """One agent's turn in the team meeting."""
     client = get_azure_openai_client()
     if not client:
-        return [{"agent": "Error", "message": "Azure OpenAI client is not available."}]
-
-    prompt_text = f"As the Principal Investigator, you are starting a team meeting. The research agenda is: '{agenda}'. Please provide your opening statement to the team. Outline the project's direction, key challenges, and your initial goals."
-    messages = [{"role": "system", "content": principal_investigator.prompt}, {"role": "user", "content": prompt_text}]
-
+        return "Error: Azure OpenAI client is not available."
+    messages = [{"role": "system", "content": agent.prompt}, {"role": "user", "content": prompt_text}]
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME, messages=messages, max_tokens=800, temperature=0.7
-        )
-        opening_statement = response.choices[0].message.content.strip()
+        return chat_completion("team_meeting", messages, max_tokens=800, temperature=0.7,
+                               client=client.with_options(timeout=timeout)).strip()
     except Exception as e:
-        opening_statement = f"Error generating Principal Investigator response: {e}"
+        return f"Error generating response for {agent.title}: {e}"
 
-    return [{"agent": "Principal Investigator", "message": opening_statement}]
+def run_team_meeting(agenda: str, num_rounds: int, summarize: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Runs a multi-round team meeting and yields each turn as soon as it is ready,
+    as a dict with "agent", "round" and "message" keys.
+    The Principal Investigator opens every round. The team members then answer
+    concurrently, all seeing the same state: the meeting memory plus the PI's
+    statement. A round therefore costs two completions, whatever the team size.
+    Members' turns are yielded in the order they finish. With `summarize`, the PI
+    closes the meeting with a summary turn whose round is "summary".
+    """
+    memory = MeetingMemory(agenda, max_chars=MEETING_MEMORY_MAX_CHARS)
+    team_names = ", ".join(member.title for member in team_members)
+    previous_round: List[Dict[str, Any]] = []
 
+    # Failed turns are shown to the user but kept out of the notes and recaps
+    # that later prompts are built from.
+    def remember(turn: Dict[str, Any]) -> None:
+        if not turn["message"].startswith("Error"):
+            memory.add(turn["agent"], turn["message"], turn["round"])
 
-def advance_team_discussion(discussion_history: List[Dict[str, str]], agenda: str, num_rounds: int) -> Dict[str, Any]:
-    """Advances the simulated team discussion by one turn for the next agent in line."""
-    client = get_azure_openai_client()
-    if not client:
-        return {"discussion_history": discussion_history, "is_complete": True}
-
-    full_agent_roster = [principal_investigator] + team_members
-    current_turn_number = len(discussion_history)
-    total_turns_per_round = len(full_agent_roster)
-    total_turns = num_rounds * total_turns_per_round
-
-    if current_turn_number >= total_turns:
-        return {"discussion_history": discussion_history, "is_complete": True}
-
-    next_agent_index = current_turn_number % total_turns_per_round
-    next_agent = full_agent_roster[next_agent_index]
-    current_round = (current_turn_number // total_turns_per_round) + 1
-    last_message = discussion_history[-1]["message"]
-    last_speaker = discussion_history[-1]["agent"]
-
-    prompt_text = (
-        f"The research agenda is: '{agenda}'.\n\n"
-        f"This is a multi-turn team discussion. Here is the most recent contribution:\n"
-        f"'{last_speaker} said: {last_message}'\n\n"
-        f"Now, as the {next_agent.title}, it is your turn to speak. Please provide your input for Round {current_round} of {num_rounds}. Build upon the previous points and offer your unique perspective."
-    )
-    messages = [{"role": "system", "content": next_agent.prompt}, {"role": "user", "content": prompt_text}]
+    def recap(turns: List[Dict[str, Any]]) -> str:
+        return "\n".join(f"- {turn['agent']}: {excerpt(turn['message'], MEETING_EXCERPT_MAX_CHARS)}"
+                         for turn in turns if not turn["message"].startswith("Error"))
 
+    executor = make_executor(max(1, len(team_members)))
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME, messages=messages, max_tokens=800, temperature=0.7
-        )
-        agent_response = response.choices[0].message.content.strip()
-    except Exception as e:
-        agent_response = f"Error generating response for {next_agent.title}: {e}"
-
-    discussion_history.append({"agent": next_agent.title, "message": agent_response})
-    is_complete = len(discussion_history) >= total_turns
-
-    return {"discussion_history": discussion_history, "is_complete": is_complete}
+        for round_number in range(1, num_rounds + 1):
+            if round_number == 1:
+                pi_prompt = (
+                    f"As the Principal Investigator, you are starting a team meeting. The research agenda is: '{agenda}'.\n\n"
+                    f"The meeting has {num_rounds} round(s) and your team is: {team_names}. "
+                    f"Provide your opening statement: outline the project's direction and key challenges, "
+                    f"and pose the specific questions each team member should address in this round."
+                )
+            else:
+                pi_prompt = (
+                    f"The research agenda is: '{agenda}'.\n\n"
+                    f"Meeting notes so far:\n{memory.render()}\n\n"
+                    f"In round {round_number - 1} your team said:\n{recap(previous_round)}\n\n"
+                    f"As the Principal Investigator, open round {round_number} of {num_rounds}: synthesize the team's input, "
+                    f"make decisions where they disagree, and pose focused follow-up questions for each team member."
+                )
+            pi_turn = {"agent": principal_investigator.title, "round": round_number,
+                       "message": run_meeting_turn(principal_investigator, pi_prompt)}
+            remember(pi_turn)
+            yield pi_turn
+
+            shared_state = (
+                f"The research agenda is: '{agenda}'.\n\n"
+                f"Meeting notes so far:\n{memory.render()}\n\n"
+                f"The Principal Investigator opened round {round_number} of {num_rounds} with:\n'{pi_turn['message']}'\n\n"
+            )
+            futures = {
+                executor.submit(run_meeting_turn, member, shared_state + (
+                    f"As the {member.title}, give your input for this round. Answer the questions addressed to you, "
+                    f"build on the notes and offer your unique perspective. Be specific and concise."
+                )): member
+                for member in team_members
+            }
+            finished: Dict[str, Dict[str, Any]] = {}
+            for future in concurrent.futures.as_completed(futures):
+                member = futures[future]
+                turn = {"agent": member.title, "round": round_number, "message": future.result()}
+                finished[member.title] = turn
+                yield turn
+
+            # Notes are added in roster order once the round is over, so the memory
+            # doesn't depend on which member happened to finish first.
+            previous_round = [finished[member.title] for member in team_members]
+            for turn in previous_round:
+                remember(turn)
+
+        if summarize and num_rounds > 0:
+            summary_prompt = (
+                f"The research agenda is: '{agenda}'.\n\n"
+                f"Meeting notes:\n{memory.render()}\n\n"
+                f"In the final round your team said:\n{recap(previous_round)}\n\n"
+                f"As the Principal Investigator, close the meeting with a summary: the key decisions made, "
+                f"the recommended next steps with an owner for each, and the open questions."
+            )
+            yield {"agent": principal_investigator.title, "round": "summary",
+                   "message": run_meeting_turn(principal_investigator, summary_prompt)}
+    finally:
+        # The caller may stop reading part-way (e.g. a Streamlit rerun); don't leave queued turns behind.
+        executor.shutdown(wait=False, cancel_futures=True)
 
 # Pre-defined nanobody sequences for the designer
 NANOBODY_SEQUENCES = {
@@ -302,65 +737,203 @@ def run_nanobody_designer(nanobody_name: str, design_goal: str) -> Dict[str, Any
     messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
 
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=1500,
-            temperature=0.7,
-            response_format={"type": "json_object"}
+        content = chat_completion(
+            "run_nanobody_designer", messages, max_tokens=1500, temperature=0.7, response_format={"type": "json_object"}
         )
-        content = response.choices[0].message.content
         data = extract_json(content)
         data['wildtype'] = wildtype_sequence
         return data
     except Exception as e:
         return {"error": f"Azure API Error during design generation: {e}"}
 
-def run_nanobody_analysis(sequences: List[str], wildtype_sequence: str) -> pd.DataFrame:
-    """Analyzes generated sequences using another AI agent to predict key biophysical metrics."""
+def run_nanobody_analysis(sequences: List[str], wildtype_sequence: str) -> "pd.DataFrame":
+    """
+    Scores generated sequences against the wildtype with the local biophysics engine.
+    The metrics are deterministic proxies computed in one vectorized batch
+    (see `biophysics.score_sequences`), so no API call is needed.
+    """
+    import pandas as pd
+    from biophysics import score_sequences
+
+    try:
+        scores = score_sequences([wildtype_sequence] + list(sequences), wildtype_sequence)
+        scores.insert(0, "name", ["wildtype"] + [f"designed_{i+1}" for i in range(len(sequences))])
+        return scores[['name', 'sequence', 'esm_llr', 'plddt', 'dG_separated']]
+    except Exception as e:
+        return pd.DataFrame([{"error": f"Error during local sequence analysis: {e}"}])
+
+# Most positions an AI agent may pick for a mutational scan.
+MAX_AI_SCAN_POSITIONS = 12
+
+def suggest_mutation_positions(nanobody_name: str, design_goal: str) -> Dict[str, Any]:
+    """Asks an AI agent which residues of the base nanobody to mutate for the design goal (1-based positions)."""
     client = get_azure_openai_client()
     if not client:
-        return pd.DataFrame([{"error": "Azure OpenAI client is not available."}])
+        return {"error": "Azure OpenAI client is not available."}
+
+    from biophysics import find_cdr_regions
 
-    sequences_str = "\n".join(sequences)
+    wildtype_sequence = NANOBODY_SEQUENCES[nanobody_name]
+    cdrs = {name: f"{region.start + 1}-{region.stop}" for name, region in find_cdr_regions(wildtype_sequence).items()}
     system_prompt = (
-        "You are a specialist in predicting biophysical properties of proteins from their amino acid sequence. "
-        "Your task is to predict three key metrics for a list of new nanobody sequences: "
-        "1. `esm_llr`: A log-likelihood ratio score from a protein language model, indicating biological plausibility. Higher is better. "
-        "2. `plddt`: A score from 0-100 indicating confidence in the predicted structure of the binding interface (interface pLDDT). Higher is better. "
-        "3. `dG_separated`: A score predicting binding energy to the target (Delta G). Lower (more negative) is better. "
-        "Return a single JSON object with one key: `analysis`, which is a list of objects. Each object must contain the `sequence`, `esm_llr`, `plddt`, and `dG_separated`."
+        "You are a specialist in antibody and nanobody engineering. "
+        "Your task is to choose the residue positions of a nanobody that are most promising to mutate for a given design goal. "
+        f"Return a single JSON object with one key: `positions`, a list of at most {MAX_AI_SCAN_POSITIONS} integers (1-based residue positions)."
+    )
+    user_prompt = (
+        f"The wildtype nanobody is {nanobody_name} with the sequence: '{wildtype_sequence}'.\n"
+        f"Its CDR regions (1-based, inclusive) are: {json.dumps(cdrs)}.\n\n"
+        f"The design goal is: '{design_goal}'."
     )
-    user_prompt = f"Please analyze the following sequences and provide the predicted metrics in the specified JSON format:\n{sequences_str}"
     messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
+    try:
+        content = chat_completion(
+            "suggest_mutation_positions", messages, max_tokens=300, temperature=0.2, response_format={"type": "json_object"}
+        )
+        positions = [int(p) for p in extract_json(content).get("positions", [])]
+        # Drop out-of-range and repeated positions, then keep the first MAX_AI_SCAN_POSITIONS in the agent's order.
+        positions = list(dict.fromkeys(p for p in positions if 1 <= p <= len(wildtype_sequence)))
+        return {"positions": positions[:MAX_AI_SCAN_POSITIONS]}
+    except Exception as e:
+        return {"error": f"Azure API Error while selecting mutation positions: {e}"}
+
+# Upper bound on the variants a single interactive scan may enumerate (~10 s of scoring).
+MAX_SCAN_VARIANTS = 2_000_000
+
+def run_nanobody_mutational_scan(nanobody_name: str, design_goal: str, max_order: int = 2, top_k: int = 20,
+                                 ai_positions: bool = False, ai_commentary: bool = False) -> Dict[str, Any]:
+    """
+    Runs a local in-silico mutagenesis campaign on a base nanobody.
+
+    All single up to `max_order`-fold substitutions are scored in vectorized
+    batches and the `top_k` variants are kept (see `biophysics.mutational_scan`).
+    By default every CDR position is scanned; with `ai_positions=True` an AI
+    agent picks the positions from the design goal instead. With
+    `ai_commentary=True` an AI agent also comments on the winning variants.
+    """
+    import pandas as pd
+    from biophysics import count_variants, find_cdr_regions, mutational_scan, score_sequences
+
+    if nanobody_name not in NANOBODY_SEQUENCES:
+        return {"error": "Selected base nanobody not found."}
+    wildtype_sequence = NANOBODY_SEQUENCES[nanobody_name]
+
+    positions = None
+    if ai_positions:
+        suggestion = suggest_mutation_positions(nanobody_name, design_goal)
+        if suggestion.get("error"):
+            return suggestion
+        positions = [p - 1 for p in suggestion["positions"]] or None
+
+    n_positions = len(positions) if positions else sum(r.stop - r.start for r in find_cdr_regions(wildtype_sequence).values())
+    if count_variants(n_positions, max_order) > MAX_SCAN_VARIANTS:
+        return {"error": f"A {max_order}-fold scan over {n_positions} positions exceeds {MAX_SCAN_VARIANTS:,} variants. Reduce the number of mutations per variant or let the AI choose fewer positions."}
 
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.1,
-            response_format={"type": "json_object"}
+        variants = mutational_scan(wildtype_sequence, positions=positions, max_order=max_order, top_k=top_k)
+    except Exception as e:
+        return {"error": f"Error during mutational scan: {e}"}
+
+    wildtype_row = score_sequences([wildtype_sequence], wildtype_sequence)
+    wildtype_row.insert(1, "mutations", "")
+    results = pd.concat([wildtype_row, variants], ignore_index=True)
+    results.insert(0, "name", ["wildtype"] + [f"variant_{i+1}" for i in range(len(variants))])
+    output = {
+        "results": results[['name', 'mutations', 'sequence', 'esm_llr', 'plddt', 'dG_separated']],
+        "variants_scored": variants.attrs.get("variants_scored", 0),
+        "wildtype": wildtype_sequence,
+    }
+
+    if ai_commentary and len(variants):
+        table = variants.head(10)[['mutations', 'esm_llr', 'plddt', 'dG_separated']].to_string(index=False)
+        output["commentary"] = run_agent(
+            "You are a specialist in protein and nanobody design.",
+            design_goal,
+            f"A mutational scan of the nanobody {nanobody_name} produced these top variants "
+            f"(esm_llr and plddt: higher is better; dG_separated: lower is better):\n{table}\n\n"
+            "Briefly comment on which variants look most promising for the design goal and why.",
         )
-        content = response.choices[0].message.content
-        data = extract_json(content)
-        df = pd.DataFrame(data.get("analysis", []))
-
-        # Add wildtype for comparison with plausible placeholder scores
-        wildtype_data = {
-            "name": "wildtype",
-            "sequence": wildtype_sequence,
-            "esm_llr": 0,  # LLR is a ratio vs wildtype, so it's 0 by definition
-            "plddt": np.random.uniform(85, 95), # Placeholder
-            "dG_separated": np.random.uniform(-30, -25) # Placeholder
-        }
-        df['name'] = [f"designed_{i+1}" for i in range(len(df))]
+    return output
+
+# --- Uploaded datasets for Module 3 ---
+
+@st.cache_resource
+def get_dataset_store() -> "DatasetStore":
+    """Returns the process-wide store of uploaded CSVs (columnar, memory-mapped, keyed by content hash)."""
+    from dataset_store import DatasetStore
 
-        # Combine and reorder columns for clarity
-        final_df = pd.concat([pd.DataFrame([wildtype_data]), df], ignore_index=True)
-        return final_df[['name', 'sequence', 'esm_llr', 'plddt', 'dG_separated']]
+    return DatasetStore(CACHE_DIR / "datasets")
+
+def ingest_uploaded_dataset(uploaded_file: Any) -> Any:
+    """
+    Converts an uploaded CSV into the dataset store and returns its `DatasetHandle`,
+    or {"error": ...} if the file can't be parsed. Identical bytes are converted only once.
+    """
+    try:
+        return get_dataset_store().ingest(uploaded_file, name=getattr(uploaded_file, "name", None))
     except Exception as e:
-        return pd.DataFrame([{"error": f"Azure API Error during analysis: {e}"}])
+        return {"error": f"Error reading file: {e}"}
+
+def _dataset_error(e: Exception) -> Dict[str, str]:
+    if isinstance(e, FileNotFoundError):
+        return {"error": "This dataset is no longer in the cache. Please upload the file again."}
+    return {"error": f"Column not found in the dataset: {e}"}
+
+# The cached helpers below raise, rather than return an error, when the dataset
+# file was pruned from the cache or a column is missing, so that the error isn't
+# cached: uploading the same file again restores the same key.
+@st.cache_data(max_entries=32, show_spinner=False)
+def _correlation_plot(dataset_key: str, x_column: str, y_column: str) -> Dict[str, Any]:
+    from correlation import correlation_plot_png
+
+    store = get_dataset_store()
+    data = store.load(store.open(dataset_key), [x_column, y_column])
+    try:
+        return correlation_plot_png(data[x_column], data[y_column], x_column, y_column)
+    except ValueError as e:
+        return {"error": str(e)}
+
+def render_correlation_plot(dataset_key: str, x_column: str, y_column: str) -> Dict[str, Any]:
+    """
+    Plots one column of a stored dataset against another, with a least-squares fit
+    and its confidence band. Returns the PNG and the fit statistics, or {"error": ...}.
+    Cached per (dataset, x, y), so switching back to an earlier pair of axes is free.
+    """
+    try:
+        return _correlation_plot(dataset_key, x_column, y_column)
+    except (FileNotFoundError, KeyError) as e:
+        return _dataset_error(e)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _dataset_correlations(dataset_key: str) -> Dict[str, Any]:
+    from correlation import SCREEN_BLOCK_ROWS, correlation_heatmap_png, screen_correlations
+
+    store = get_dataset_store()
+    dataset = store.open(dataset_key)
+    columns = dataset.numeric_columns
+    if len(columns) < 2:
+        return {"error": "Screening needs at least two numeric columns."}
+    try:
+        result = screen_correlations(
+            lambda: store.iter_blocks(dataset, columns, SCREEN_BLOCK_ROWS),
+            lambda names: store.load(dataset, names).to_numpy(dtype="float64"),
+            columns, dataset.rows,
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"table": result["table"], "heatmap_png": correlation_heatmap_png(result["pearson"], columns, result["order"])}
+
+def screen_dataset_correlations(dataset_key: str) -> Dict[str, Any]:
+    """
+    Pearson and Spearman correlations with p-values and FDR q-values for every pair
+    of numeric columns in a stored dataset, plus a clustered heatmap. The data is
+    streamed from the mapped file in row blocks. Returns {"table", "heatmap_png"}
+    or {"error": ...}. Cached per dataset.
+    """
+    try:
+        return _dataset_correlations(dataset_key)
+    except (FileNotFoundError, KeyError) as e:
+        return _dataset_error(e)
 
 # --- Logic for Tab 5: Molecule Structure Prediction ---
 
@@ -378,41 +951,104 @@ def fetch_protein_data(disease: str) -> Dict:
     messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": f"Disease: {disease}"}]
 
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=800,
-            temperature=0.1,
-            response_format={"type": "json_object"}
+        content = chat_completion(
+            "fetch_protein_data", messages, max_tokens=800, temperature=0.1, response_format={"type": "json_object"}
         )
-        content = response.choices[0].message.content
         return extract_json(content)
     except Exception as e:
         return {"error": f"Azure API Error: {e}"}
 
-def generate_3d_protein_structure(uniprot_id: str):
-    """Generates an interactive 3D protein structure viewer from a UniProt ID using the AlphaFold database."""
-    try:
-        # Fetch PDB data from AlphaFold's public database
-        alphafold_url = f"https://alphafold.ebi.ac.uk/files/AF-{uniprot_id}-F1-model_v4.pdb"
-        res = requests.get(alphafold_url)
-        if res.status_code == 404:
-            return {"error": f"No 3D structure available from AlphaFold for UniProt ID {uniprot_id}."}
-        res.raise_for_status() # Raise an exception for other HTTP errors
-        pdb_content = res.text
-
-        # Create an interactive 3D viewer using py3Dmol
-        viewer = py3Dmol.view(width=800, height=400)
-        viewer.addModel(pdb_content, "pdb")
+@st.cache_resource
+def get_structure_store() -> "AlphaFoldStructureStore":
+    """Returns the process-wide AlphaFold structure store (pooled session + disk cache)."""
+    from structure_store import ALPHAFOLD_BASE_URL, AlphaFoldStructureStore
+
+    return AlphaFoldStructureStore(
+        CACHE_DIR / "alphafold",
+        base_url=st.secrets.get("ALPHAFOLD_BASE_URL", ALPHAFOLD_BASE_URL),
+        telemetry=get_telemetry(),
+    )
+
+def prefetch_protein_structures(uniprot_ids: List[str]) -> Dict[str, Any]:
+    """Downloads the AlphaFold structures for all IDs concurrently so rendering only reads from disk."""
+    return get_structure_store().prefetch(uniprot_ids)
+
+# Structures with more atoms than this are rendered as a reduced-detail C-alpha
+# trace, which keeps the embedded viewer HTML small for 1000+ residue proteins.
+VIEWER_MAX_ATOMS = 4000
+
+def _build_protein_viewer(uniprot_id: str, max_atoms: Optional[int]) -> Tuple[Any, str, int]:
+    """
+    Fetches the AlphaFold model (served from disk after the first download), reduces
+    it once if it has more than `max_atoms` atoms and builds the py3Dmol viewer.
+    Returns the viewer, the detail mode and the full model's atom count.
+    """
+    import py3Dmol
+    from structure_store import reduce_pdb_detail
+
+    pdb_content = get_structure_store().get(uniprot_id)
+    pdb_content, mode, atoms = reduce_pdb_detail(pdb_content, max_atoms if max_atoms is not None else float("inf"))
+
+    # Create an interactive 3D viewer using py3Dmol
+    viewer = py3Dmol.view(width=800, height=400)
+    viewer.addModel(pdb_content, "pdb")
+    if mode == "full":
         viewer.setStyle({"cartoon": {"color": "spectrum"}})
-        viewer.zoomTo()
-        return viewer
+    else:
+        viewer.setStyle({"cartoon": {"style": "trace", "color": "spectrum"}})
+    viewer.zoomTo()
+    return viewer, mode, atoms
+
+def generate_3d_protein_structure(uniprot_id: str, max_atoms: int = None):
+    """
+    Generates an interactive 3D protein structure viewer from a UniProt ID using the AlphaFold database.
+    If `max_atoms` is given, larger structures are reduced to a C-alpha trace before rendering.
+    """
+    from structure_store import StructureNotFound
+
+    try:
+        return _build_protein_viewer(uniprot_id, max_atoms)[0]
+    except StructureNotFound as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"An error occurred while fetching the 3D structure for {uniprot_id}: {e}"}
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _protein_viewer_html(uniprot_id: str, max_atoms: int) -> Dict[str, Any]:
+    # Errors propagate, which keeps them out of st.cache_data so they are retried next time.
+    viewer, mode, atoms = _build_protein_viewer(uniprot_id, max_atoms)
+    return {"html": viewer._make_html(), "mode": mode, "atoms": atoms}
+
+def get_protein_viewer_html(uniprot_id: str, max_atoms: int = VIEWER_MAX_ATOMS) -> Dict[str, Any]:
+    """
+    Returns memoized viewer HTML for a structure, so reruns don't rebuild (or
+    re-send a new copy of) the viewer. The dict has `html`, `mode` ("full",
+    "ca_trace" or "ca_downsampled") and the full model's `atoms` count, or `error`.
+    """
+    from structure_store import StructureNotFound
+
+    try:
+        return _protein_viewer_html(uniprot_id, max_atoms)
+    except StructureNotFound as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"An error occurred while fetching the 3D structure for {uniprot_id}: {e}"}
 
 # --------------------------------------------------------------------------
 # --- 4. LOGIC FOR NEW TAB: AI Research Report ---
 # --------------------------------------------------------------------------
+# Every section's research, writer call and edit, and the global edit pass,
+# are memoized by a hash of their inputs (see report_memo.py), so a report
+# whose question or outline was edited is regenerated by re-running only the
+# steps the edit affected (`regenerate_report`). Memoized outputs belong to one
+# report: the functions below take a `report_id` (a new one for every new
+# report), and `report_id=None` runs every step afresh.
+
+@st.cache_resource
+def get_stage_memo() -> StageMemo:
+    """Returns the process-wide store of report stage outputs shared by all sessions."""
+    return StageMemo(CACHE_DIR / "report_stages.sqlite3")
+
 def get_web_research_summary(query: str) -> str:
     """
     Simulates fetching additional web research by using the LLM to summarize
@@ -425,13 +1061,8 @@ def get_web_research_summary(query: str) -> str:
     system_prompt = "You are a web research assistant. Your goal is to provide a concise summary of the most important, recent findings and key concepts related to the user's query. Focus on information that would be relevant for a scientific report."
     messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": query}]
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.3
-        )
-        return response.choices[0].message.content.strip()
+        content = chat_completion("get_web_research_summary", messages, max_tokens=1000, temperature=0.3)
+        return content.strip()
     except Exception as e:
         return f"Error during web research simulation: {e}"
 
@@ -464,64 +1095,158 @@ def run_outline_agent(research_question: str, additional_research: str) -> Dict:
     """
     messages = [{"role": "user", "content": prompt}]
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.2,
-            response_format={"type": "json_object"}
+        content = chat_completion(
+            "run_outline_agent", messages, max_tokens=2000, temperature=0.2, response_format={"type": "json_object"}
         )
-        content = response.choices[0].message.content
         return extract_json(content)
     except Exception as e:
         return {"error": f"Error with Outline Agent: {e}"}
 
-def run_research_agent(research_question: str, outline: str) -> str:
-    """
-    Calls the Research Agent to gather information with CLICKABLE citations.
-    """
-    client = get_azure_openai_client()
-    if not client:
-        return "Error: Azure OpenAI client is not available."
-
-    prompt = f"""
-    You respond in markdown. Conduct comprehensive interdisciplinary research on: {research_question}.
-    For each subsection in the provided outline, gather key facts, definitions, and recent findings (2020–2025) from reliable scientific sources (e.g., PubMed, Nature, Google Scholar).
+# Research is gathered per section, in parallel, so an outline edit only
+# re-gathers the sections it touched and every other section's writer keeps
+# exactly the same research. Each section's notes are assembled under a
+# "## <section>" heading, like the draft, followed by one reference list
+# compiled from the sections' in-text citations. The sections share the output
+# budget of the single research call they replace (RESEARCH_TOKEN_BUDGET), so
+# spend doesn't grow with the number of sections beyond a per-section floor.
+RESEARCH_MAX_WORKERS = 4
+RESEARCH_TOKEN_BUDGET = 4000
+RESEARCH_MIN_SECTION_TOKENS = 800
+RESEARCH_REFERENCES_TITLE = "Compiled References"
+
+def research_section_tokens(n_sections: int) -> int:
+    """The output token cap of each section's research call."""
+    return max(RESEARCH_MIN_SECTION_TOKENS, RESEARCH_TOKEN_BUDGET // max(n_sections, 1))
+
+def _research_agent_prompt(research_question: str, section: str, section_outline: str) -> str:
+    """Builds the Research Agent prompt for one section of the outline."""
+    return f"""
+    You respond in markdown. Conduct comprehensive interdisciplinary research for the '{section}' section of a report on: {research_question}.
+    For each subsection in the provided section outline, gather key facts, definitions, and recent findings (2020–2025) from reliable scientific sources (e.g., PubMed, Nature, Google Scholar).
     
     CRITICAL REQUIREMENT: For each piece of information, you MUST provide an in-text citation formatted as a clickable markdown link: `[Author, Year](URL)`. 
     The URL must be a direct, public link to the source (e.g., a PubMed, DOI, or arXiv link). Ensure every URL is valid.
     
-    Return a structured summary organized by the outline's subsections.
-    The output MUST include a final 'References' section at the end, listing the full citation and the clickable URL for every source used.
+    Return a structured summary organized by the section's subsections, using `###` headings.
+    Do NOT add a references list at the end: one is compiled for the whole report from your in-text citations.
     
-    Here's the outline for your reference:
-    {outline}
+    Here's the outline of the section:
+    {section_outline}
 
     - Ensure all citation URLs are real and lead to the source article.
     - Prioritize peer-reviewed research published in the last 5 years.
     - Be thorough and detailed in your research for each subsection.
     """
-    messages = [{"role": "user", "content": prompt}]
-    try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=4000, # Increased tokens for detailed research
-            temperature=0.3
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Error with Research Agent: {e}"
 
-def run_writer_agent(section: str, section_outline: str, research_data: str) -> str:
+def run_research_agent(research_question: str, section: str, section_outline: str,
+                       max_tokens: int = RESEARCH_MIN_SECTION_TOKENS) -> str:
     """
-    Calls the Writer Agent to generate VERBOSE content for a specific section.
+    Calls the Research Agent to gather information with CLICKABLE citations for one section.
     """
     client = get_azure_openai_client()
     if not client:
         return "Error: Azure OpenAI client is not available."
 
-    prompt = f"""
+    messages = [{"role": "user", "content": _research_agent_prompt(research_question, section, section_outline)}]
+    try:
+        content = chat_completion("run_research_agent", messages, max_tokens=max_tokens, temperature=0.3)
+        return content.strip()
+    except Exception as e:
+        return f"Error with Research Agent for section '{section}': {e}"
+
+def research_stage_inputs(research_question: str, outline: Dict, section: str) -> List[Any]:
+    """What a section's research is keyed on: the question, the section title and its own outline subtree."""
+    return [research_question, section, get_section_outline(outline, section)]
+
+def compile_references(texts: List[str]) -> str:
+    """The "## Compiled References" block: every distinct citation in `texts`, in order of first appearance."""
+    citations = list(dict.fromkeys(citation for text in texts for citation in extract_citations(text)))
+    return f"## {RESEARCH_REFERENCES_TITLE}\n\n" + "\n".join(f"- {citation}" for citation in citations)
+
+def split_research_sections(research: str, sections: List[str]) -> Dict[str, str]:
+    """Splits research assembled by `ResearchStream` into its sections' notes, without the compiled references."""
+    split = split_draft_sections(research, sections + [RESEARCH_REFERENCES_TITLE])
+    split.pop(RESEARCH_REFERENCES_TITLE, None)
+    return split
+
+class ResearchStream:
+    """
+    Gathers research for every section of an outline in parallel and yields it
+    as one markdown document in outline order: the first section streams as it
+    is generated while the others are gathered behind it. The document ends
+    with the references compiled from all sections (see `compile_references`).
+
+    Each section is memoized by `research_stage_inputs` under `report_id`. Once
+    iteration finishes, `text` holds the assembled research (or the first
+    "Error..." message if a section failed), and `reused` / `rerun` list the
+    sections taken from the memo and gathered again.
+    """
+    def __init__(self, research_question: str, outline: Dict, report_id: str = None,
+                 max_workers: int = RESEARCH_MAX_WORKERS) -> None:
+        self.research_question = research_question
+        self.outline = outline
+        self.report_id = report_id
+        self.max_workers = max_workers
+        self.max_tokens = research_section_tokens(len(outline.get('sections', [])))
+        self.text = None
+        self.sections: Dict[str, str] = {}
+        self.reused: List[str] = []
+        self.rerun: List[str] = []
+
+    def _gather(self, section: str, deltas: "queue.Queue") -> "CompletionStream":
+        section_outline = get_section_outline(self.outline, section)
+        messages = [{"role": "user", "content": _research_agent_prompt(self.research_question, section, section_outline)}]
+        stream = CompletionStream("run_research_agent", messages, self.max_tokens, 0.3,
+                                  f"Error with Research Agent for section '{section}': ", stage="research",
+                                  stage_inputs=research_stage_inputs(self.research_question, self.outline, section),
+                                  report_id=self.report_id)
+        try:
+            for delta in stream:
+                deltas.put(delta)
+        except Exception as e:
+            stream.text = f"Error with Research Agent for section '{section}': {e}"
+        finally:
+            deltas.put(None)
+        return stream
+
+    def __iter__(self) -> Iterator[str]:
+        sections = list(self.outline.get('sections', []))
+        deltas = {section: queue.Queue() for section in sections}
+        executor = make_executor(max(1, min(self.max_workers, len(sections))))
+        try:
+            futures = {section: executor.submit(self._gather, section, deltas[section]) for section in sections}
+            for n, section in enumerate(sections):
+                yield ("" if n == 0 else "\n\n") + f"## {section}\n\n"
+                while (delta := deltas[section].get()) is not None:
+                    yield delta
+                stream = futures[section].result()
+                self.sections[section] = stream.text
+                (self.reused if stream.reused else self.rerun).append(section)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        errors = [text for text in self.sections.values() if not text or text.startswith("Error")]
+        if errors:
+            self.text = errors[0] or "Error with Research Agent: no research was returned."
+            return
+        references = compile_references(list(self.sections.values()))
+        yield f"\n\n{references}"
+        self.text = "\n\n".join(
+            [f"## {section}\n\n{text}" for section, text in self.sections.items()] + [references])
+
+def get_research(research_question: str, outline: Dict, report_id: str = None) -> Dict[str, Any]:
+    """
+    Blocking version of `ResearchStream`. Returns `research` (or an "Error..."
+    string) and the sections whose research was `reused` and `rerun`.
+    """
+    stream = ResearchStream(research_question, outline, report_id)
+    for _ in stream:
+        pass
+    return {"research": stream.text, "reused": stream.reused, "rerun": stream.rerun}
+
+def _writer_agent_prompt(section: str, section_outline: str, research_data: str) -> str:
+    """Builds the Writer Agent prompt."""
+    return f"""
     You respond in markdown. Your task is to act as a scientific writer and generate a VERBOSE, DETAILED, and COMPREHENSIVE section for a research report on '{section}'.
     
     CRITICAL REQUIREMENT: Use the supplied research data to produce **at least 300-500 words of scientifically accurate, multi-paragraph content for EACH subsection.** Do NOT write short summaries; your primary goal is depth, detail, and providing a full explanation.
@@ -537,27 +1262,234 @@ def run_writer_agent(section: str, section_outline: str, research_data: str) ->
     Here's the research data, including clickable citations, for you to use:
     {research_data}
     """
-    messages = [{"role": "user", "content": prompt}]
-    try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=4000, # Increased tokens for verbose writing
-            temperature=0.5
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Error with Writer Agent for section '{section}': {e}"
 
-def run_editor_agent(research_question: str, draft_report: str) -> str:
+def run_writer_agent(section: str, section_outline: str, research_data: str) -> str:
     """
-    Calls the Editor Agent to review and polish the complete draft report.
+    Calls the Writer Agent to generate VERBOSE content for a specific section.
     """
     client = get_azure_openai_client()
     if not client:
         return "Error: Azure OpenAI client is not available."
 
-    prompt = f"""
+    messages = [{"role": "user", "content": _writer_agent_prompt(section, section_outline, research_data)}]
+    try:
+        content = chat_completion("run_writer_agent", messages, max_tokens=4000, temperature=0.5)  # Increased tokens for verbose writing
+        return content.strip()
+    except Exception as e:
+        return f"Error with Writer Agent for section '{section}': {e}"
+
+# Number of sections written at once by the parallel writer, and how many
+# extra attempts a failed section gets before the draft is reported as incomplete.
+WRITER_MAX_WORKERS = 4
+WRITER_MAX_RETRIES = 2
+# How often a streaming writer checks for finished sections while it waits for text.
+WRITER_PROGRESS_POLL_SECONDS = 0.25
+
+def get_section_outline(outline: Dict, section: str) -> str:
+    """Returns the JSON outline details (subsections and descriptions) for one report section."""
+    section_outline_details = {
+        "subsections": outline.get('subsections', {}).get(section, []),
+        "descriptions": outline.get('descriptions', {}).get(section, {}),
+    }
+    return json.dumps(section_outline_details)
+
+def writer_stage_inputs(outline: Dict, research_data: str, retrieval: bool = True) -> Dict[str, List[Any]]:
+    """
+    The Writer Agent's arguments for every section, which are also what its
+    output is memoized on: the section title, its outline and its research
+    context (see `run_writer_agents_parallel`).
+    """
+    sections = outline.get('sections', [])
+    notes = split_research_sections(research_data, sections)
+    if set(notes) == set(sections):
+        # Each section only searches its own notes, so editing one section
+        # leaves the other sections' context (and memoized text) unchanged.
+        section_research = {section: f"{notes[section]}\n\n{compile_references([notes[section]])}" for section in sections}
+    else:
+        section_research = {section: research_data for section in sections}
+    if retrieval:
+        indexes = {document: ResearchIndex(document) for document in set(section_research.values())}
+        section_research = {
+            section: indexes[section_research[section]].context_for(f"{section} {get_section_outline(outline, section)}")
+            for section in sections
+        }
+    return {section: [section, get_section_outline(outline, section), section_research[section]] for section in sections}
+
+def run_writer_agents_parallel(outline: Dict, research_data: str, max_workers: int = WRITER_MAX_WORKERS,
+                               max_retries: int = WRITER_MAX_RETRIES, on_section_complete=None,
+                               retrieval: bool = True, report_id: str = None) -> Dict[str, Any]:
+    """
+    Writes every section of the outline concurrently with the Writer Agent.
+    Sections of report `report_id` whose outline and research context were
+    written before are reused from the stage memo instead (listed in `reused`).
+
+    Each section's writer draws on that section's notes from the research
+    assembled by `ResearchStream`, with the compiled References entries they
+    cite (or on the whole document, for research without per-section notes).
+    With `retrieval=True` it only receives the chunks of those notes that match
+    its outline, plus the References entries they cite (see
+    `report_retrieval.ResearchIndex`).
+
+    At most `max_workers` sections are in flight at once. Sections that fail are
+    retried (only those sections) up to `max_retries` more times.
+    `on_section_complete(section, completed, total)` is called from the calling
+    thread each time a section succeeds, e.g. to drive `st.progress`.
+
+    Returns a dict with `sections` (title -> content, in outline order), `errors`
+    (title -> last error for sections that never succeeded), `reused` (titles
+    taken from the memo) and `draft`, the assembled markdown draft, which is
+    None if any section is missing.
+    """
+    sections = outline.get('sections', [])
+    contents: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    memo = get_stage_memo()
+    inputs = writer_stage_inputs(outline, research_data, retrieval)
+    for section in sections:
+        stored = memo.get(report_id, "writer", inputs[section])
+        if stored is not None:
+            contents[section] = stored
+            if on_section_complete:
+                on_section_complete(section, len(contents), len(sections))
+    reused = list(contents)
+    pending = [section for section in sections if section not in contents]
+
+    executor = make_executor(max(1, min(max_workers, len(pending) or 1)))
+    try:
+        for _ in range(max_retries + 1):
+            if not pending:
+                break
+            futures = {executor.submit(run_writer_agent, *inputs[section]): section for section in pending}
+            pending = []
+            for future in concurrent.futures.as_completed(futures):
+                section = futures[future]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    content = f"Error with Writer Agent for section '{section}': {e}"
+                if content.startswith("Error"):
+                    errors[section] = content
+                    pending.append(section)
+                    continue
+                errors.pop(section, None)
+                contents[section] = content
+                memo.set(report_id, "writer", inputs[section], content)
+                if on_section_complete:
+                    on_section_complete(section, len(contents), len(sections))
+            # Retry in outline order so reruns are predictable.
+            pending.sort(key=sections.index)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    ordered = {section: contents[section] for section in sections if section in contents}
+    draft = None
+    if sections and not errors:
+        draft = "".join(f"\n\n## {section}\n\n{content}" for section, content in ordered.items())
+    return {"draft": draft, "sections": ordered, "errors": errors, "reused": reused}
+
+class WriterStream:
+    """
+    Streaming version of `run_writer_agents_parallel`: writes every section
+    concurrently and yields the draft in outline order. The first section
+    streams as it is generated while the others are written behind it.
+
+    Sections are memoized like the blocking writer's. A section whose request
+    fails before any of its text was shown is retried up to `max_retries` more
+    times. `on_section_complete(section, completed, total)` is called from the
+    iterating thread as each section succeeds, in the order they finish, e.g. to
+    drive `st.progress` next to the stream. Once iteration finishes, `draft`,
+    `sections`, `errors` and `reused` hold what `run_writer_agents_parallel`
+    would have returned.
+    """
+    def __init__(self, outline: Dict, research_data: str, report_id: str = None,
+                 max_workers: int = WRITER_MAX_WORKERS, max_retries: int = WRITER_MAX_RETRIES,
+                 retrieval: bool = True, on_section_complete=None) -> None:
+        self.outline = outline
+        self.report_id = report_id
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.on_section_complete = on_section_complete
+        self.inputs = writer_stage_inputs(outline, research_data, retrieval)
+        self.draft = None
+        self.sections: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.reused: List[str] = []
+        self._finished: List[str] = []
+        self._completed = 0
+
+    def _report_progress(self, futures: Dict[str, concurrent.futures.Future]) -> None:
+        for section, future in futures.items():
+            if section in self._finished or not future.done():
+                continue
+            self._finished.append(section)
+            text = future.result().text
+            if text and not text.startswith("Error"):
+                self._completed += 1
+                if self.on_section_complete:
+                    self.on_section_complete(section, self._completed, len(futures))
+
+    def _write(self, section: str, deltas: "queue.Queue") -> "CompletionStream":
+        messages = [{"role": "user", "content": _writer_agent_prompt(*self.inputs[section])}]
+        try:
+            for attempt in range(self.max_retries + 1):
+                stream = CompletionStream("run_writer_agent", messages, 4000, 0.5,
+                                          f"Error with Writer Agent for section '{section}': ", stage="writer",
+                                          stage_inputs=self.inputs[section], report_id=self.report_id)
+                # Hold back the latest delta: if the request fails, it is the error message.
+                shown, held = False, None
+                for delta in stream:
+                    if held is not None:
+                        deltas.put(held)
+                        shown = True
+                    held = delta
+                if stream.text and not stream.text.startswith("Error"):
+                    break
+                if shown or attempt == self.max_retries:
+                    break
+            if held is not None:
+                deltas.put(held)
+        except Exception as e:
+            stream.text = f"Error with Writer Agent for section '{section}': {e}"
+        finally:
+            deltas.put(None)
+        return stream
+
+    def __iter__(self) -> Iterator[str]:
+        sections = list(self.outline.get('sections', []))
+        deltas = {section: queue.Queue() for section in sections}
+        executor = make_executor(max(1, min(self.max_workers, len(sections))))
+        try:
+            futures = {section: executor.submit(self._write, section, deltas[section]) for section in sections}
+            for n, section in enumerate(sections):
+                yield ("" if n == 0 else "\n\n") + f"## {section}\n\n"
+                while True:
+                    try:
+                        delta = deltas[section].get(timeout=WRITER_PROGRESS_POLL_SECONDS)
+                    except queue.Empty:
+                        # Sections further down may finish while this one streams.
+                        self._report_progress(futures)
+                        continue
+                    if delta is None:
+                        break
+                    yield delta
+                stream = futures[section].result()
+                self._report_progress(futures)
+                if not stream.text or stream.text.startswith("Error"):
+                    self.errors[section] = stream.text or f"Error with Writer Agent for section '{section}': no text was returned."
+                    continue
+                self.sections[section] = stream.text
+                if stream.reused:
+                    self.reused.append(section)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if sections and not self.errors:
+            self.draft = "".join(f"\n\n## {section}\n\n{content}" for section, content in self.sections.items())
+
+def _editor_agent_prompt(research_question: str, draft_report: str) -> str:
+    """Builds the Editor Agent prompt shared by the blocking and streaming variants."""
+    return f"""
     You respond in markdown. Review and edit the complete research report for: {research_question}. 
     Ensure logical flow, consistency, clarity, grammar, and scientific accuracy. 
     Strengthen the integration between sections (e.g., link Literature Review findings to Results). 
@@ -570,15 +1502,399 @@ def run_editor_agent(research_question: str, draft_report: str) -> str:
     Here's the draft report:
     {draft_report}
     """
+
+def run_editor_agent(research_question: str, draft_report: str) -> str:
+    """
+    Calls the Editor Agent to review and polish the complete draft report.
+    """
+    client = get_azure_openai_client()
+    if not client:
+        return "Error: Azure OpenAI client is not available."
+
+    messages = [{"role": "user", "content": _editor_agent_prompt(research_question, draft_report)}]
+    try:
+        content = chat_completion("run_editor_agent", messages, max_tokens=4000, temperature=0.3)  # Increased tokens for editing the full report
+        return content.strip()
+    except Exception as e:
+        return f"Error with Editor Agent: {e}"
+
+# --- Map-reduce editing for long reports ---
+# A single editor call cannot return a report longer than its 4000-token
+# output cap, so long drafts are edited section by section in parallel (map)
+# and then a short global pass adds cross-section links and strengthens the
+# Conclusion (reduce).
+
+# Drafts longer than this (in characters) are edited section by section.
+EDITOR_SINGLE_PASS_MAX_CHARS = 12000
+EDITOR_MAX_WORKERS = 4
+
+_CITATION_PATTERN = re.compile(r"\[[^\]]+\]\(https?://[^)\s]+\)")
+
+def extract_citations(text: str) -> List[str]:
+    """Returns every `[Author, Year](URL)` citation in the text, in order of appearance."""
+    return _CITATION_PATTERN.findall(text)
+
+def split_draft_sections(draft_report: str, sections: List[str]) -> Dict[str, str]:
+    """
+    Splits a draft assembled by the writer ("## <section>" blocks in outline
+    order) back into its sections. Only the given titles are used as
+    boundaries, so headings inside a section's content are left alone.
+    """
+    positions = []
+    search_from = 0
+    for section in sections:
+        marker = f"## {section}\n"
+        index = draft_report.find(marker, search_from)
+        if index < 0:
+            continue
+        positions.append((section, index, index + len(marker)))
+        search_from = index + len(marker)
+    result = {}
+    for n, (section, _, content_start) in enumerate(positions):
+        content_end = positions[n + 1][1] if n + 1 < len(positions) else len(draft_report)
+        result[section] = draft_report[content_start:content_end].strip()
+    return result
+
+def summarize_section(text: str, max_chars: int = 600) -> str:
+    """A cheap extractive summary (leading sentences, markdown headings dropped) used as neighbour context."""
+    lines = [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
+    summary = " ".join(lines)
+    if len(summary) <= max_chars:
+        return summary
+    cut = summary.rfind(". ", 0, max_chars)
+    return summary[:cut + 1] if cut > 0 else summary[:max_chars] + "..."
+
+def run_section_editor_agent(research_question: str, outline_text: str, section: str, section_text: str,
+                             previous_summary: str, next_summary: str) -> str:
+    """Calls the Editor Agent on a single report section, with the outline and neighbouring sections as context."""
+    client = get_azure_openai_client()
+    if not client:
+        return "Error: Azure OpenAI client is not available."
+
+    prompt = f"""
+    You respond in markdown. You are editing ONE section, '{section}', of a research report on: {research_question}.
+    Ensure logical flow, consistency, clarity, grammar, and scientific accuracy within the section, and make it connect
+    naturally to the sections before and after it. Keep its length and depth; do not summarize it.
+
+    CRITICAL REQUIREMENT: Preserve every clickable in-text citation `[Author, Year](URL)` exactly as written.
+
+    Return ONLY the edited content of '{section}', without the section title.
+
+    The report outline:
+    {outline_text}
+
+    Summary of the previous section:
+    {previous_summary or "(this is the first section)"}
+
+    Summary of the next section:
+    {next_summary or "(this is the last section)"}
+
+    The section to edit:
+    {section_text}
+    """
+    messages = [{"role": "user", "content": prompt}]
+    try:
+        content = chat_completion("run_section_editor_agent", messages, max_tokens=4000, temperature=0.3)
+        return content.strip()
+    except Exception as e:
+        return f"Error with Editor Agent for section '{section}': {e}"
+
+def run_global_editor_pass(research_question: str, section_summaries: Dict[str, str], conclusion_section: str,
+                           conclusion_text: str) -> Dict[str, Any]:
+    """
+    The reduce step: returns bridging sentences to append to sections
+    (`transitions`) and, if the report has a Conclusion, a strengthened version of it.
+    """
+    summaries = "\n".join(f"- {section}: {summary}" for section, summary in section_summaries.items())
+    prompt = f"""
+    You are the final editor of a research report on: {research_question}.
+    Here is a summary of each section, in order:
+    {summaries}
+
+    1. For sections whose findings should be linked to a later section (e.g., Literature Review findings to Results),
+       write one or two bridging sentences to append at the end of that section.
+    2. Rewrite the Conclusion so that it clearly summarizes the key findings and gives actionable recommendations
+       for future research. Preserve every clickable citation `[Author, Year](URL)` in it exactly as written.
+
+    Return a JSON object with two keys: `transitions` (an object mapping section titles to bridging text) and
+    `conclusion` (the rewritten Conclusion in markdown, without its title, or an empty string if there is none).
+
+    The current Conclusion ('{conclusion_section}'):
+    {conclusion_text or "(none)"}
+    """
     messages = [{"role": "user", "content": prompt}]
     try:
-        response = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=messages,
-            max_tokens=4000, # Increased tokens for editing the full report
-            temperature=0.3
+        content = chat_completion(
+            "run_global_editor_pass", messages, max_tokens=2000, temperature=0.3, response_format={"type": "json_object"}
         )
-        return response.choices[0].message.content.strip()
+        return extract_json(content)
     except Exception as e:
-        return f"Error with Editor Agent: {e}"
+        return {"error": f"Error with Editor Agent (global pass): {e}"}
 
+def run_editor_agents_parallel(research_question: str, outline: Dict, draft_report: str, max_workers: int = EDITOR_MAX_WORKERS,
+                               on_section_complete=None, report_id: str = None) -> Dict[str, Any]:
+    """
+    Edits a long draft with a map-reduce pass: every section is edited in
+    parallel with the outline and its neighbours' summaries as context, then a
+    short global pass adds cross-section links and rewrites the Conclusion.
+
+    Section order is kept, and an edited section (or Conclusion) that loses any
+    citation of the draft is discarded in favour of the draft text.
+    Section edits and the global pass of report `report_id` whose inputs were
+    seen before are reused from the stage memo. A section's edit depends on its own text and its
+    neighbours' summaries, so rewriting one section re-edits it and its neighbours.
+    `on_section_complete(section, completed, total)` is called from the calling thread.
+    Returns `report` (the final markdown, or an "Error..." string if every
+    section failed), `warnings`, and the labels of the steps that were `reused`
+    and `rerun` ("Edit: <section>", "Global edit").
+    """
+    sections = list(outline.get('sections', []))
+    drafts = split_draft_sections(draft_report, sections)
+    sections = [section for section in sections if section in drafts]
+    if not sections:
+        return {"report": run_editor_agent(research_question, draft_report), "warnings": [], "reused": [], "rerun": ["Editor"]}
+
+    summaries = {section: summarize_section(drafts[section]) for section in sections}
+    edited: Dict[str, str] = {}
+    warnings: List[str] = []
+    failures: List[str] = []
+
+    # Each section sees the report's structure and its own subsections only, so
+    # editing another section's outline doesn't change its inputs.
+    memo = get_stage_memo()
+    inputs = {}
+    for n, section in enumerate(sections):
+        outline_text = json.dumps({"sections": sections, "subsections": {section: outline.get('subsections', {}).get(section, [])}})
+        previous_summary = summaries[sections[n - 1]] if n > 0 else ""
+        next_summary = summaries[sections[n + 1]] if n + 1 < len(sections) else ""
+        inputs[section] = [research_question, outline_text, section, drafts[section], previous_summary, next_summary]
+    # The memo holds the Editor Agent's own output; the citation check below is
+    # applied to stored and new edits alike.
+    def accept_edit(section: str, content: str) -> None:
+        if content.startswith("Error"):
+            failures.append(content)
+            warnings.append(f"{content} The draft text was kept.")
+            content = drafts[section]
+        elif not set(extract_citations(drafts[section])) <= set(extract_citations(content)):
+            warnings.append(f"The edit of '{section}' dropped citations; the draft text was kept.")
+            content = drafts[section]
+        edited[section] = content
+        if on_section_complete:
+            on_section_complete(section, len(edited), len(sections))
+
+    stored = {section: memo.get(report_id, "section_edit", inputs[section]) for section in sections}
+    pending = [section for section in sections if stored[section] is None]
+    reused = [f"Edit: {section}" for section in sections if stored[section] is not None]
+    rerun = [f"Edit: {section}" for section in pending]
+    for section in sections:
+        if stored[section] is not None:
+            accept_edit(section, stored[section])
+
+    executor = make_executor(max(1, min(max_workers, len(pending) or 1)))
+    try:
+        futures = {executor.submit(run_section_editor_agent, *inputs[section]): section for section in pending}
+        for future in concurrent.futures.as_completed(futures):
+            section = futures[future]
+            try:
+                content = future.result()
+            except Exception as e:
+                content = f"Error with Editor Agent for section '{section}': {e}"
+            if not content.startswith("Error"):
+                memo.set(report_id, "section_edit", inputs[section], content)
+            accept_edit(section, content)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if len(failures) == len(sections):
+        return {"report": failures[0], "warnings": warnings, "reused": reused, "rerun": rerun}
+
+    conclusion = next((section for section in reversed(sections) if "conclusion" in section.lower()), None)
+    global_inputs = [
+        research_question,
+        {section: summarize_section(edited[section], 300) for section in sections},
+        conclusion or "",
+        edited.get(conclusion, ""),
+    ]
+    global_pass, global_reused = memo.run(
+        report_id, "global_edit", global_inputs, lambda: run_global_editor_pass(*global_inputs),
+        is_error=lambda output: not output or "error" in output,
+    )
+    (reused if global_reused else rerun).append("Global edit")
+    if global_pass.get("error"):
+        warnings.append(global_pass["error"])
+    else:
+        transitions = global_pass.get("transitions") or {}
+        for section, bridge in transitions.items():
+            if section in edited and section != conclusion and isinstance(bridge, str) and bridge.strip():
+                edited[section] = f"{edited[section]}\n\n{bridge.strip()}"
+        new_conclusion = global_pass.get("conclusion")
+        if conclusion and isinstance(new_conclusion, str) and new_conclusion.strip():
+            if set(extract_citations(edited[conclusion])) <= set(extract_citations(new_conclusion)):
+                edited[conclusion] = new_conclusion.strip()
+            else:
+                warnings.append("The rewritten Conclusion dropped citations; the section-level edit was kept.")
+
+    report = "".join(f"\n\n## {section}\n\n{edited[section]}" for section in sections).strip()
+    return {"report": report, "warnings": warnings, "reused": reused, "rerun": rerun}
+
+def edit_report(research_question: str, outline: Dict, draft_report: str, on_section_complete=None,
+                report_id: str = None) -> Dict[str, Any]:
+    """
+    Edits a draft in a single Editor Agent pass, or section by section if it is
+    longer than `EDITOR_SINGLE_PASS_MAX_CHARS`; both are memoized by their inputs.
+    Returns `report` (or an "Error..." string), `warnings`, and the labels of the
+    editing steps that were `reused` and `rerun`.
+    """
+    if len(draft_report) <= EDITOR_SINGLE_PASS_MAX_CHARS:
+        report, reused = get_stage_memo().run(
+            report_id, "editor", [research_question, draft_report], lambda: run_editor_agent(research_question, draft_report),
+            is_error=lambda text: text.startswith("Error"),
+        )
+        return {"report": report, "warnings": [], "reused": ["Editor"] if reused else [], "rerun": [] if reused else ["Editor"]}
+
+    return run_editor_agents_parallel(research_question, outline, draft_report, on_section_complete=on_section_complete,
+                                      report_id=report_id)
+
+# --- Incremental regeneration ---
+
+def regenerate_report(research_question: str, outline: Dict, through: str = "final",
+                      on_progress: Callable[[float, str], None] = None, report_id: str = None) -> Dict[str, Any]:
+    """
+    Brings report `report_id` up to date after its question or outline was
+    edited, up to and including the `through` stage ("research", "draft" or
+    "final"). Every step is memoized by its inputs, so only the steps the edit
+    affected call the model again: research and the writer call of every
+    section whose outline is unchanged, and the edits of unchanged sections, are
+    reused. A question edit affects every step. `report_id=None` regenerates
+    every step.
+
+    `on_progress(fraction, message)` is called from the calling thread.
+    Returns `research`, `draft` and `final` (None past `through`), `warnings`,
+    and the labels of the steps that were `reused` and `rerun`; or `error`.
+    """
+    on_progress = on_progress or (lambda fraction, message: None)
+    result = {"research": None, "draft": None, "final": None, "warnings": [], "reused": [], "rerun": []}
+
+    on_progress(0.0, "Checking the research...")
+    research = get_research(research_question, outline, report_id)
+    if research["research"].startswith("Error"):
+        return {"error": research["research"]}
+    result["research"] = research["research"]
+    result["reused"] += [f"Research: {section}" for section in research["reused"]]
+    result["rerun"] += [f"Research: {section}" for section in research["rerun"]]
+    if through == "research":
+        return result
+
+    def on_section_written(section_title, completed, total):
+        on_progress(0.1 + 0.5 * completed / total, f"Section ready: {section_title} ({completed}/{total})")
+
+    writer = run_writer_agents_parallel(outline, result["research"], on_section_complete=on_section_written, report_id=report_id)
+    if writer["errors"]:
+        return {"error": " ".join(writer["errors"].values())}
+    result["draft"] = writer["draft"]
+    for section in writer["sections"]:
+        result["reused" if section in writer["reused"] else "rerun"].append(f"Writer: {section}")
+    if through == "draft":
+        return result
+
+    def on_section_edited(section_title, completed, total):
+        on_progress(0.6 + 0.4 * completed / total, f"Section edited: {section_title} ({completed}/{total})")
+
+    on_progress(0.6, "Editing the report...")
+    edited = edit_report(research_question, outline, result["draft"], on_section_complete=on_section_edited, report_id=report_id)
+    if edited["report"].startswith("Error"):
+        return {"error": edited["report"]}
+    result["final"] = edited["report"]
+    result["warnings"] = edited["warnings"]
+    result["reused"] += edited["reused"]
+    result["rerun"] += edited["rerun"]
+    return result
+
+# --- Streaming variants of the long-running report agents ---
+# Tab 3 streams the research, draft and single-pass edit steps. These send the
+# same prompts as their blocking counterparts but return a stream, so the UI can
+# render text as it is generated and then read the final string (or "Error..."
+# message) from `stream.text`, or the draft and its errors from the
+# `WriterStream`.
+
+def stream_research_stage(research_question: str, outline: Dict, report_id: str = None) -> ResearchStream:
+    """Streaming version of `get_research`: memoized sections are shown at once, new research is memoized."""
+    return ResearchStream(research_question, outline, report_id)
+
+def stream_writer_stage(outline: Dict, research_data: str, report_id: str = None, on_section_complete=None) -> WriterStream:
+    """Streaming version of `run_writer_agents_parallel`: memoized sections are shown at once, new sections are memoized."""
+    return WriterStream(outline, research_data, report_id, on_section_complete=on_section_complete)
+
+def stream_editor_stage(research_question: str, draft_report: str, report_id: str = None) -> CompletionStream:
+    """Streaming version of the single-pass branch of `edit_report`, memoized the same way."""
+    messages = [{"role": "user", "content": _editor_agent_prompt(research_question, draft_report)}]
+    return CompletionStream("run_editor_agent", messages, 4000, 0.3, "Error with Editor Agent: ",
+                            stage="editor", stage_inputs=[research_question, draft_report], report_id=report_id)
+
+# --------------------------------------------------------------------------
+# --- 5. BACKGROUND REPORT JOBS ---
+# --------------------------------------------------------------------------
+# The same outline -> research -> draft -> final chain as Tab 3, packaged as
+# stages for `ReportJobRunner`. The runner is shared by every session, runs the
+# stages on its own threads and stores each stage's output under
+# .aira_cache/jobs, so a report keeps going when the user switches tabs or
+# reconnects, and a failed job can be resumed without repeating finished stages.
+
+REPORT_JOB_MAX_WORKERS = 2
+
+def _outline_stage(job: StageContext) -> Dict:
+    web_research = get_web_research_summary(job.question)
+    outline = run_outline_agent(job.question, web_research)
+    if not outline or "error" in outline:
+        raise StageFailed(outline.get("error") or "The Outline Agent returned no outline.")
+    return outline
+
+def _research_stage(job: StageContext) -> str:
+    research = get_research(job.question, job.outputs["outline"], job.job_id)["research"]
+    if research.startswith("Error"):
+        raise StageFailed(research)
+    return research
+
+def _draft_stage(job: StageContext) -> str:
+    def on_section_complete(section_title, completed, total):
+        job.progress(completed / total, f"Finished section: {section_title} ({completed}/{total})")
+
+    results = run_writer_agents_parallel(job.outputs["outline"], job.outputs["research"], on_section_complete=on_section_complete,
+                                         report_id=job.job_id)
+    for error in results["errors"].values():
+        job.warn(error)
+    # A report with missing sections is not a report, so the stage fails as a
+    # whole. The sections that were written are memoized under the job ID, so
+    # resuming the job only re-runs the failed ones.
+    if results["errors"]:
+        failed = [section for section in job.outputs["outline"].get("sections", []) if section in results["errors"]]
+        raise StageFailed(f"The Writer Agent failed on {len(failed)} of {len(failed) + len(results['sections'])} "
+                          f"sections ({', '.join(failed)}). Resume the job to retry them.")
+    if not results["draft"]:
+        raise StageFailed("The outline has no sections to write.")
+    return results["draft"]
+
+def _final_stage(job: StageContext) -> str:
+    def on_section_complete(section_title, completed, total):
+        job.progress(completed / total, f"Edited section: {section_title} ({completed}/{total})")
+
+    results = edit_report(job.question, job.outputs["outline"], job.outputs["draft"], on_section_complete=on_section_complete,
+                          report_id=job.job_id)
+    for warning in results["warnings"]:
+        job.warn(warning)
+    final_report = results["report"]
+    if final_report.startswith("Error"):
+        raise StageFailed(final_report)
+    return final_report
+
+REPORT_STAGES = [
+    ReportStage("outline", "outline.json", _outline_stage, "Generating a detailed report outline..."),
+    ReportStage("research", "research.md", _research_stage, "Research Agent is gathering cited information..."),
+    ReportStage("draft", "draft.md", _draft_stage, "Writer Agent is writing all sections in parallel..."),
+    ReportStage("final", "final.md", _final_stage, "Editor Agent is polishing the final report..."),
+]
+
+@st.cache_resource
+def get_report_job_runner() -> ReportJobRunner:
+    """Returns the process-wide background runner for report jobs."""
+    return ReportJobRunner(CACHE_DIR / "jobs", REPORT_STAGES, max_workers=REPORT_JOB_MAX_WORKERS)
@@ -1,78 +1,286 @@
 import json
+import logging
+import random
 import smtplib
+import sqlite3
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import streamlit as st
 from pathlib import Path
 
-USERS_FILE = Path("users.json")
+logger = logging.getLogger(__name__)
+
+USERS_FILE = Path("users.json")  # legacy store, migrated into USERS_DB on first use
+USERS_DB = Path("users.db")
 
 # --- 1. LOCAL USER MANAGEMENT ---
+# Accounts live in an SQLite database in WAL mode: lookups go through the
+# primary-key index on `email` instead of parsing every account, and sign-ups
+# are single atomic INSERTs, so concurrent sessions can't overwrite each other.
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
 
-def _load_user_data():
-    """Loads user data from the local JSON file."""
-    if not USERS_FILE.exists():
-        return {}
-    with open(USERS_FILE, 'r') as f:
-        return json.load(f)
+def _connect() -> sqlite3.Connection:
+    """Returns this thread's connection to the user database, creating it (and the schema) on first use."""
+    path = str(USERS_DB)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    if path not in connections:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = conn
+        with _init_lock:
+            if path not in _initialized:
+                _init_user_store(conn)
+                _initialized.add(path)
+    return connections[path]
 
-def _save_user_data(data):
-    """Saves user data to the local JSON file."""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+def _init_user_store(conn: sqlite3.Connection):
+    """Creates the schema and migrates accounts from the legacy users.json file once."""
+    with conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, password TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        migrated = conn.execute("SELECT value FROM meta WHERE key = 'users_json_migrated'").fetchone()
+        if migrated or not USERS_FILE.exists():
+            return
+        with open(USERS_FILE, 'r') as f:
+            users = json.load(f)
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (email, password) VALUES (?, ?)",
+            [(email, record["password"]) for email, record in users.items()],
+        )
+        conn.execute("INSERT INTO meta (key, value) VALUES ('users_json_migrated', ?)", (str(len(users)),))
 
 def sign_up_user_local(email, password):
-    """Signs up a new user and saves to the local file."""
-    users = _load_user_data()
-    if email in users:
+    """Signs up a new user and saves it to the local user database."""
+    conn = _connect()
+    try:
+        with conn:
+            # In a real app, hash the password! For this demo, we store it directly.
+            conn.execute("INSERT INTO users (email, password) VALUES (?, ?)", (email, password))
+    except sqlite3.IntegrityError:
         return None, "An account with this email already exists."
-    
-    # In a real app, hash the password! For this demo, we store it directly.
-    users[email] = {"password": password}
-    _save_user_data(users)
     return email, None # Return email as a user identifier
 
 def login_user_local(email, password):
-    """Logs in a user by checking credentials against the local file."""
-    users = _load_user_data()
-    if email not in users:
+    """Logs in a user by checking credentials against the local user database."""
+    row = _connect().execute("SELECT password FROM users WHERE email = ?", (email,)).fetchone()
+    if row is None:
         return None, "No account found with this email."
     
-    if users[email]["password"] == password:
+    if row[0] == password:
         return email, None # Login successful
     else:
         return None, "Incorrect password."
 
 # --- 2. EMAIL NOTIFICATION ---
+# Emails are not sent from the Streamlit script thread. `send_email_notification`
+# writes the message to a persistent outbox table and returns immediately; a
+# background worker delivers queued mail over one reused, authenticated SMTP
+# connection and retries failures with exponential backoff. Messages that
+# were still queued when the app stopped are sent after the next start. If the
+# worker itself hits an error (e.g. the outbox database is locked), it logs it,
+# reopens its connection and tries again after a backoff instead of exiting.
 
-def send_email_notification(recipient_email: str, subject: str, body: str):
+OUTBOX_DB = Path("outbox.db")
+SMTP_SERVER = "smtp.office365.com"
+SMTP_PORT = 587
+
+class EmailOutbox:
+    """A persistent email queue drained by a background SMTP worker."""
+
+    def __init__(self, db_path: Path, sender_email: str, sender_password: str, smtp_server: str = SMTP_SERVER,
+                 smtp_port: int = SMTP_PORT, use_starttls: bool = True, max_attempts: int = 6,
+                 backoff_seconds: float = 5.0, idle_timeout: float = 60.0) -> None:
+        self.db_path = Path(db_path)
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.use_starttls = use_starttls
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.idle_timeout = idle_timeout
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._server = None
+        self._last_used = 0.0
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " recipient TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL,"
+                " status TEXT NOT NULL DEFAULT 'pending',"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt REAL NOT NULL,"
+                " last_error TEXT)"
+            )
+        self._worker = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+        self._worker.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def enqueue(self, recipient_email: str, subject: str, body: str) -> int:
+        """Queues a message for delivery and returns its outbox id."""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT INTO outbox (recipient, subject, body, next_attempt) VALUES (?, ?, ?, ?)",
+                (recipient_email, subject, body, time.time()),
+            )
+            message_id = cursor.lastrowid
+        finally:
+            conn.close()
+        self._wakeup.set()
+        return message_id
+
+    def pending_count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+        finally:
+            conn.close()
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Blocks until the queue has no pending messages (or `timeout` elapses). Returns True if it drained."""
+        deadline = time.monotonic() + timeout
+        self._wakeup.set()
+        while self.pending_count():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._worker.join(timeout=5)
+
+    def _smtp(self) -> smtplib.SMTP:
+        """Returns the open SMTP connection, reconnecting and logging in if needed."""
+        if self._server is not None:
+            try:
+                self._server.noop()
+                return self._server
+            except (smtplib.SMTPException, OSError):
+                self._close_smtp()
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+        if self.use_starttls:
+            server.starttls()  # Secure the connection
+        if self.sender_password:
+            server.login(self.sender_email, self.sender_password)
+        self._server = server
+        return server
+
+    def _close_smtp(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _deliver(self, recipient_email: str, subject: str, body: str):
+        message = MIMEMultipart()
+        message["From"] = self.sender_email
+        message["To"] = recipient_email
+        message["Subject"] = subject
+        message.attach(MIMEText(body, "plain"))
+        self._smtp().sendmail(self.sender_email, recipient_email, message.as_string())
+        self._last_used = time.monotonic()
+
+    def _drain(self, conn: sqlite3.Connection) -> float:
+        """Delivers every message that is due and returns how long to wait before the next pass."""
+        now = time.time()
+        due = conn.execute(
+            "SELECT id, recipient, subject, body, attempts FROM outbox"
+            " WHERE status = 'pending' AND next_attempt <= ? ORDER BY id",
+            (now,),
+        ).fetchall()
+        for message_id, recipient, subject, body, attempts in due:
+            try:
+                self._deliver(recipient, subject, body)
+                conn.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+            except Exception as e:
+                self._close_smtp()
+                attempts += 1
+                status = "failed" if attempts >= self.max_attempts else "pending"
+                delay = self.backoff_seconds * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+                conn.execute(
+                    "UPDATE outbox SET attempts = ?, status = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                    (attempts, status, time.time() + delay, str(e), message_id),
+                )
+
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self._close_smtp()
+        next_due = conn.execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()[0]
+        wait = self.idle_timeout if next_due is None else max(0.0, next_due - time.time())
+        return min(wait, self.idle_timeout)
+
+    def _run(self):
+        conn, failures = None, 0
+        while not self._stopped.is_set():
+            try:
+                if conn is None:
+                    conn = self._connect()
+                wait = self._drain(conn)
+                failures = 0
+            except Exception:
+                failures += 1
+                wait = min(self.backoff_seconds * 2 ** (failures - 1), self.idle_timeout)
+                logger.exception("Email outbox worker failed (%d in a row); retrying in %.0f s", failures, wait)
+                self._close_smtp()
+                if conn is not None:
+                    conn.close()
+                    conn = None
+            self._wakeup.wait(timeout=wait)
+            self._wakeup.clear()
+        self._close_smtp()
+        if conn is not None:
+            conn.close()
+
+@st.cache_resource
+def get_email_outbox():
     """
-    Sends an email notification using an Outlook account via SMTP.
-    Credentials must be stored in Streamlit's secrets.toml.
+    Returns the process-wide email outbox, or None if email credentials are not
+    configured. `smtp_server`, `smtp_port` and `use_starttls` can be overridden in
+    the `email_credentials` secrets (e.g. to point at a local SMTP server).
     """
     try:
-        # Fetch credentials securely from secrets
-        sender_email = st.secrets["email_credentials"]["sender_email"]
-        sender_password = st.secrets["email_credentials"]["sender_password"]
-        smtp_server = "smtp.office365.com"
-        smtp_port = 587
-    except KeyError:
-        return False, "Email credentials are not configured in secrets.toml."
-
-    # Create the email message
-    message = MIMEMultipart()
-    message["From"] = sender_email
-    message["To"] = recipient_email
-    message["Subject"] = subject
-    message.attach(MIMEText(body, "plain"))
+        credentials = st.secrets["email_credentials"]
+        sender_email = credentials["sender_email"]
+        sender_password = credentials["sender_password"]
+    except (KeyError, FileNotFoundError):
+        return None
+    return EmailOutbox(
+        OUTBOX_DB,
+        sender_email,
+        sender_password,
+        smtp_server=credentials.get("smtp_server", SMTP_SERVER),
+        smtp_port=int(credentials.get("smtp_port", SMTP_PORT)),
+        use_starttls=credentials.get("use_starttls", True),
+    )
 
+def send_email_notification(recipient_email: str, subject: str, body: str):
+    """
+    Queues an email notification for delivery from an Outlook account via SMTP
+    and returns immediately. Credentials must be stored in Streamlit's secrets.toml.
+    """
+    outbox = get_email_outbox()
+    if outbox is None:
+        return False, "Email credentials are not configured in secrets.toml."
     try:
-        # Connect to the server and send the email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()  # Secure the connection
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, recipient_email, message.as_string())
-        return True, "Email sent successfully!"
+        outbox.enqueue(recipient_email, subject, body)
+        return True, "Email queued for delivery!"
     except Exception as e:
-        st.error(f"Failed to send email: {e}")
-        return False, f"Failed to send email: {e}"
+        st.error(f"Failed to queue email: {e}")
+        return False, f"Failed to queue email: {e}"
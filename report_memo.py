@@ -0,0 +1,70 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from completion_cache import CompletionCache
+
+# --------------------------------------------------------------------------
+# --- INCREMENTAL REPORT STAGES ---
+# --------------------------------------------------------------------------
+# Every step of the report pipeline (research, each section's writer call,
+# each section's edit, the global edit pass) stores its output under a hash of
+# exactly the inputs that determine it: the question, the section's outline
+# subtree, the research chunk it was given, the section text. Regenerating a
+# report after an edit therefore re-runs only the steps whose inputs changed
+# and reuses everything else, whatever the completion cache's TTLs or bypass
+# rules are. Outputs are kept in the same kind of size-bounded SQLite store as
+# completions, labelled by stage so hit/miss counters are reported per stage.
+#
+# Every output belongs to one report (its `scope`, e.g. a report or job ID), so
+# a new report on the same question runs afresh and reports never share
+# outputs across users. A `scope` of None bypasses the memo.
+
+STAGE_MEMO_MAX_BYTES = 64 * 1024 * 1024
+STAGE_MEMO_TTL = 24 * 3600
+
+class StageMemo:
+    """Report stage outputs, keyed by a hash of the report, the stage name and its inputs."""
+
+    def __init__(self, path: Path, max_bytes: int = STAGE_MEMO_MAX_BYTES, ttl: float = STAGE_MEMO_TTL) -> None:
+        self.ttl = ttl
+        self._store = CompletionCache(path, max_bytes=max_bytes)
+
+    @staticmethod
+    def make_key(scope: str, stage: str, inputs: Any) -> str:
+        """Returns the content hash of a stage's inputs (anything JSON-serializable) within a report."""
+        payload = json.dumps({"scope": scope, "stage": stage, "inputs": inputs}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, scope: Optional[str], stage: str, inputs: Any) -> Optional[Any]:
+        """The stored output for these inputs, or None (always None without a scope)."""
+        if scope is None:
+            return None
+        value = self._store.get(self.make_key(scope, stage, inputs), stage)
+        return None if value is None else json.loads(value)
+
+    def set(self, scope: Optional[str], stage: str, inputs: Any, output: Any) -> None:
+        if scope is not None:
+            self._store.set(self.make_key(scope, stage, inputs), json.dumps(output, ensure_ascii=False), self.ttl, stage)
+
+    def run(self, scope: Optional[str], stage: str, inputs: Any, compute: Callable[[], Any],
+            is_error: Callable[[Any], bool] = lambda output: False) -> Tuple[Any, bool]:
+        """
+        Returns `(output, reused)`: the stored output if there is one, otherwise
+        the result of `compute()`, which is stored unless `is_error(output)`.
+        """
+        output = self.get(scope, stage, inputs)
+        if output is not None:
+            return output, True
+        output = compute()
+        if output is not None and not is_error(output):
+            self.set(scope, stage, inputs, output)
+        return output, False
+
+    def clear(self) -> None:
+        self._store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hits (reused outputs) and misses per stage, plus the store's size."""
+        return self._store.stats()
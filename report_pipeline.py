@@ -0,0 +1,246 @@
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# --------------------------------------------------------------------------
+# --- BACKGROUND REPORT JOBS ---
+# --------------------------------------------------------------------------
+# Runs the multi-step report pipeline (outline -> research -> draft -> final)
+# on worker threads, outside any Streamlit script run. Every job lives in its
+# own directory under `jobs_dir`:
+#
+#   job.json       status, current stage, progress, warnings, attempts, timings
+#   outline.json   \
+#   research.md     |  one file per completed stage, written as soon as the
+#   draft.md        |  stage finishes
+#   final.md       /
+#
+# A stage whose output file exists is never run again, so a job that failed
+# or was interrupted by a server restart resumes from the first missing stage.
+# The UI only reads job.json, so it can poll progress without blocking.
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_INTERRUPTED = "interrupted"  # was queued/running in a process that no longer exists
+
+class StageFailed(Exception):
+    """Raised by a stage function when its agent returned an error instead of output."""
+
+class ReportStage(NamedTuple):
+    """One step of the pipeline: its name, the file its output is stored in, and the function that produces it."""
+    name: str
+    file_name: str
+    run: Callable[["StageContext"], Any]
+    description: str = ""
+
+class StageContext:
+    """What a stage function gets to work with: the question, earlier outputs, progress reporting and the job's ID."""
+
+    def __init__(self, question: str, outputs: Dict[str, Any], on_progress: Callable[[float, str], None],
+                 on_warning: Callable[[str], None], job_id: Optional[str] = None) -> None:
+        self.question = question
+        self.outputs = outputs
+        self.job_id = job_id
+        self._on_progress = on_progress
+        self._on_warning = on_warning
+
+    def progress(self, fraction: float, message: str = "") -> None:
+        """Reports progress within the current stage (0.0 to 1.0)."""
+        self._on_progress(max(0.0, min(1.0, fraction)), message)
+
+    def warn(self, message: str) -> None:
+        """Records a non-fatal problem; the job keeps going."""
+        self._on_warning(message)
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f"{path.name}.tmp{threading.get_ident()}")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+class ReportJobRunner:
+    """Runs report jobs on a thread pool and keeps their state and stage outputs on disk."""
+
+    def __init__(self, jobs_dir: Path, stages: List[ReportStage], max_workers: int = 2, max_attempts: int = 2,
+                 retry_delay: float = 5.0) -> None:
+        self.jobs_dir = Path(jobs_dir)
+        self.stages = list(stages)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._futures: Dict[str, concurrent.futures.Future] = {}
+        self._records: Dict[str, Dict[str, Any]] = {}  # live records of jobs owned by this runner
+        self._lock = threading.Lock()
+
+    # --- job state ---
+
+    def _job_dir(self, job_id: str) -> Path:
+        if not job_id or any(c in job_id for c in "/\\."):
+            raise ValueError(f"Invalid job ID: {job_id!r}")
+        return self.jobs_dir / job_id
+
+    def _save(self, record: Dict[str, Any]) -> None:
+        record["updated"] = time.time()
+        _write_atomic(self._job_dir(record["id"]) / "job.json", json.dumps(record, indent=2, ensure_ascii=False))
+
+    def _update(self, job_id: str, **changes: Any) -> None:
+        with self._lock:
+            record = self._records[job_id]
+            record.update(changes)
+            self._save(record)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns a copy of the job record, or None if there is no such job."""
+        with self._lock:
+            if job_id in self._records:
+                return json.loads(json.dumps(self._records[job_id]))
+        try:
+            record = json.loads((self._job_dir(job_id) / "job.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if record.get("status") in (JOB_QUEUED, JOB_RUNNING):
+            record["status"] = JOB_INTERRUPTED
+        return record
+
+    def list_jobs(self, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Returns the records of all jobs (optionally only `owner`'s), newest first."""
+        jobs = []
+        for path in self.jobs_dir.glob("*/job.json"):
+            record = self.status(path.parent.name)
+            if record and (owner is None or record.get("owner") == owner):
+                jobs.append(record)
+        return sorted(jobs, key=lambda record: record.get("created", 0), reverse=True)
+
+    def outputs(self, job_id: str) -> Dict[str, Any]:
+        """Returns the persisted output of every completed stage, keyed by stage name."""
+        job_dir = self._job_dir(job_id)
+        outputs = {}
+        for stage in self.stages:
+            path = job_dir / stage.file_name
+            if path.exists():
+                text = path.read_text(encoding="utf-8")
+                outputs[stage.name] = json.loads(text) if stage.file_name.endswith(".json") else text
+        return outputs
+
+    def _write_output(self, job_id: str, stage: ReportStage, output: Any) -> None:
+        text = json.dumps(output, indent=2, ensure_ascii=False) if stage.file_name.endswith(".json") else str(output)
+        _write_atomic(self._job_dir(job_id) / stage.file_name, text)
+
+    # --- submitting and resuming ---
+
+    def submit(self, question: str, owner: Optional[str] = None, outputs: Optional[Dict[str, Any]] = None,
+               job_id: Optional[str] = None) -> str:
+        """
+        Queues a new job for `question` and returns its ID. Stage outputs that are
+        already known (e.g. an outline the user generated interactively) can be
+        passed in `outputs`; those stages are skipped.
+        """
+        job_id = job_id or uuid.uuid4().hex[:12]
+        job_dir = self._job_dir(job_id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        for stage in self.stages:
+            if outputs and outputs.get(stage.name) is not None:
+                self._write_output(job_id, stage, outputs[stage.name])
+        record = {
+            "id": job_id,
+            "owner": owner,
+            "question": question,
+            "status": JOB_QUEUED,
+            "stage": None,
+            "progress": 0.0,
+            "message": "Waiting for a free worker...",
+            "error": None,
+            "warnings": [],
+            "attempts": {},
+            "timings": {},
+            "created": time.time(),
+        }
+        self._start(record)
+        return job_id
+
+    def resume(self, job_id: str) -> bool:
+        """Re-queues a failed or interrupted job from its first missing stage. Returns False if it can't be resumed."""
+        record = self.status(job_id)
+        if record is None or record["status"] not in (JOB_FAILED, JOB_INTERRUPTED):
+            return False
+        record.update(status=JOB_QUEUED, error=None, message="Waiting for a free worker...")
+        self._start(record)
+        return True
+
+    def _start(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._records[record["id"]] = record
+            self._save(record)
+            self._futures[record["id"]] = self._executor.submit(self._run, record["id"])
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Blocks until a job started by this runner finishes, then returns its record."""
+        future = self._futures.get(job_id)
+        if future is not None:
+            concurrent.futures.wait([future], timeout=timeout)
+        return self.status(job_id)
+
+    # --- execution ---
+
+    def _run(self, job_id: str) -> None:
+        record = self._records[job_id]
+        outputs = self.outputs(job_id)
+        self._update(job_id, status=JOB_RUNNING)
+        try:
+            for index, stage in enumerate(self.stages):
+                if stage.name in outputs:
+                    continue
+
+                def on_progress(fraction: float, message: str, index: int = index) -> None:
+                    self._update(job_id, progress=round((index + fraction) / len(self.stages), 3), message=message)
+
+                def on_warning(message: str) -> None:
+                    with self._lock:
+                        record["warnings"].append(message)
+                        self._save(record)
+
+                context = StageContext(record["question"], outputs, on_progress, on_warning, job_id)
+                output = self._run_stage(job_id, stage, context, index)
+                if output is None:
+                    return
+                self._write_output(job_id, stage, output)
+                outputs[stage.name] = output
+            self._update(job_id, status=JOB_COMPLETED, stage=None, progress=1.0, message="Report complete.")
+        except Exception as e:
+            self._update(job_id, status=JOB_FAILED, error=f"Unexpected error: {e}")
+        finally:
+            with self._lock:
+                # A resumed job may already have a new record and future; leave those alone.
+                if self._records.get(job_id) is record:
+                    self._records.pop(job_id, None)
+                    self._futures.pop(job_id, None)
+
+    def _run_stage(self, job_id: str, stage: ReportStage, context: StageContext, index: int) -> Any:
+        """Runs one stage with retries. Returns its output, or None after marking the job failed."""
+        record = self._records[job_id]
+        for attempt in range(1, self.max_attempts + 1):
+            with self._lock:
+                record["attempts"][stage.name] = record["attempts"].get(stage.name, 0) + 1
+            self._update(job_id, stage=stage.name, progress=round(index / len(self.stages), 3),
+                         message=stage.description or f"Running {stage.name}...")
+            start = time.perf_counter()
+            try:
+                return stage.run(context)
+            except Exception as e:
+                error = str(e) if isinstance(e, StageFailed) else f"{type(e).__name__}: {e}"
+            finally:
+                with self._lock:
+                    elapsed = time.perf_counter() - start
+                    record["timings"][stage.name] = round(record["timings"].get(stage.name, 0) + elapsed, 3)
+            if attempt < self.max_attempts:
+                self._update(job_id, message=f"{stage.name} failed ({error}); retrying...")
+                time.sleep(self.retry_delay * attempt)
+        self._update(job_id, status=JOB_FAILED, error=f"Stage '{stage.name}' failed: {error}")
+        return None
@@ -0,0 +1,154 @@
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from text_utils import STOPWORDS, tokenize
+
+# --------------------------------------------------------------------------
+# --- PER-SECTION RETRIEVAL OVER RESEARCH AGENT OUTPUT ---
+# --------------------------------------------------------------------------
+# The Research Agent's notes are markdown organized by subsections, with a
+# References list at the end. Instead of sending all of them to a Writer Agent
+# call, the notes are split into heading-keyed chunks and indexed with BM25;
+# each section then receives only its most relevant chunks plus the References
+# entries those chunks cite. Research gathered per section is indexed one
+# section at a time (see `lab.run_writer_agents_parallel`), so an edit to one
+# section doesn't change what the other sections retrieve.
+
+_HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_BOLD_HEADING = re.compile(r"^\s{0,3}\*\*([^*]{1,120})\*\*:?\s*$")
+_LINK_URL = re.compile(r"\]\((https?://[^)\s]+)\)")
+_BARE_URL = re.compile(r"https?://[^\s)\]>]+")
+_REFERENCES_TITLE = re.compile(r"^(?:compiled\s+)?(references|bibliography|sources|works cited)\b", re.IGNORECASE)
+
+# Report-boilerplate words that carry no retrieval signal.
+_STOPWORDS = STOPWORDS | frozenset("section subsection subsections description descriptions report research study studies".split())
+
+# Chunks longer than this are split on paragraph boundaries.
+MAX_CHUNK_CHARS = 2500
+
+@dataclass
+class ResearchChunk:
+    """A piece of the research document together with the headings it sits under."""
+    heading: str
+    text: str
+    urls: List[str] = field(default_factory=list)
+
+def _split_long(heading: str, body: str) -> List[ResearchChunk]:
+    paragraphs = [p for p in re.split(r"\n\s*\n", body) if p.strip()]
+    chunks, current = [], ""
+    for paragraph in paragraphs:
+        if current and len(current) + len(paragraph) > MAX_CHUNK_CHARS:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return [ResearchChunk(heading, text, _LINK_URL.findall(text)) for text in chunks]
+
+def split_research(research_data: str):
+    """
+    Splits research markdown into heading-keyed chunks and a References map.
+    Returns `(chunks, references)`, where `references` maps each URL to the
+    References entry that contains it.
+    """
+    chunks: List[ResearchChunk] = []
+    references: Dict[str, str] = {}
+    path: List[Tuple[int, str]] = []  # (level, title) of the enclosing headings
+    body: List[str] = []
+    in_references = False
+    heading_depth = 0  # depth of the last '#' heading; bold-line headings nest one below it
+
+    def flush():
+        text = "\n".join(body).strip()
+        if not text:
+            return
+        if in_references:
+            for entry in re.split(r"\n(?=\s*(?:[-*+]|\d+[.)])\s)|\n\s*\n", text):
+                entry = entry.strip()
+                for url in _BARE_URL.findall(entry):
+                    references.setdefault(url.rstrip(".,;"), entry)
+        else:
+            chunks.extend(_split_long(" > ".join(title for _, title in path), text))
+
+    for line in research_data.splitlines():
+        heading = _HEADING.match(line)
+        bold = None if heading else _BOLD_HEADING.match(line)
+        if heading or bold:
+            flush()
+            body = []
+            title = (heading.group(2) if heading else bold.group(1)).strip().strip("*").strip()
+            if heading:
+                heading_depth = len(heading.group(1))
+            level = heading_depth if heading else heading_depth + 1
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, title))
+            in_references = bool(_REFERENCES_TITLE.match(title))
+        else:
+            body.append(line)
+    flush()
+    return chunks, references
+
+class ResearchIndex:
+    """A BM25 index over the chunks of one research document."""
+
+    def __init__(self, research_data: str, k1: float = 1.5, b: float = 0.75) -> None:
+        self.research_data = research_data
+        self.chunks, self.references = split_research(research_data)
+        self.k1 = k1
+        self.b = b
+        # Headings are indexed twice: they are the best description of a chunk.
+        self._term_freqs = [Counter(tokenize(f"{c.heading} {c.heading} {c.text}", _STOPWORDS)) for c in self.chunks]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        doc_freq = Counter(term for tf in self._term_freqs for term in tf)
+        n = len(self.chunks)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query: str) -> List[float]:
+        """Returns the BM25 score of every chunk for `query`."""
+        terms = set(tokenize(query, _STOPWORDS))
+        scores = []
+        for tf, length in zip(self._term_freqs, self._lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self._avg_length or 1))
+            scores.append(sum(
+                self._idf[t] * tf[t] * (self.k1 + 1) / (tf[t] + norm)
+                for t in terms if t in tf
+            ))
+        return scores
+
+    def context_for(self, query: str, max_chunks: int = 6, max_chars: int = 12000) -> str:
+        """
+        Returns the research context for one report section: the best matching
+        chunks (in document order, within `max_chunks` and roughly `max_chars`)
+        followed by the References entries they cite. Falls back to the full
+        document when it has no usable structure.
+        """
+        if not self.chunks:
+            return self.research_data
+        scores = self.scores(query)
+        ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+        selected, used = [], 0
+        for i in ranked[:max_chunks]:
+            size = len(self.chunks[i].text)
+            if selected and used + size > max_chars:
+                break
+            selected.append(i)
+            used += size
+        if not selected:
+            # Nothing matched; the opening chunks usually hold the overview.
+            selected = list(range(min(2, len(self.chunks))))
+
+        parts = [f"### {self.chunks[i].heading}\n{self.chunks[i].text}" for i in sorted(selected)]
+        cited = []
+        for i in sorted(selected):
+            for url in self.chunks[i].urls:
+                entry = self.references.get(url)
+                if entry and entry not in cited:
+                    cited.append(entry)
+        if cited:
+            parts.append("### References\n" + "\n".join(cited))
+        return "\n\n".join(parts)
@@ -0,0 +1,257 @@
+import email.utils
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# --------------------------------------------------------------------------
+# --- RATE-LIMIT-AWARE REQUEST SCHEDULER ---
+# --------------------------------------------------------------------------
+# Every Azure OpenAI call in the process goes through one scheduler, which
+# does three things:
+#
+# * Keeps the process under its request and token quota. Two token buckets
+#   cover requests per minute and tokens per minute. Each holds at most one
+#   minute's allowance and refills continuously. A call reserves an estimate
+#   of its tokens (prompt + max_tokens) before it is sent. The reservation is
+#   corrected with the real usage once the response (or the whole stream) has
+#   arrived, and returned in full if the request fails.
+# * Retries throttled and transient failures (429, 408, 5xx, connection
+#   errors). It honours the server's Retry-After header, and otherwise uses
+#   exponential backoff with jitter. A 429 pauses *every* caller until the
+#   Retry-After time has passed, instead of letting each one hit the limit.
+#   A caller can pass a `deadline`; the scheduler stops waiting and retrying
+#   once it has passed, so work the caller has given up on stops spending quota.
+# * Serves waiting callers in priority order, so an interactive Tab 1 query
+#   isn't stuck behind dozens of queued writer/editor calls from report
+#   generation.
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """Rough upper bound of the tokens a request uses: ~4 characters per prompt token plus the completion budget."""
+    prompt_chars = sum(len(message.get("content") or "") for message in messages)
+    return prompt_chars // 4 + max_tokens
+
+class TokenBucket:
+    """A bucket of `capacity` units that refills at `capacity` units per `period` seconds."""
+
+    def __init__(self, capacity: float, period: float = 60.0) -> None:
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if they are available now)."""
+        self._refill(now)
+        # A request bigger than the whole bucket waits for a full bucket instead of forever.
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Returns the delay the server asked for in the error's Retry-After headers, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error: Exception) -> bool:
+    """True for throttling, timeouts, server errors and dropped connections."""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    # Connection errors and timeouts carry no status code.
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout", "TimeoutError")
+
+class RequestScheduler:
+    """Process-wide admission control and retry policy for API requests."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._waiting: List[tuple] = []  # heap of (priority, ticket) for callers waiting to send
+        self._tickets = itertools.count()
+        self._paused_until = 0.0
+        self._stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0, "queued_seconds": 0.0}
+        self.configure(requests_per_minute, tokens_per_minute)
+
+    def configure(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None) -> None:
+        """Sets (or removes, with None) the per-minute request and token limits."""
+        with self._cond:
+            self.requests_per_minute = requests_per_minute
+            self.tokens_per_minute = tokens_per_minute
+            self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+            self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+            self._cond.notify_all()
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        return max(
+            self._paused_until - now,
+            self._requests.wait_time(1, now) if self._requests else 0.0,
+            self._tokens.wait_time(tokens, now) if self._tokens else 0.0,
+        )
+
+    def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE, deadline: Optional[float] = None) -> int:
+        """
+        Waits until this caller is the highest-priority one waiting and one request
+        plus `tokens` tokens fit under the limits, then reserves them.
+        Returns the reservation, to be passed to `settle` or `release`. Raises
+        `TimeoutError` if `deadline` (a `time.monotonic()` value) passes first.
+        """
+        start = time.monotonic()
+        with self._cond:
+            entry = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait_time(tokens, now) if self._waiting[0] == entry else 1.0
+                    if wait <= 0:
+                        if self._requests:
+                            self._requests.take(1)
+                        if self._tokens:
+                            self._tokens.take(tokens)
+                        self._stats["requests"] += 1
+                        self._stats["queued_seconds"] += now - start
+                        return tokens
+                    if deadline is not None:
+                        if now >= deadline:
+                            self._stats["failed"] += 1
+                            raise TimeoutError("The request was still queued when its deadline passed.")
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(timeout=min(wait, 1.0))
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        """Corrects a reservation with the tokens the response actually used (if the API reported them)."""
+        if used is None:
+            return
+        with self._cond:
+            if self._tokens:
+                if used < reserved:
+                    self._tokens.give_back(reserved - used)
+                else:
+                    self._tokens.take(used - reserved)
+            self._cond.notify_all()
+
+    def release(self, reserved: int) -> None:
+        """Returns the token reservation of a request that was rejected without generating anything."""
+        self.settle(reserved, 0)
+
+    def backoff_delay(self, error: Exception, attempt: int) -> float:
+        """Delay before retry number `attempt + 1`: the server's Retry-After if given, else jittered exponential backoff."""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            # Small jitter so callers released together don't all retry in the same instant.
+            return min(self.max_delay, retry_after) * random.uniform(1.0, 1.2)
+        return random.uniform(self.base_delay, min(self.max_delay, self.base_delay * 2 ** (attempt + 1)))
+
+    def _send(self, send: Callable[[], Any], tokens: int, priority: int, deadline: Optional[float]) -> Tuple[Any, int]:
+        """The retry loop of `call` and `stream`. Returns the response and its token reservation."""
+        for attempt in range(self.max_retries + 1):
+            reserved = self.acquire(tokens, priority, deadline)
+            sent = False
+            try:
+                response = send()
+                sent = True
+                return response, reserved
+            except Exception as e:
+                error = e
+                delay = self.backoff_delay(e, attempt) if is_retryable(e) and attempt < self.max_retries else None
+                # A retry that could only start after the deadline is not worth sending.
+                if delay is None or (deadline is not None and time.monotonic() + delay >= deadline):
+                    with self._cond:
+                        self._stats["failed"] += 1
+                    raise
+                with self._cond:
+                    self._stats["retries"] += 1
+                    if _status_code(e) == 429:
+                        # Throttled requests don't consume quota; pause everyone until the window reopens.
+                        self._stats["rate_limited"] += 1
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            finally:
+                # A request that failed (or was interrupted) generated nothing.
+                if not sent:
+                    self.release(reserved)
+            if _status_code(error) != 429:
+                time.sleep(delay)
+
+    def call(self, send: Callable[[], Any], tokens: int, priority: int = PRIORITY_INTERACTIVE,
+             deadline: Optional[float] = None) -> Any:
+        """
+        Sends a request through the scheduler: waits for admission, calls `send()`,
+        settles the token reservation from `response.usage` and retries retryable
+        errors. The last error is re-raised once retries are exhausted or the next
+        retry would start after `deadline` (a `time.monotonic()` value).
+        """
+        response, reserved = self._send(send, tokens, priority, deadline)
+        usage = getattr(response, "usage", None)
+        self.settle(reserved, getattr(usage, "total_tokens", None))
+        return response
+
+    def stream(self, send: Callable[[], Any], tokens: int, priority: int = PRIORITY_INTERACTIVE,
+               prompt_tokens: int = 0, deadline: Optional[float] = None) -> Iterator[Any]:
+        """
+        Streaming counterpart of `call`: opens the stream (only opening is retried)
+        and yields its chunks. When the stream ends, fails or is abandoned, the
+        reservation is settled with the usage reported on the last chunk, if any,
+        or else `prompt_tokens` plus ~4 characters per streamed completion token.
+        """
+        response, reserved = self._send(send, tokens, priority, deadline)
+        used, chars = None, 0
+        try:
+            for chunk in response:
+                usage = getattr(chunk, "usage", None)
+                if getattr(usage, "total_tokens", None) is not None:
+                    used = usage.total_tokens
+                for choice in getattr(chunk, "choices", None) or []:
+                    chars += len(getattr(getattr(choice, "delta", None), "content", None) or "")
+                yield chunk
+        finally:
+            self.settle(reserved, used if used is not None else prompt_tokens + chars // 4)
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns request/retry counters and the current queue length."""
+        with self._cond:
+            return dict(self._stats, waiting=len(self._waiting),
+                        paused_seconds=round(max(0.0, self._paused_until - time.monotonic()), 1))
@@ -0,0 +1,151 @@
+import concurrent.futures
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --------------------------------------------------------------------------
+# --- ALPHAFOLD STRUCTURE STORE ---
+# --------------------------------------------------------------------------
+# Downloads predicted structures from the AlphaFold database through one pooled
+# HTTP session and keeps them on disk, keyed by UniProt ID and model version.
+# IDs that AlphaFold does not know (HTTP 404) are remembered in a negative cache
+# so Streamlit reruns don't keep asking for them. The base URL is configurable,
+# so the store can be pointed at a local HTTP stand-in for the AlphaFold server.
+# Large models can be reduced to a C-alpha trace before they are sent to the
+# browser (see `reduce_pdb_detail`). If a `telemetry` recorder is given, every
+# lookup is recorded as agent "alphafold_fetch".
+
+ALPHAFOLD_BASE_URL = "https://alphafold.ebi.ac.uk/files"
+ALPHAFOLD_MODEL_VERSION = "v4"
+
+_UNIPROT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+def reduce_pdb_detail(pdb_text: str, max_atoms: int) -> Tuple[str, str, int]:
+    """
+    Shrinks a PDB model for display once it has more than `max_atoms` atoms.
+
+    Small models are returned unchanged ("full"). Larger ones are reduced to a
+    C-alpha trace ("ca_trace"), and if even that is too large, every n-th residue
+    of the trace is kept ("ca_downsampled"). Returns the PDB text, the mode used
+    and the atom count of the original model.
+    """
+    lines = pdb_text.splitlines()
+    atom_lines = [line for line in lines if line.startswith(("ATOM", "HETATM"))]
+    if len(atom_lines) <= max_atoms:
+        return pdb_text, "full", len(atom_lines)
+
+    ca_lines = [line for line in atom_lines if line.startswith("ATOM") and line[12:16].strip() == "CA"]
+    mode = "ca_trace"
+    if len(ca_lines) > max_atoms:
+        step = -(-len(ca_lines) // max_atoms)  # ceiling division
+        ca_lines = ca_lines[::step]
+        mode = "ca_downsampled"
+    return "\n".join(ca_lines + ["END"]) + "\n", mode, len(atom_lines)
+
+class StructureNotFound(Exception):
+    """Raised when AlphaFold has no predicted structure for a UniProt ID."""
+
+class AlphaFoldStructureStore:
+    """Pooled, disk-cached access to AlphaFold PDB files."""
+
+    def __init__(self, cache_dir: Path, base_url: str = ALPHAFOLD_BASE_URL, model_version: str = ALPHAFOLD_MODEL_VERSION,
+                 pool_size: int = 16, timeout: float = 30, negative_ttl: float = 24 * 3600, telemetry: Any = None) -> None:
+        self.cache_dir = Path(cache_dir) / model_version
+        self.base_url = base_url.rstrip("/")
+        self.model_version = model_version
+        self.timeout = timeout
+        self.negative_ttl = negative_ttl
+        self.telemetry = telemetry
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+        # One session for every download, so TCP/TLS connections are reused.
+        # Transient server errors are retried with backoff; 404s are not.
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def file_name(self, uniprot_id: str) -> str:
+        return f"AF-{uniprot_id}-F1-model_{self.model_version}.pdb"
+
+    def url(self, uniprot_id: str) -> str:
+        return f"{self.base_url}/{self.file_name(uniprot_id)}"
+
+    def _lock_for(self, uniprot_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(uniprot_id, threading.Lock())
+
+    def _is_known_missing(self, marker: Path) -> bool:
+        if not marker.exists():
+            return False
+        if time.time() - marker.stat().st_mtime < self.negative_ttl:
+            return True
+        marker.unlink(missing_ok=True)
+        return False
+
+    def get(self, uniprot_id: str) -> str:
+        """
+        Returns the PDB text for `uniprot_id`, downloading it on first use.
+        Raises `StructureNotFound` if AlphaFold has no model for the ID and
+        `requests.RequestException` for any other download failure.
+        """
+        if self.telemetry is None:
+            return self._get(uniprot_id, {})
+        with self.telemetry.span("alphafold_fetch", "http") as call:
+            return self._get(uniprot_id, call)
+
+    def _get(self, uniprot_id: str, call: Dict[str, Any]) -> str:
+        uniprot_id = uniprot_id.strip().upper()
+        if not _UNIPROT_ID_PATTERN.match(uniprot_id):
+            raise StructureNotFound(f"'{uniprot_id}' is not a valid UniProt ID.")
+
+        path = self.cache_dir / self.file_name(uniprot_id)
+        marker = path.with_suffix(".404")
+        # Concurrent requests for the same ID wait for a single download.
+        with self._lock_for(uniprot_id):
+            if path.exists():
+                call["cache_hit"] = True
+                return path.read_text()
+            if self._is_known_missing(marker):
+                call["cache_hit"] = True
+                raise StructureNotFound(f"No 3D structure available from AlphaFold for UniProt ID {uniprot_id}.")
+
+            res = self.session.get(self.url(uniprot_id), timeout=self.timeout)
+            if res.status_code == 404:
+                marker.touch()
+                raise StructureNotFound(f"No 3D structure available from AlphaFold for UniProt ID {uniprot_id}.")
+            res.raise_for_status()
+
+            # Write atomically so a crashed download never leaves a truncated PDB behind.
+            tmp_path = path.with_suffix(f".tmp{threading.get_ident()}")
+            tmp_path.write_text(res.text)
+            os.replace(tmp_path, path)
+            return res.text
+
+    def prefetch(self, uniprot_ids: Iterable[str], max_workers: int = 8) -> Dict[str, Union[str, Exception]]:
+        """
+        Downloads every ID concurrently. Returns a dict mapping each ID to its PDB
+        text, or to the exception raised for it, so one bad ID doesn't affect the rest.
+        """
+        uniprot_ids = list(dict.fromkeys(uniprot_ids))
+        results: Dict[str, Union[str, Exception]] = {}
+        if not uniprot_ids:
+            return results
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(uniprot_ids))) as executor:
+            futures = {executor.submit(self.get, uniprot_id): uniprot_id for uniprot_id in uniprot_ids}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = e
+        return {uniprot_id: results[uniprot_id] for uniprot_id in uniprot_ids}
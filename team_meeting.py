@@ -0,0 +1,91 @@
+import math
+import re
+from collections import Counter
+from typing import List, NamedTuple
+
+from text_utils import STOPWORDS, tokenize
+
+# --------------------------------------------------------------------------
+# --- ROLLING MEETING MEMORY ---
+# --------------------------------------------------------------------------
+# The team meeting keeps a bounded, extractive record of what has been said
+# instead of resending the whole transcript. After each turn, the speaker's
+# most salient sentences are added to the memory: sentences about the agenda,
+# with terms the meeting hasn't covered yet. Once the memory is over its
+# character budget, the lowest-value notes of earlier rounds are dropped, and
+# older rounds count for less. The current round, and then the latest turn,
+# are only trimmed when nothing older is left, so the memory always ends with
+# the most recent turns. Prompt size therefore stays constant however many
+# rounds the meeting runs, and no extra LLM call is spent on summarising.
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[*])")
+# Meeting small talk that says nothing about the agenda.
+_STOPWORDS = STOPWORDS | frozenset("team round meeting agenda let lets think believe important key need".split())
+
+def _terms(text: str) -> List[str]:
+    return tokenize(text, _STOPWORDS)
+
+def split_sentences(text: str) -> List[str]:
+    """Splits prose into sentences, ignoring markdown headings and list markers."""
+    lines = [re.sub(r"^\s*(?:[-*+]|\d+[.)])\s+", "", line).strip() for line in text.splitlines()]
+    prose = " ".join(line for line in lines if line and not line.startswith("#"))
+    prose = prose.replace("**", "")
+    return [s.strip() for s in _SENTENCE_SPLIT.split(prose) if len(s.strip()) > 20]
+
+def excerpt(text: str, max_chars: int) -> str:
+    """The leading sentences of `text` that fit in `max_chars`."""
+    parts, used = [], 0
+    for sentence in split_sentences(text):
+        if parts and used + len(sentence) + 1 > max_chars:
+            break
+        parts.append(sentence if len(sentence) <= max_chars else sentence[:max_chars].rstrip() + "...")
+        used += len(parts[-1]) + 1
+    return " ".join(parts)
+
+class MeetingNote(NamedTuple):
+    round_number: int
+    speaker: str
+    sentence: str
+    score: float
+
+class MeetingMemory:
+    """A character-bounded set of the most salient sentences of a meeting, rendered in speaking order."""
+
+    def __init__(self, agenda: str, max_chars: int = 1500, sentences_per_turn: int = 2, decay: float = 0.8) -> None:
+        self.agenda_terms = set(_terms(agenda))
+        self.max_chars = max_chars
+        self.sentences_per_turn = sentences_per_turn
+        self.decay = decay
+        self.notes: List[MeetingNote] = []
+        self._seen_terms: Counter = Counter()
+
+    def _score(self, sentence: str) -> float:
+        terms = _terms(sentence)
+        if not terms:
+            return 0.0
+        score = 0.0
+        for term in set(terms):
+            novelty = 1.0 / (1.0 + self._seen_terms[term])
+            score += (2.0 if term in self.agenda_terms else 1.0) * novelty
+        # Favour information-dense sentences without letting long ones win by length alone.
+        return score / math.sqrt(len(terms))
+
+    def add(self, speaker: str, text: str, round_number: int) -> None:
+        """Adds the most salient sentences of one turn and trims the memory to its budget."""
+        ranked = sorted(split_sentences(text), key=self._score, reverse=True)[:self.sentences_per_turn]
+        latest = [MeetingNote(round_number, speaker, sentence, self._score(sentence)) for sentence in ranked]
+        self.notes.extend(latest)
+        self._seen_terms.update(t for sentence in ranked for t in set(_terms(sentence)))
+        self._trim(round_number, latest)
+
+    def _trim(self, current_round: int, latest: List[MeetingNote]) -> None:
+        while self.notes and len(self.render()) > self.max_chars:
+            candidates = ([n for n in self.notes if n.round_number < current_round]
+                          or [n for n in self.notes if n not in latest] or self.notes)
+            weakest = min(candidates, key=lambda n: n.score * self.decay ** (current_round - n.round_number))
+            self.notes.remove(weakest)
+
+    def render(self) -> str:
+        if not self.notes:
+            return "(nothing yet)"
+        return "\n".join(f"- [Round {n.round_number}, {n.speaker}] {n.sentence}" for n in self.notes)
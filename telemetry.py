@@ -0,0 +1,208 @@
+import http.server
+import json
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# --------------------------------------------------------------------------
+# --- PER-CALL TELEMETRY ---
+# --------------------------------------------------------------------------
+# One record per chat completion or external fetch: agent name, wall time,
+# time to first token (streams), prompt/completion tokens, cache hit and the
+# error class if the call failed. Records are kept in a bounded in-memory
+# window (and optionally appended to a JSONL file). Per-agent totals are kept
+# separately, so they stay exact however many records the window drops.
+# Aggregates are available as a dict (sidebar panel), as JSONL and in the
+# Prometheus text format.
+
+TELEMETRY_MAX_RECORDS = 10_000
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of `values` (q in 0..100); None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Telemetry:
+    """Thread-safe recorder and aggregator of per-call latency, token and cost metrics."""
+
+    def __init__(self, max_records: int = TELEMETRY_MAX_RECORDS, jsonl_path: Optional[Path] = None,
+                 prompt_price_per_1k: float = 0.0, completion_price_per_1k: float = 0.0) -> None:
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.prompt_price_per_1k = prompt_price_per_1k
+        self.completion_price_per_1k = completion_price_per_1k
+        self._records: deque = deque(maxlen=max_records)
+        self._totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        if self.jsonl_path:
+            self.jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # --- recording ---
+
+    def cost(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> float:
+        return ((prompt_tokens or 0) * self.prompt_price_per_1k + (completion_tokens or 0) * self.completion_price_per_1k) / 1000
+
+    def record(self, agent: str, kind: str, wall_ms: float, ttft_ms: Optional[float] = None,
+               prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None,
+               cache_hit: bool = False, error: Optional[str] = None, tokens_estimated: bool = False) -> Dict[str, Any]:
+        """Stores one call record and updates the per-agent totals. Returns the record."""
+        record = {
+            "ts": round(time.time(), 3),
+            "agent": agent,
+            "kind": kind,
+            "wall_ms": round(wall_ms, 2),
+            "ttft_ms": round(ttft_ms, 2) if ttft_ms is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "tokens_estimated": tokens_estimated,
+            "cache_hit": cache_hit,
+            "error": error,
+            "cost": round(self.cost(prompt_tokens, completion_tokens), 6) if not cache_hit else 0.0,
+        }
+        with self._lock:
+            self._records.append(record)
+            totals = self._totals.setdefault(agent, {
+                "calls": 0, "errors": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "cost": 0.0, "wall_seconds": 0.0,
+            })
+            totals["calls"] += 1
+            totals["errors"] += error is not None
+            totals["cache_hits"] += cache_hit
+            totals["prompt_tokens"] += prompt_tokens or 0
+            totals["completion_tokens"] += completion_tokens or 0
+            totals["cost"] += record["cost"]
+            totals["wall_seconds"] += wall_ms / 1000
+            if self.jsonl_path:
+                with self.jsonl_path.open("a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+        return record
+
+    @contextmanager
+    def span(self, agent: str, kind: str) -> Iterator[Dict[str, Any]]:
+        """
+        Times the enclosed block and records it when the block exits. The block
+        can fill in `ttft_ms`, token counts, `cache_hit` and `tokens_estimated`
+        on the yielded dict. An exception is recorded by class name and re-raised.
+        """
+        fields: Dict[str, Any] = {}
+        start = time.perf_counter()
+        try:
+            yield fields
+        except GeneratorExit:
+            raise  # a stream the consumer stopped reading is not an error
+        except BaseException as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(agent, kind, (time.perf_counter() - start) * 1000, **fields)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._totals.clear()
+
+    # --- aggregation and export ---
+
+    def records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-agent totals plus p50/p95 wall time and TTFT over the recorded window, slowest agent first."""
+        with self._lock:
+            records = list(self._records)
+            totals = {agent: dict(values) for agent, values in self._totals.items()}
+        rows = []
+        for agent, values in totals.items():
+            # Cache hits would hide the latency of real calls, so percentiles use misses only.
+            walls = [r["wall_ms"] for r in records if r["agent"] == agent and not r["cache_hit"] and r["error"] is None]
+            ttfts = [r["ttft_ms"] for r in records if r["agent"] == agent and r["ttft_ms"] is not None]
+            rows.append({
+                "agent": agent,
+                "calls": int(values["calls"]),
+                "errors": int(values["errors"]),
+                "cache_hits": int(values["cache_hits"]),
+                "p50_ms": percentile(walls, 50),
+                "p95_ms": percentile(walls, 95),
+                "ttft_p50_ms": percentile(ttfts, 50),
+                "ttft_p95_ms": percentile(ttfts, 95),
+                "prompt_tokens": int(values["prompt_tokens"]),
+                "completion_tokens": int(values["completion_tokens"]),
+                "cost": round(values["cost"], 4),
+                "total_seconds": round(values["wall_seconds"], 2),
+            })
+        return sorted(rows, key=lambda row: -row["total_seconds"])
+
+    def to_jsonl(self) -> str:
+        """The recorded window as JSON Lines."""
+        return "".join(json.dumps(record) + "\n" for record in self.records())
+
+    def prometheus(self) -> str:
+        """Aggregates in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[tuple]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        rows = self.summary()
+        metric("aira_agent_calls_total", "counter", "Chat completions and fetches per agent.",
+               [({"agent": r["agent"]}, r["calls"]) for r in rows])
+        metric("aira_agent_errors_total", "counter", "Calls that raised an error.",
+               [({"agent": r["agent"]}, r["errors"]) for r in rows])
+        metric("aira_agent_cache_hits_total", "counter", "Calls served from a cache.",
+               [({"agent": r["agent"]}, r["cache_hits"]) for r in rows])
+        metric("aira_agent_tokens_total", "counter", "Tokens used per agent.",
+               [({"agent": r["agent"], "type": "prompt"}, r["prompt_tokens"]) for r in rows]
+               + [({"agent": r["agent"], "type": "completion"}, r["completion_tokens"]) for r in rows])
+        metric("aira_agent_cost_total", "counter", "Estimated spend per agent.",
+               [({"agent": r["agent"]}, r["cost"]) for r in rows])
+        metric("aira_agent_seconds_total", "counter", "Wall time spent in calls per agent.",
+               [({"agent": r["agent"]}, r["total_seconds"]) for r in rows])
+        for name, p50, p95, help_text in (("aira_agent_latency_seconds", "p50_ms", "p95_ms", "Wall time of uncached calls."),
+                                          ("aira_agent_ttft_seconds", "ttft_p50_ms", "ttft_p95_ms", "Time to first token of streams.")):
+            samples = []
+            for r in rows:
+                for quantile, key in (("0.5", p50), ("0.95", p95)):
+                    if r[key] is not None:
+                        samples.append(({"agent": r["agent"], "quantile": quantile}, round(r[key] / 1000, 4)))
+            metric(name, "gauge", help_text, samples)
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int, host: str = "127.0.0.1") -> http.server.ThreadingHTTPServer:
+        """Serves `prometheus()` at http://host:port/metrics from a daemon thread (once per instance)."""
+        if self._server is not None:
+            return self._server
+        telemetry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="telemetry-metrics", daemon=True).start()
+        return self._server
@@ -0,0 +1,32 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The modules live at the repository root, next to app.py.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DUMMY_SECRETS = """\
+AZURE_ENDPOINT = "http://127.0.0.1:9"
+AZURE_API_KEY = "test"
+API_VERSION = "2024-02-01"
+DEPLOYMENT_NAME = "test"
+"""
+
+@pytest.fixture(scope="session")
+def lab(tmp_path_factory):
+    """`lab`, imported against dummy secrets and with its .aira_cache in a temporary directory."""
+    import streamlit as st
+
+    workdir = tmp_path_factory.mktemp("app")
+    secrets = workdir / "secrets.toml"
+    secrets.write_text(DUMMY_SECRETS)
+    st.config.set_option("secrets.files", [str(secrets)])
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import lab
+        yield lab
+    finally:
+        os.chdir(cwd)
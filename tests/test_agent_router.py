@@ -0,0 +1,61 @@
+"""Query routing for the Research Assistant: local TF-IDF decisions and the LLM supervisor fallback."""
+from types import SimpleNamespace
+
+import pytest
+
+from agent_router import AgentRouter, match_agent_name
+
+@pytest.fixture
+def supervisor(lab, monkeypatch):
+    """Stubs the LLM supervisor; records its queries and answers with `supervisor.answer`."""
+    supervisor = SimpleNamespace(answer="Toxicology.", queries=[])
+
+    def run_agent(system_prompt, user_query, task_prompt, *args, **kwargs):
+        supervisor.queries.append(user_query)
+        return supervisor.answer
+
+    monkeypatch.setattr(lab, "run_agent", run_agent)
+    return supervisor
+
+@pytest.mark.parametrize("query, agent", [
+    ("What is the half-life and oral bioavailability of this compound?", "Pharmacokinetics"),
+    ("Which genes are differentially expressed in our RNA-seq data?", "Bioinformatics"),
+    ("What primary endpoint and sample size should a randomized phase 2 trial use?", "Clinical Trials"),
+    ("Does the compound carry hepatotoxicity or cardiotoxicity risk?", "Toxicology"),
+    ("What does the FDA expect in an IND submission?", "Regulatory Affairs"),
+    ("What is the IC50 and receptor binding affinity of this agonist?", "Pharmacodynamics"),
+])
+def test_domain_questions_are_routed_locally(lab, supervisor, query, agent):
+    route = lab.route_query(query)
+    assert route["agent"] == agent
+    assert route["method"] == "local"
+    assert supervisor.queries == []
+
+def test_low_confidence_question_falls_back_to_the_supervisor(lab, supervisor):
+    query = "Summarise the project status for the team."
+    assert not lab.get_agent_router().is_confident(lab.get_agent_router().route(query))
+
+    assert lab.route_query(query) == {"agent": "Toxicology", "method": "llm", "confidence": 0.0}
+    assert supervisor.queries == [query]
+
+    # An unusable supervisor answer keeps the router's best guess.
+    supervisor.answer = "Error: An API error occurred: timeout"
+    route = lab.route_query(query)
+    assert route["method"] == "local" and route["agent"] in lab.SPECIALIST_AGENTS
+    assert lab.route_query(query, use_llm_fallback=False)["method"] == "local"
+    assert len(supervisor.queries) == 2
+
+def test_confidence_is_the_margin_over_the_runner_up():
+    router = AgentRouter({"genes": "gene sequencing genome", "trials": "trial patients endpoint"})
+    clear = router.route("genome sequencing of a gene")
+    assert clear.agent == "genes" and clear.confidence == 1.0
+
+    mixed = router.route("gene trial")
+    assert 0 <= mixed.confidence < router.min_margin
+    assert not router.is_confident(mixed)
+
+def test_match_agent_name_prefers_the_longest_name():
+    agents = ["Clinical Trials", "Trials", "Toxicology"]
+    assert match_agent_name("**clinical trials**.", agents) == "Clinical Trials"
+    assert match_agent_name("I'd pick toxicology", agents) == "Toxicology"
+    assert match_agent_name("none of them", agents) is None
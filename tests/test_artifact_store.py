@@ -0,0 +1,99 @@
+"""ArtifactStore: memory caps, spilling and which files may be evicted from disk."""
+import logging
+
+import pytest
+
+from artifact_store import ArtifactStore
+
+KB = 1024
+
+def blob(tag: str, kb: int = 10) -> bytes:
+    return tag.encode() * (kb * KB // len(tag))
+
+@pytest.fixture
+def make_store(tmp_path):
+    def make(**caps):
+        return ArtifactStore(tmp_path / "artifacts", **caps)
+    return make
+
+def test_session_cap_spills_its_oldest_artifacts(make_store):
+    store = make_store(session_max_bytes=25 * KB)
+    handles = [store.put("s1", blob(tag)) for tag in "abc"]
+
+    stats = store.stats("s1")
+    assert stats["session_bytes"] <= 25 * KB
+    assert stats["session_artifacts"] == 2 and stats["spills"] == 1
+    # The spilled artifact is read back from disk.
+    assert store.get("s1", handles[0]) == blob("a")
+    assert store.stats()["disk_loads"] == 1
+
+def test_global_cap_spills_across_sessions(make_store):
+    store = make_store(session_max_bytes=100 * KB, global_max_bytes=25 * KB)
+    first = store.put("s1", blob("a"))
+    store.put("s2", blob("b"))
+    store.put("s3", blob("c"))
+
+    assert store.stats()["resident_bytes"] <= 25 * KB
+    assert store.stats()["resident_artifacts"] == 2
+    assert store.get("s1", first) == blob("a")
+
+def test_shared_artifact_stays_resident_when_one_session_is_over_its_cap(make_store):
+    store = make_store(session_max_bytes=25 * KB)
+    shared = store.put("s1", blob("shared"))
+    store.put("s2", blob("shared"))
+    store.put("s1", blob("b"))
+    store.put("s1", blob("c"))  # s1 is over its cap; its oldest artifact is shared with s2
+
+    assert store.stats()["spills"] == 0
+    assert store.stats("s1")["session_artifacts"] == 2
+    assert store.stats("s2")["session_bytes"] == shared.size
+    store.get("s2", shared)
+    assert store.stats()["memory_hits"] == 1
+
+def test_files_behind_live_handles_are_never_evicted(make_store, caplog):
+    store = make_store(session_max_bytes=1, disk_max_bytes=15 * KB)  # nothing stays resident
+    kept = store.put("s1", blob("a"))
+    store.put("s2", blob("b"))
+    store.put("s2", blob("c"))
+
+    assert store.stats()["disk_evictions"] == 0
+    assert store.get("s1", kept) == blob("a")
+
+    store.discard("s1", kept)
+    store.put("s2", blob("d"))
+    assert store.stats()["disk_evictions"] == 1
+    with caplog.at_level(logging.WARNING, logger="artifact_store"):
+        assert store.get("s1", kept, default="gone") == "gone"
+    assert "missing" in caplog.text
+    assert store.stats()["missing"] == 1
+
+def test_a_handle_stored_twice_needs_two_discards(make_store):
+    store = make_store(session_max_bytes=1, disk_max_bytes=1)
+    first = store.put("s1", blob("a"))
+    store.put("s1", blob("a"))
+    store.discard("s1", first)
+    store.put("s2", blob("b"))
+    assert store.get("s1", first) == blob("a")
+
+def test_release_forgets_the_session(make_store):
+    store = make_store(disk_max_bytes=15 * KB)
+    handle = store.put("s1", blob("a"))
+    store.release("s1")
+
+    stats = store.stats("s1")
+    assert stats["session_bytes"] == 0 and stats["referenced_artifacts"] == 0
+    assert stats["resident_artifacts"] == 0
+    store.put("s2", blob("b"))
+    assert store.get("s1", handle) is None
+
+def test_dead_sessions_stop_protecting_their_files(tmp_path):
+    live = {"s1"}
+    store = ArtifactStore(tmp_path, session_max_bytes=1, disk_max_bytes=15 * KB,
+                          is_live_session=live.__contains__, reference_grace_seconds=0)
+    handle = store.put("s1", blob("a"))
+    store.put("s2", blob("b"))
+    assert store.get("s1", handle) == blob("a")
+
+    live.clear()
+    store.put("s3", blob("c"))
+    assert store.get("s1", handle) is None
@@ -0,0 +1,80 @@
+"""Batch report runs: the manifest, reuse of finished reports, resuming, and edited questions."""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from report_pipeline import JOB_COMPLETED, JOB_FAILED, ReportStage, StageFailed
+
+@pytest.fixture
+def batch(lab):
+    import batch_reports
+    return batch_reports
+
+@pytest.fixture
+def stages(lab, monkeypatch):
+    """Replaces the report stages with ones that answer from the question and record every call."""
+    calls = []
+    broken = set()
+
+    def stage(name):
+        def run(context):
+            calls.append((context.question, name))
+            if name in broken:
+                raise StageFailed(f"{name} is down")
+            return f"{name} of {context.question}"
+        return ReportStage(name, f"{name}.md", run)
+
+    monkeypatch.setattr(lab, "REPORT_STAGES", [stage(name) for name in ("outline", "research", "draft", "final")])
+    return SimpleNamespace(calls=calls, broken=broken)
+
+def run(batch, questions, output_dir):
+    return batch.run_batch(questions, output_dir, concurrency=2, max_attempts=1, retry_delay=0)
+
+def test_load_questions_slugs_ids_and_drops_duplicates(batch, tmp_path):
+    path = tmp_path / "questions.jsonl"
+    rows = [{"id": 7, "question": "Why?"}, {"id": "7", "question": "Again?"}, {"question": " How? "}, {"question": ""}]
+    path.write_text("\n".join(json.dumps(row) for row in rows), encoding="utf-8")
+
+    questions = batch.load_questions(path)
+    assert [item["question"] for item in questions] == ["Why?", "How?"]
+    assert questions[0]["id"] == batch.question_id("7")
+    assert questions[1]["id"] == batch.question_id("How?")
+
+def test_manifest_lists_every_question_and_finished_reports_are_reused(batch, stages, tmp_path):
+    questions = [{"id": "gut", "question": "Gut?"}, {"id": "brain", "question": "Brain?"}]
+    rows = run(batch, questions, tmp_path)
+
+    manifest = [json.loads(line) for line in (tmp_path / "manifest.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert manifest == rows
+    assert [row["id"] for row in rows] == ["gut", "brain"]
+    assert all(row["status"] == JOB_COMPLETED and not row["reused"] for row in rows)
+    assert (tmp_path / "gut.md").read_text(encoding="utf-8") == "# Gut?\n\nfinal of Gut?\n"
+    assert len(stages.calls) == 8
+
+    rows = run(batch, questions, tmp_path)
+    assert all(row["status"] == JOB_COMPLETED and row["reused"] for row in rows)
+    assert len(stages.calls) == 8
+
+def test_failed_report_resumes_from_its_failed_stage(batch, stages, tmp_path):
+    questions = [{"id": "gut", "question": "Gut?"}]
+    stages.broken.add("draft")
+    [row] = run(batch, questions, tmp_path)
+    assert row["status"] == JOB_FAILED and row["report"] is None
+    assert "draft is down" in row["error"]
+
+    stages.broken.clear()
+    stages.calls.clear()
+    [row] = run(batch, questions, tmp_path)
+    assert row["status"] == JOB_COMPLETED
+    assert stages.calls == [("Gut?", "draft"), ("Gut?", "final")]
+
+def test_edited_question_starts_a_new_job(batch, stages, tmp_path):
+    run(batch, [{"id": "gut", "question": "Gut?"}], tmp_path)
+    stages.calls.clear()
+
+    [row] = run(batch, [{"id": "gut", "question": "Gut and brain?"}], tmp_path)
+    assert not row["reused"]
+    assert row["question"] == "Gut and brain?"
+    assert [stage for _, stage in stages.calls] == ["outline", "research", "draft", "final"]
+    assert (tmp_path / "gut.md").read_text(encoding="utf-8") == "# Gut and brain?\n\nfinal of Gut and brain?\n"
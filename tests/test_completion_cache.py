@@ -0,0 +1,88 @@
+"""CompletionCache: TTL expiry, LRU eviction, stable keys, and the temperature bypass in chat_completion."""
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+import completion_cache
+from completion_cache import CompletionCache
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(completion_cache, "time", clock)
+    return clock
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+    cache = CompletionCache(tmp_path / "cache.sqlite3")
+    cache.set("short", "a", ttl=10)
+    cache.set("long", "b", ttl=100)
+
+    clock.now += 50
+    assert cache.get("short") is None
+    assert cache.get("long") == "b"
+    assert cache.stats()["entries"] == 1
+
+def test_least_recently_used_entries_are_evicted_at_capacity(tmp_path, clock):
+    cache = CompletionCache(tmp_path / "cache.sqlite3", max_bytes=12)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.set(key, "1234", ttl=3600)
+    clock.now += 1
+    assert cache.get("a") == "1234"                         # now "b" is the least recently used
+
+    clock.now += 1
+    cache.set("d", "1234", ttl=3600)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == ["1234"] * 3
+    assert cache.stats()["bytes"] == 12
+
+def test_values_larger_than_the_cache_are_not_stored(tmp_path):
+    cache = CompletionCache(tmp_path / "cache.sqlite3", max_bytes=4)
+    cache.set("big", "12345", ttl=3600)
+    assert cache.get("big") is None
+
+def test_key_ignores_field_order_but_not_message_order():
+    messages = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+    reordered_fields = [{"content": m["content"], "role": m["role"]} for m in messages]
+
+    key = CompletionCache.make_key("gpt", messages, 0.2, 100)
+    assert CompletionCache.make_key("gpt", reordered_fields, 0.2, 100) == key
+    assert CompletionCache.make_key("gpt", messages[::-1], 0.2, 100) != key
+    assert CompletionCache.make_key("gpt", messages, 0.3, 100) != key
+    assert CompletionCache.make_key("gpt", messages, 0.2, 100, {"type": "json_object"}) != key
+
+@pytest.fixture
+def client():
+    """A stand-in Azure client that answers every request with a new completion."""
+    requests = []
+
+    def create(**request):
+        requests.append(request)
+        message = SimpleNamespace(content=f"answer {len(requests)}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)), requests=requests)
+
+def test_creative_temperatures_bypass_the_cache(lab, client):
+    messages = [{"role": "user", "content": f"Question {uuid.uuid4()}"}]
+    cold = lab.CACHE_BYPASS_TEMPERATURE - 0.5
+    hot = lab.CACHE_BYPASS_TEMPERATURE
+
+    first = lab.chat_completion("test", messages, 50, cold, client=client)
+    assert lab.chat_completion("test", messages, 50, cold, client=client) == first
+    assert len(client.requests) == 1
+
+    assert lab.chat_completion("test", messages, 50, hot, client=client) == "answer 2"
+    assert lab.chat_completion("test", messages, 50, hot, client=client) == "answer 3"
+
+    forced = lab.chat_completion("test", messages, 50, hot, use_cache=True, client=client)
+    assert lab.chat_completion("test", messages, 50, hot, use_cache=True, client=client) == forced
+    assert len(client.requests) == 4
@@ -0,0 +1,158 @@
+"""Correlation screen and fit band, checked against pandas, numpy and scipy."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import correlation
+
+def make_frame(rows: int = 600, gaps: bool = False, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    a = rng.normal(size=rows)
+    frame = pd.DataFrame({
+        "a": a,
+        "b": 2 * a + rng.normal(size=rows),
+        "c": np.exp(a) + rng.normal(scale=0.1, size=rows),   # monotone in a: Spearman > Pearson
+        "d": rng.normal(size=rows),
+        "e": rng.integers(0, 5, size=rows).astype(float),     # many ties
+    })
+    if gaps:
+        for name, fraction in [("b", 0.02), ("d", 0.3)]:
+            frame.loc[rng.random(rows) < fraction, name] = np.nan
+    return frame
+
+def screen(frame: pd.DataFrame, block_rows: int = 128) -> dict:
+    values = frame.to_numpy(dtype=np.float64)
+    columns = list(frame.columns)
+
+    def read_blocks():
+        return (values[start:start + block_rows] for start in range(0, len(values), block_rows))
+
+    def read_columns(names):
+        return frame[names].to_numpy(dtype=np.float64)
+
+    return correlation.screen_correlations(read_blocks, read_columns, columns, len(frame), block_rows=block_rows)
+
+def test_screen_matches_pandas_without_gaps():
+    frame = make_frame()
+    result = screen(frame)
+
+    np.testing.assert_allclose(result["pearson"], frame.corr().to_numpy(), atol=1e-10)
+    np.testing.assert_allclose(result["spearman"], frame.corr("spearman").to_numpy(), atol=1e-10)
+
+def test_screen_pearson_is_pairwise_complete():
+    frame = make_frame(gaps=True)
+    result = screen(frame)
+
+    np.testing.assert_allclose(result["pearson"], frame.corr().to_numpy(), atol=1e-10)
+    pair = result["table"].set_index(["column_x", "column_y"]).loc[("b", "d")]
+    assert pair["n"] == frame[["b", "d"]].dropna().shape[0]
+
+def test_screen_spearman_ranks_each_pair_over_its_complete_rows(monkeypatch):
+    frame = make_frame(gaps=True)
+    frame.loc[::7, "e"] = np.nan                             # gaps in a column full of ties
+    expected = frame.corr("spearman").to_numpy()
+
+    np.testing.assert_allclose(screen(frame)["spearman"], expected, atol=1e-10)
+    # Columns are re-ranked in blocks; blocks of a single column give the same result.
+    monkeypatch.setattr(correlation, "SCREEN_RANK_CELLS", 1)
+    np.testing.assert_allclose(screen(frame)["spearman"], expected, atol=1e-10)
+
+def test_screen_table_p_and_q_values():
+    stats = pytest.importorskip("scipy.stats")
+    frame = make_frame(gaps=True)
+    table = screen(frame)["table"]
+
+    assert len(table) == 10
+    for row in table.itertuples():
+        pair = frame[[row.column_x, row.column_y]].dropna()
+        expected = stats.pearsonr(pair.iloc[:, 0], pair.iloc[:, 1])
+        assert row.pearson_r == pytest.approx(expected.statistic, abs=1e-10)
+        assert row.pearson_p == pytest.approx(expected.pvalue, rel=1e-6, abs=1e-300)
+    np.testing.assert_allclose(table["pearson_q"], stats.false_discovery_control(table["pearson_p"]), rtol=1e-12)
+    np.testing.assert_allclose(table["spearman_q"], stats.false_discovery_control(table["spearman_p"]), rtol=1e-12)
+    # Most significant first.
+    assert table.iloc[0][["column_x", "column_y"]].tolist() in (["a", "b"], ["a", "c"])
+
+def test_benjamini_hochberg_matches_scipy_and_keeps_nans():
+    stats = pytest.importorskip("scipy.stats")
+    p = np.random.default_rng(1).random(200) ** 3
+    np.testing.assert_allclose(correlation.benjamini_hochberg(p), stats.false_discovery_control(p), rtol=1e-12)
+
+    q = correlation.benjamini_hochberg(np.array([0.01, np.nan, 0.04, 0.03]))
+    assert np.isnan(q[1])
+    np.testing.assert_allclose(q[[0, 2, 3]], stats.false_discovery_control([0.01, 0.04, 0.03]), rtol=1e-12)
+
+def test_ranks_spill_to_a_memory_mapped_file(monkeypatch):
+    frame = make_frame(gaps=True)
+    in_memory = screen(frame)
+
+    spilled = []
+    memmap = np.memmap
+
+    def recording_memmap(filename, *args, **kwargs):
+        spilled.append((filename, kwargs.get("dtype")))
+        return memmap(filename, *args, **kwargs)
+
+    monkeypatch.setattr(correlation, "SCREEN_IN_MEMORY_BYTES", 0)
+    monkeypatch.setattr(np, "memmap", recording_memmap)
+    result = screen(frame)
+
+    assert len(spilled) == 1 and spilled[0][1] == np.float64
+    assert not spilled[0][0].exists()       # the spill directory is removed afterwards
+    np.testing.assert_array_equal(result["spearman"], in_memory["spearman"])
+    pd.testing.assert_frame_equal(result["table"], in_memory["table"])
+
+def test_average_ranks_are_exact_past_float32_range():
+    rows = 2**24 + 3
+    values = np.arange(rows, dtype=np.float64)[:, None]
+    ranks = correlation.average_ranks(values)
+    assert ranks.dtype == np.float64
+    assert ranks[-1, 0] == rows and ranks[-2, 0] == rows - 1
+
+    tied = correlation.average_ranks(np.array([[3.0], [1.0], [3.0], [np.nan], [2.0]]))
+    np.testing.assert_array_equal(tied[:, 0], [3.5, 1.0, 3.5, np.nan, 2.0])
+
+def test_linear_fit_and_band():
+    rng = np.random.default_rng(2)
+    x = rng.uniform(0, 10, size=400)
+    y = 1.5 * x - 2 + rng.normal(size=400)
+    fit = correlation.linear_fit(x, y)
+
+    slope, intercept = np.polyfit(x, y, 1)
+    assert fit.slope == pytest.approx(slope) and fit.intercept == pytest.approx(intercept)
+    assert fit.r == pytest.approx(np.corrcoef(x, y)[0, 1])
+
+    # Half-width of the band: t * s * sqrt(1/n + (x - mean)^2 / Sxx), narrowest at the mean of x.
+    residuals = y - (intercept + slope * x)
+    s = np.sqrt(residuals @ residuals / (len(x) - 2))
+    grid = np.array([x.mean(), 0.0, 10.0])
+    fitted, lower, upper = fit.band(grid)
+    expected = correlation.t_critical(0.95, len(x) - 2) * s * np.sqrt(
+        1 / len(x) + (grid - x.mean()) ** 2 / ((x - x.mean()) ** 2).sum())
+    np.testing.assert_allclose(upper - fitted, expected)
+    np.testing.assert_allclose(fitted - lower, expected)
+    assert (upper - lower)[0] < (upper - lower)[1:].min()
+
+    with pytest.raises(ValueError):
+        correlation.linear_fit(np.ones(5), np.arange(5.0))
+
+def test_t_critical_fallback_is_close_to_scipy(monkeypatch):
+    stats = pytest.importorskip("scipy.stats")
+    monkeypatch.setattr(correlation, "scipy_stats", None)
+    for dof in (10, 30, 1000):
+        assert correlation.t_critical(0.95, dof) == pytest.approx(stats.t.ppf(0.975, dof), rel=2e-3)
+
+def test_plot_switches_from_scatter_to_hexbin():
+    pytest.importorskip("matplotlib")
+    rng = np.random.default_rng(3)
+    x = rng.normal(size=300)
+    y = x + rng.normal(size=300)
+    x[:5] = np.nan                          # rows missing a value are left out
+
+    scatter = correlation.correlation_plot_png(x, y, "x", "y", max_scatter_points=1000)
+    hexbin = correlation.correlation_plot_png(x, y, "x", "y", max_scatter_points=100)
+
+    assert scatter["mode"] == "scatter" and hexbin["mode"] == "hexbin"
+    for plot in (scatter, hexbin):
+        assert plot["png"].startswith(b"\x89PNG") and plot["n"] == 295
+    assert scatter["slope"] == hexbin["slope"]
@@ -0,0 +1,98 @@
+"""DatasetStore: dtype inference over chunked CSVs, exact round trips, and the open-table LRU."""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset_store import DatasetStore
+
+def csv_bytes(frame):
+    return io.BytesIO(frame.to_csv(index=False).encode("utf-8"))
+
+def ingest(tmp_path, frame, chunk_rows=3, **kwargs):
+    store = DatasetStore(tmp_path, chunk_rows=chunk_rows, **kwargs)
+    handle = store.ingest(csv_bytes(frame), name="data.csv")
+    return store, handle
+
+def test_integers_get_the_narrowest_type_that_holds_their_range(tmp_path):
+    frame = pd.DataFrame({
+        "tiny": [-128, 0, 5, 127, 1, 2, 3],
+        "short": [0, 1, 300, -300, 4, 5, 6],
+        "wide": [0, 1, 70_000, 2, 3, 4, 5],
+        "huge": [0, 1, 2, 3, 4, 5, 3_000_000_000],            # the extreme value is in the last chunk
+    })
+    store, handle = ingest(tmp_path, frame)
+
+    assert handle.columns == {"tiny": "int8", "short": "int16", "wide": "int32", "huge": "int64"}
+    pd.testing.assert_frame_equal(store.load(handle), frame, check_dtype=False)
+
+def test_integers_with_gaps_are_stored_as_floats(tmp_path):
+    frame = pd.DataFrame({
+        "counts": [1, 2, None, 4, 5, 6, 7],
+        "ids": [16_777_217, None, 1, 2, 3, 4, 5],           # 2**24 + 1 is not a float32
+    })
+    store, handle = ingest(tmp_path, frame)
+
+    assert handle.columns == {"counts": "float32", "ids": "float64"}
+    loaded = store.load(handle)
+    assert loaded["ids"].iloc[0] == 16_777_217
+    pd.testing.assert_frame_equal(loaded, frame, check_dtype=False)
+
+def test_floats_use_float32_only_where_that_loses_nothing(tmp_path):
+    frame = pd.DataFrame({
+        "halves": [0.5, 1.25, -2.75, 3.0, 4.5, 5.5, 6.0],
+        "measured": [0.1, 2.718281828, 3.14159265, 1e-3, 5.5, 6.25, 7.125],
+        "whole": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 123_456_789.0],
+    })
+    store, handle = ingest(tmp_path, frame)
+
+    assert handle.columns == {"halves": "float32", "measured": "float32", "whole": "float64"}
+    loaded = store.load(handle)
+    np.testing.assert_array_equal(loaded["halves"], frame["halves"])
+    np.testing.assert_allclose(loaded["measured"], frame["measured"], rtol=1e-6)
+    np.testing.assert_array_equal(loaded["whole"], frame["whole"])
+
+def test_repetitive_text_becomes_a_category_and_distinct_text_stays_strings(tmp_path):
+    frame = pd.DataFrame({
+        "group": ["treated", "control", "treated", "control", "control", "treated", "treated", "control"],
+        "sample": [f"S-{i:03d}" for i in range(8)],
+    })
+    store, handle = ingest(tmp_path, frame)
+
+    assert handle.columns == {"group": "category", "sample": "string"}
+    loaded = store.load(handle)
+    assert list(loaded["group"].cat.categories) == ["control", "treated"]
+    assert loaded.astype(str).equals(frame)
+
+def test_columns_mixing_text_and_numbers_across_chunks_keep_their_spelling(tmp_path):
+    text = "well,value\n1.50,1\n007,2\n3,3\nA12,4\nB7,5\n"
+    store = DatasetStore(tmp_path, chunk_rows=2)
+    handle = store.ingest(io.BytesIO(text.encode("utf-8")), name="plate.csv")
+
+    assert handle.columns["well"] == "string"               # numbers in the first chunks, text later
+    assert handle.numeric_columns == ["value"]
+    assert list(store.load(handle)["well"]) == ["1.50", "007", "3", "A12", "B7"]
+
+def test_reingesting_the_same_bytes_reuses_the_stored_copy(tmp_path):
+    frame = pd.DataFrame({"x": [1, 2, 3]})
+    store, handle = ingest(tmp_path, frame)
+    mtime = handle.path.stat().st_mtime_ns
+
+    again = store.ingest(csv_bytes(frame), name="copy.csv")
+    assert again.key == handle.key and again.path.stat().st_mtime_ns == mtime
+    assert len(list(tmp_path.glob("*.arrow"))) == 1
+
+def test_only_the_most_recently_read_tables_stay_open(tmp_path):
+    store = DatasetStore(tmp_path, max_tables=2)
+    handles = [store.ingest(csv_bytes(pd.DataFrame({"x": [i, i + 1]})), name=f"{i}.csv") for i in range(3)]
+    assert list(store._tables) == [handles[1].key, handles[2].key]
+
+    store.load(handles[1])                                  # now handles[2] is the least recently read
+    store.load(handles[0])
+    assert list(store._tables) == [handles[1].key, handles[0].key]
+    assert list(store.load(handles[2])["x"]) == [2, 3]      # evicted tables are mapped again on demand
+
+def test_open_unknown_key_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        DatasetStore(tmp_path).open("0" * 32)
@@ -0,0 +1,136 @@
+"""EmailOutbox against a local SMTP stand-in: queueing, retries and delivery."""
+import socketserver
+import sqlite3
+import threading
+
+import pytest
+
+from local_auth import EmailOutbox
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: greets, accepts every command and stores each DATA payload."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stub ESMTP")
+        data, lines = False, []
+        for raw in self.rfile:
+            line = raw.decode().rstrip("\r\n")
+            if data:
+                if line != ".":
+                    lines.append(line[1:] if line.startswith("..") else line)
+                    continue
+                data = False
+                with server.lock:
+                    if server.reject_data:
+                        server.reject_data -= 1
+                        self.reply("451 try again later")
+                    else:
+                        server.messages.append("\n".join(lines))
+                        self.reply("250 queued")
+                lines = []
+                continue
+            verb = line[:4].upper()
+            if verb == "DATA":
+                data = True
+                self.reply("354 end with <CRLF>.<CRLF>")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:  # EHLO, HELO, MAIL, RCPT, NOOP, RSET
+                self.reply("250 ok")
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = []
+        self.reject_data = 0  # how many DATA commands to refuse with a transient error
+
+@pytest.fixture
+def smtp_server():
+    server = _SMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def make_outbox(tmp_path, smtp_server):
+    outboxes = []
+
+    def make(**options):
+        options = {"smtp_server": "127.0.0.1", "smtp_port": smtp_server.server_address[1], "use_starttls": False,
+                   "backoff_seconds": 0.05, **options}
+        outbox = EmailOutbox(tmp_path / "outbox.db", "aira@example.com", "", **options)
+        outboxes.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in outboxes:
+        outbox.stop()
+
+def test_queued_mail_is_delivered_over_one_connection(make_outbox, smtp_server):
+    outbox = make_outbox()
+    for n in range(3):
+        outbox.enqueue("user@example.com", f"Report {n}", "Body")
+    assert outbox.flush(timeout=10)
+    assert [f"Subject: Report {n}" in message for n, message in enumerate(smtp_server.messages)] == [True] * 3
+    assert smtp_server.connections == 1
+
+def test_transient_failure_is_retried(make_outbox, smtp_server):
+    smtp_server.reject_data = 2
+    outbox = make_outbox()
+    outbox.enqueue("user@example.com", "Retried", "Body")
+    assert outbox.flush(timeout=10)
+    assert len(smtp_server.messages) == 1
+    assert smtp_server.reject_data == 0
+
+def test_message_fails_after_max_attempts(make_outbox, smtp_server, tmp_path):
+    smtp_server.reject_data = 10
+    outbox = make_outbox(max_attempts=2)
+    outbox.enqueue("user@example.com", "Never delivered", "Body")
+    assert outbox.flush(timeout=10)  # nothing is pending any more...
+    with sqlite3.connect(tmp_path / "outbox.db") as conn:
+        status, attempts, error = conn.execute("SELECT status, attempts, last_error FROM outbox").fetchone()
+    assert (status, attempts) == ("failed", 2)  # ...because the message was given up on
+    assert "try again later" in error
+    assert smtp_server.messages == []
+
+def test_mail_queued_before_a_restart_is_delivered(make_outbox, smtp_server):
+    stopped = make_outbox()
+    stopped.stop()
+    stopped.enqueue("user@example.com", "Queued while down", "Body")
+    assert stopped.pending_count() == 1
+
+    restarted = make_outbox()
+    assert restarted.flush(timeout=10)
+    assert len(smtp_server.messages) == 1
+
+def test_worker_survives_database_errors(make_outbox, smtp_server, caplog):
+    outbox = make_outbox()
+    drain = outbox._drain
+    failures = []
+
+    def locked_once(conn):
+        if not failures:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return drain(conn)
+
+    outbox._drain = locked_once
+    outbox.enqueue("user@example.com", "After a lock", "Body")
+    assert outbox.flush(timeout=10)
+    assert outbox._worker.is_alive()
+    assert len(smtp_server.messages) == 1
+    assert "database is locked" in caplog.text
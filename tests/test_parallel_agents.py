@@ -0,0 +1,119 @@
+"""Concurrent agents and section editors with a stubbed model: results keep their order and failures stay local."""
+import json
+import re
+import threading
+import time
+
+import pytest
+
+AGENTS = {name: (f"You are the {name} assistant.", "Answer briefly.") for name in
+          ("Bioinformatics", "Pharmacokinetics", "Toxicology", "Regulatory Affairs")}
+
+@pytest.fixture
+def specialists(lab, monkeypatch):
+    """
+    Stubs chat_completion for `run_agent`. Every call waits until all agents are
+    in flight (so a serial fan-out fails), then the first agent answers last.
+    Agents named in `failing` raise, those in `slow` never answer in time.
+    """
+    state = {"failing": set(), "slow": set(), "barrier": threading.Barrier(len(AGENTS), timeout=5)}
+    names = list(AGENTS)
+
+    def chat_completion(agent, messages, *args, **kwargs):
+        name = next(n for n in names if n in messages[0]["content"])
+        if name in state["slow"]:
+            time.sleep(1.0)
+            return f"{name} answer"
+        state["barrier"].wait()
+        time.sleep(0.02 * (len(names) - names.index(name)))
+        if name in state["failing"]:
+            raise RuntimeError("quota exceeded")
+        return f"  {name} answer  "
+
+    monkeypatch.setattr(lab, "chat_completion", chat_completion)
+    return state
+
+def test_agents_run_concurrently_and_results_keep_their_order(lab, specialists):
+    results = lab.run_agents_concurrently("Is this target druggable?", AGENTS)
+    assert list(results) == list(AGENTS)
+    assert results == {name: f"{name} answer" for name in AGENTS}
+
+def test_one_failing_agent_is_reported_without_affecting_the_others(lab, specialists):
+    specialists["failing"].add("Toxicology")
+    results = lab.run_agents_concurrently("Is this target druggable?", AGENTS)
+
+    assert list(results) == list(AGENTS)
+    assert results["Toxicology"] == "Error: An API error occurred: quota exceeded"
+    assert all(results[name] == f"{name} answer" for name in AGENTS if name != "Toxicology")
+
+def test_a_slow_agent_times_out_alone(lab, specialists):
+    specialists["slow"].add("Regulatory Affairs")
+    specialists["barrier"] = threading.Barrier(len(AGENTS) - 1, timeout=5)
+    start = time.monotonic()
+    results = lab.run_agents_concurrently("Is this target druggable?", AGENTS, timeout=0.5)
+
+    assert time.monotonic() - start < 1.0
+    assert list(results) == list(AGENTS)
+    assert results["Regulatory Affairs"].startswith("Error: The Regulatory Affairs agent timed out")
+    assert all(results[name] == f"{name} answer" for name in AGENTS if name != "Regulatory Affairs")
+
+SECTIONS = ["Introduction", "Methods", "Results", "Conclusion"]
+DRAFT = "\n\n".join(f"## {section}\n\n{section} draft [Doe, 2024](https://example.org/{n})."
+                    for n, section in enumerate(SECTIONS))
+
+@pytest.fixture
+def editors(lab, monkeypatch):
+    """
+    Stubs chat_completion for the section editors (the first section finishes
+    last) and the global pass. Sections named in `failing` raise.
+    """
+    state = {"failing": set(), "threads": set()}
+
+    def chat_completion(agent, messages, *args, **kwargs):
+        if agent == "run_global_editor_pass":
+            return json.dumps({"transitions": {}, "conclusion": ""})
+        section = re.search(r"editing ONE section, '([^']+)'", messages[0]["content"]).group(1)
+        state["threads"].add(threading.get_ident())
+        time.sleep(0.02 * (len(SECTIONS) - SECTIONS.index(section)))
+        if section in state["failing"]:
+            raise RuntimeError("rate limited")
+        n = SECTIONS.index(section)
+        return f"{section} edited [Doe, 2024](https://example.org/{n})."
+
+    monkeypatch.setattr(lab, "chat_completion", chat_completion)
+    return state
+
+def edit(lab, **kwargs):
+    progress = []
+    result = lab.run_editor_agents_parallel(
+        "Does sleep clear amyloid?", {"sections": SECTIONS}, DRAFT,
+        on_section_complete=lambda *args: progress.append((threading.get_ident(), *args)), **kwargs)
+    return result, progress
+
+def test_sections_are_edited_in_parallel_and_reassembled_in_order(lab, editors):
+    result, progress = edit(lab)
+
+    assert result["warnings"] == []
+    assert result["report"] == "\n\n".join(
+        f"## {section}\n\n{section} edited [Doe, 2024](https://example.org/{n})." for n, section in enumerate(SECTIONS))
+    assert len(editors["threads"]) > 1
+    # Progress is reported on the calling thread, once per section.
+    assert [(thread, completed, total) for thread, _, completed, total in progress] == \
+        [(threading.get_ident(), n, len(SECTIONS)) for n in range(1, len(SECTIONS) + 1)]
+    assert {section for _, section, _, _ in progress} == set(SECTIONS)
+
+def test_one_failing_section_keeps_its_draft_and_is_reported(lab, editors):
+    editors["failing"].add("Methods")
+    result, progress = edit(lab)
+
+    assert result["warnings"] == ["Error with Editor Agent for section 'Methods': rate limited The draft text was kept."]
+    assert "## Methods\n\nMethods draft [Doe, 2024](https://example.org/1)." in result["report"]
+    assert "## Results\n\nResults edited" in result["report"]
+    assert [line for line in result["report"].splitlines() if line.startswith("## ")] == [f"## {s}" for s in SECTIONS]
+    assert len(progress) == len(SECTIONS)
+
+def test_every_section_failing_returns_the_error(lab, editors):
+    editors["failing"].update(SECTIONS)
+    result, _ = edit(lab)
+    assert result["report"].startswith("Error with Editor Agent for section")
+    assert len(result["warnings"]) == len(SECTIONS)
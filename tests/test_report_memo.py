@@ -0,0 +1,173 @@
+"""Stage memo scoping and incremental report regeneration with a stubbed model."""
+import hashlib
+import json
+import uuid
+
+import pytest
+
+from report_memo import StageMemo
+
+OUTLINE = {
+    "sections": ["Introduction", "Literature Review", "Methods", "Results"],
+    "subsections": {
+        "Introduction": ["Background", "Aims"],
+        "Literature Review": ["Prior work"],
+        "Methods": ["Cohort", "Assays"],
+        "Results": ["Findings"],
+    },
+    "descriptions": {},
+}
+
+def test_memo_is_scoped_per_report(tmp_path):
+    memo = StageMemo(tmp_path / "memo.sqlite3")
+    memo.set("report-a", "writer", ["Intro", "outline"], "text")
+
+    assert memo.get("report-a", "writer", ["Intro", "outline"]) == "text"
+    assert memo.get("report-b", "writer", ["Intro", "outline"]) is None
+    assert memo.get("report-a", "writer", ["Intro", "changed"]) is None
+    assert memo.get("report-a", "editor", ["Intro", "outline"]) is None
+
+def test_memo_run_reuses_unchanged_inputs_and_skips_errors(tmp_path):
+    memo = StageMemo(tmp_path / "memo.sqlite3")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "Error: try later" if len(calls) == 1 else "done"
+
+    is_error = lambda text: text.startswith("Error")
+    assert memo.run("r", "stage", [1], compute, is_error) == ("Error: try later", False)
+    assert memo.run("r", "stage", [1], compute, is_error) == ("done", False)
+    assert memo.run("r", "stage", [1], compute, is_error) == ("done", True)
+    assert len(calls) == 2
+
+def test_no_scope_bypasses_the_memo(tmp_path):
+    memo = StageMemo(tmp_path / "memo.sqlite3")
+    memo.set(None, "stage", [1], "stored")
+    assert memo.get(None, "stage", [1]) is None
+    assert memo.run(None, "stage", [1], lambda: "fresh") == ("fresh", False)
+
+@pytest.fixture
+def model(lab, monkeypatch):
+    """Stubs the model: every answer is derived from its prompt and keeps the prompt's citations."""
+    calls = []
+
+    def answer(agent, messages):
+        calls.append(agent)
+        prompt = messages[0]["content"]
+        if agent == "run_global_editor_pass":
+            return json.dumps({"transitions": {}, "conclusion": ""})
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:10]
+        citations = " ".join(dict.fromkeys(lab.extract_citations(prompt)))
+        return f"{agent} notes {digest}. {citations} [Doe, 2024](https://example.org/{digest})"
+
+    monkeypatch.setattr(lab, "chat_completion", lambda agent, messages, *args, **kwargs: answer(agent, messages))
+    monkeypatch.setattr(lab, "stream_chat_completion", lambda agent, messages, *args, **kwargs: iter([answer(agent, messages)]))
+    return calls
+
+def edit_methods(outline):
+    edited = json.loads(json.dumps(outline))
+    edited["subsections"]["Methods"] = ["Cohort", "Single-cell sequencing"]
+    return edited
+
+def test_unchanged_report_is_fully_reused(lab, model):
+    report_id = uuid.uuid4().hex
+    first = lab.regenerate_report("How does the gut influence the brain?", OUTLINE, report_id=report_id)
+    assert first["reused"] == []
+    calls = len(model)
+
+    again = lab.regenerate_report("How does the gut influence the brain?", OUTLINE, report_id=report_id)
+    assert again["rerun"] == []
+    assert again["final"] == first["final"]
+    assert len(model) == calls
+
+def test_new_report_runs_afresh(lab, model):
+    lab.regenerate_report("Same question", OUTLINE, report_id=uuid.uuid4().hex)
+    other = lab.regenerate_report("Same question", OUTLINE, report_id=uuid.uuid4().hex)
+    assert other["reused"] == []
+
+def test_research_ends_with_one_compiled_reference_list(lab, model):
+    research = lab.regenerate_report("How does the gut influence the brain?", OUTLINE, through="research")["research"]
+
+    notes = lab.split_research_sections(research, OUTLINE["sections"])
+    assert list(notes) == OUTLINE["sections"]
+    citations = [c for section in OUTLINE["sections"] for c in lab.extract_citations(notes[section])]
+    assert len(set(citations)) == len(OUTLINE["sections"])
+    assert research.count("References") == 1
+    assert research.endswith("## Compiled References\n\n" + "\n".join(f"- {c}" for c in dict.fromkeys(citations)))
+
+def test_writers_get_their_own_notes_and_the_references_they_cite(lab, model, monkeypatch):
+    research = lab.regenerate_report("How does the gut influence the brain?", OUTLINE, through="research")["research"]
+    notes = lab.split_research_sections(research, OUTLINE["sections"])
+    prompts = {}
+    monkeypatch.setattr(lab, "run_writer_agent", lambda section, outline, data: prompts.setdefault(section, data))
+
+    lab.run_writer_agents_parallel(OUTLINE, research)
+
+    for section in OUTLINE["sections"]:
+        [citation] = lab.extract_citations(notes[section])
+        assert prompts[section].endswith(f"### References\n- {citation}")
+        others = [c for s in OUTLINE["sections"] if s != section for c in lab.extract_citations(notes[s])]
+        assert not any(c in prompts[section] for c in others)
+
+def test_writer_stream_writes_the_blocking_writers_draft(lab, model):
+    report_id = uuid.uuid4().hex
+    research = lab.regenerate_report("How does the gut influence the brain?", OUTLINE, through="research",
+                                     report_id=report_id)["research"]
+    blocking = lab.run_writer_agents_parallel(OUTLINE, research)
+
+    progress = []
+    stream = lab.stream_writer_stage(OUTLINE, research, report_id, on_section_complete=lambda *update: progress.append(update))
+    streamed = "".join(stream)
+    assert stream.draft == blocking["draft"] and stream.errors == {} and stream.reused == []
+    assert sorted(section for section, _, _ in progress) == sorted(OUTLINE["sections"])
+    assert [(completed, total) for _, completed, total in progress] == [(n, 4) for n in range(1, 5)]
+    assert streamed.strip() == stream.draft.strip()
+
+    again = lab.stream_writer_stage(OUTLINE, research, report_id)
+    list(again)
+    assert again.draft == stream.draft and again.reused == OUTLINE["sections"]
+
+def test_writer_stream_retries_a_section_that_fails_before_any_text(lab, model, monkeypatch):
+    research = lab.regenerate_report("How does the gut influence the brain?", OUTLINE, through="research")["research"]
+    stream_chat_completion = lab.stream_chat_completion
+    failures = [RuntimeError("busy")]
+
+    def flaky(agent, messages, *args, **kwargs):
+        if agent == "run_writer_agent" and "'Methods'" in messages[0]["content"] and failures:
+            raise failures.pop()
+        return stream_chat_completion(agent, messages, *args, **kwargs)
+
+    monkeypatch.setattr(lab, "stream_chat_completion", flaky)
+    stream = lab.stream_writer_stage(OUTLINE, research)
+    streamed = "".join(stream)
+    assert not failures and stream.errors == {} and "Error" not in streamed
+    assert stream.draft == lab.run_writer_agents_parallel(OUTLINE, research)["draft"]
+
+def test_one_section_edit_reruns_only_that_section(lab, model):
+    report_id = uuid.uuid4().hex
+    first = lab.regenerate_report("How does the gut influence the brain?", OUTLINE, report_id=report_id)
+    model.clear()
+
+    update = lab.regenerate_report("How does the gut influence the brain?", edit_methods(OUTLINE), report_id=report_id)
+
+    assert update["rerun"] == ["Research: Methods", "Writer: Methods", "Editor"]
+    assert sorted(update["reused"]) == sorted(
+        [f"Research: {s}" for s in OUTLINE["sections"] if s != "Methods"]
+        + [f"Writer: {s}" for s in OUTLINE["sections"] if s != "Methods"])
+    assert model == ["run_research_agent", "run_writer_agent", "run_editor_agent"]
+    # The other sections' draft text is exactly what was written before.
+    old = lab.split_draft_sections(first["draft"], OUTLINE["sections"])
+    new = lab.split_draft_sections(update["draft"], OUTLINE["sections"])
+    assert {s for s in OUTLINE["sections"] if old[s] != new[s]} == {"Methods"}
+
+def test_one_section_edit_of_a_long_report_reedits_it_and_its_neighbours(lab, model, monkeypatch):
+    monkeypatch.setattr(lab, "EDITOR_SINGLE_PASS_MAX_CHARS", 0)
+    report_id = uuid.uuid4().hex
+    lab.regenerate_report("How does the gut influence the brain?", OUTLINE, report_id=report_id)
+
+    update = lab.regenerate_report("How does the gut influence the brain?", edit_methods(OUTLINE), report_id=report_id)
+
+    assert update["rerun"] == ["Research: Methods", "Writer: Methods", "Edit: Literature Review", "Edit: Methods",
+                               "Edit: Results", "Global edit"]
+    assert "Edit: Introduction" in update["reused"]
@@ -0,0 +1,52 @@
+"""ReportJobRunner: jobs resume from their first unfinished stage after an interruption."""
+import pytest
+
+from report_pipeline import JOB_COMPLETED, JOB_INTERRUPTED, ReportJobRunner, ReportStage
+
+class _Crash(BaseException):
+    """Stands in for the process dying mid-stage: the runner doesn't catch it, so job.json stays 'running'."""
+
+STAGE_NAMES = ["outline", "research", "draft", "final"]
+
+def make_stages(calls, crash_at=None):
+    def stage(name):
+        def run(context):
+            calls.append(name)
+            if name == crash_at:
+                raise _Crash()
+            return f"{name} after {sorted(context.outputs)}"
+        return ReportStage(name, f"{name}.md", run)
+    return [stage(name) for name in STAGE_NAMES]
+
+@pytest.mark.parametrize("crash_at", STAGE_NAMES)
+def test_interrupted_job_resumes_without_repeating_finished_stages(tmp_path, crash_at):
+    calls = []
+    runner = ReportJobRunner(tmp_path, make_stages(calls, crash_at), max_workers=1, retry_delay=0)
+    job_id = runner.submit("Does sleep clear amyloid?")
+    runner.wait(job_id)
+    done = STAGE_NAMES[:STAGE_NAMES.index(crash_at)]
+    assert calls == done + [crash_at]
+    assert sorted(runner.outputs(job_id)) == sorted(done)
+
+    # A new process sees the job it was running as interrupted, and picks it up where it stopped.
+    calls.clear()
+    restarted = ReportJobRunner(tmp_path, make_stages(calls), max_workers=1, retry_delay=0)
+    assert restarted.status(job_id)["status"] == JOB_INTERRUPTED
+    assert restarted.resume(job_id)
+    record = restarted.wait(job_id)
+
+    assert record["status"] == JOB_COMPLETED
+    assert calls == STAGE_NAMES[len(done):]
+    outputs = restarted.outputs(job_id)
+    assert outputs["final"] == f"final after {sorted(['outline', 'research', 'draft'])}"
+    assert record["attempts"][crash_at] == 2
+    assert all(record["attempts"][name] == 1 for name in done)
+
+def test_completed_job_is_not_resumed(tmp_path):
+    calls = []
+    runner = ReportJobRunner(tmp_path, make_stages(calls), max_workers=1)
+    job_id = runner.submit("Does sleep clear amyloid?")
+    assert runner.wait(job_id)["status"] == JOB_COMPLETED
+
+    assert not runner.resume(job_id)
+    assert calls == STAGE_NAMES
@@ -0,0 +1,35 @@
+"""Per-section retrieval over research notes, and the References entries it attaches."""
+from report_retrieval import ResearchIndex, split_research
+
+NOTES = """\
+### Gut microbiota composition
+
+Firmicutes dominate the adult gut microbiota [Lee, 2021](https://doi.org/10.1/lee).
+
+### Vagus nerve signalling
+
+Vagal afferents relay microbial metabolite signals to the brainstem [Kim, 2022](https://doi.org/10.1/kim).
+
+### Cohort recruitment
+
+Participants were recruited from memory clinics [Ode, 2023](https://doi.org/10.1/ode).
+
+## Compiled References
+
+- [Lee, 2021](https://doi.org/10.1/lee)
+- [Kim, 2022](https://doi.org/10.1/kim)
+- [Ode, 2023](https://doi.org/10.1/ode)
+"""
+
+def test_compiled_references_are_read_as_references():
+    chunks, references = split_research(NOTES)
+
+    assert [chunk.heading for chunk in chunks] == [
+        "Gut microbiota composition", "Vagus nerve signalling", "Cohort recruitment"]
+    assert references["https://doi.org/10.1/kim"] == "- [Kim, 2022](https://doi.org/10.1/kim)"
+
+def test_context_keeps_matching_chunks_and_the_entries_they_cite():
+    context = ResearchIndex(NOTES).context_for("vagus nerve metabolite signalling", max_chunks=1)
+
+    assert "Vagal afferents" in context and "Firmicutes" not in context
+    assert context.endswith("### References\n- [Kim, 2022](https://doi.org/10.1/kim)")
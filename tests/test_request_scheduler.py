@@ -0,0 +1,107 @@
+"""RequestScheduler: token reservations are always settled or returned, and deadlines are honoured."""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from request_scheduler import RequestScheduler
+
+class _HTTPError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def _chunk(text, usage=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=usage)
+
+@pytest.fixture
+def scheduler():
+    # 600 tokens per second of refill is negligible over a test's few milliseconds.
+    return RequestScheduler(tokens_per_minute=36000, max_retries=2, base_delay=0.001, max_delay=0.01)
+
+def tokens_left(scheduler):
+    return scheduler._tokens.level
+
+def test_settles_with_reported_usage(scheduler):
+    response = SimpleNamespace(usage=SimpleNamespace(total_tokens=300))
+    assert scheduler.call(lambda: response, tokens=1000) is response
+    assert tokens_left(scheduler) == pytest.approx(36000 - 300, abs=50)
+
+def test_non_retryable_error_returns_the_reservation(scheduler):
+    def send():
+        raise _HTTPError(400)
+
+    for _ in range(5):
+        with pytest.raises(_HTTPError):
+            scheduler.call(send, tokens=5000)
+    assert tokens_left(scheduler) == pytest.approx(36000, abs=50)
+    assert scheduler.stats()["failed"] == 5
+
+def test_exhausted_retries_return_every_reservation(scheduler):
+    def send():
+        raise _HTTPError(503)
+
+    with pytest.raises(_HTTPError):
+        scheduler.call(send, tokens=5000)
+    assert tokens_left(scheduler) == pytest.approx(36000, abs=50)
+    assert scheduler.stats()["retries"] == 2
+
+def test_finished_stream_settles_with_streamed_tokens(scheduler):
+    chunks = list(scheduler.stream(lambda: iter([_chunk("a" * 400), _chunk("b" * 400)]), tokens=5000, prompt_tokens=100))
+    assert len(chunks) == 2
+    assert tokens_left(scheduler) == pytest.approx(36000 - 100 - 200, abs=50)
+
+def test_stream_prefers_reported_usage(scheduler):
+    chunks = [_chunk("a" * 400), _chunk("", usage=SimpleNamespace(total_tokens=1234))]
+    list(scheduler.stream(lambda: iter(chunks), tokens=5000, prompt_tokens=100))
+    assert tokens_left(scheduler) == pytest.approx(36000 - 1234, abs=50)
+
+def test_abandoned_or_failed_stream_still_settles(scheduler):
+    stream = scheduler.stream(lambda: iter([_chunk("a" * 400)] * 10), tokens=5000, prompt_tokens=100)
+    next(stream)
+    stream.close()
+    assert tokens_left(scheduler) == pytest.approx(36000 - 100 - 100, abs=50)
+
+    def broken():
+        yield _chunk("a" * 400)
+        raise ConnectionError("dropped mid-stream")
+
+    with pytest.raises(ConnectionError):
+        list(scheduler.stream(broken, tokens=5000, prompt_tokens=100))
+    assert tokens_left(scheduler) == pytest.approx(36000 - 2 * (100 + 100), abs=50)
+
+def test_no_retry_past_the_deadline():
+    scheduler = RequestScheduler(max_retries=5, base_delay=0.2, max_delay=0.2)
+    attempts = []
+
+    def send():
+        attempts.append(time.monotonic())
+        raise _HTTPError(503)
+
+    start = time.monotonic()
+    with pytest.raises(_HTTPError):
+        scheduler.call(send, tokens=10, deadline=start + 0.5)
+    assert len(attempts) < 6
+    assert time.monotonic() - start < 0.5
+
+def test_queued_request_gives_up_at_the_deadline():
+    scheduler = RequestScheduler(requests_per_minute=1)
+    scheduler.call(lambda: SimpleNamespace(usage=None), tokens=10)  # uses up the only request this minute
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        scheduler.call(lambda: SimpleNamespace(usage=None), tokens=10, deadline=start + 0.2)
+    assert time.monotonic() - start < 1.0
+    assert scheduler.stats()["waiting"] == 0
+
+def test_agent_fan_out_passes_its_deadline_down(lab, monkeypatch):
+    deadlines = []
+
+    def fake_chat(agent, messages, *args, deadline=None, **kwargs):
+        deadlines.append(deadline)
+        return "ok"
+
+    monkeypatch.setattr(lab, "chat_completion", fake_chat)
+    before = time.monotonic()
+    results = lab.run_agents_concurrently("query", {"A": ("sys", "task"), "B": ("sys", "task")}, timeout=30)
+    assert results == {"A": "ok", "B": "ok"}
+    assert len(set(deadlines)) == 1 and before + 30 <= deadlines[0] <= time.monotonic() + 30
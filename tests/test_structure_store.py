@@ -0,0 +1,93 @@
+"""AlphaFoldStructureStore against a local HTTP stand-in for the AlphaFold file server."""
+import http.server
+import threading
+
+import pytest
+
+from structure_store import AlphaFoldStructureStore, StructureNotFound
+
+KNOWN_IDS = [f"P{n:05d}" for n in range(12)]
+
+def _pdb(uniprot_id: str) -> str:
+    return f"HEADER    {uniprot_id}\nATOM      1  CA  ALA A   1       0.000   0.000   0.000  1.00 90.00           C\nEND\n"
+
+class _AlphaFoldHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        uniprot_id = self.path.rsplit("/", 1)[-1].split("-")[1]
+        body = _pdb(uniprot_id).encode() if uniprot_id in KNOWN_IDS else b"Not found"
+        self.send_response(200 if uniprot_id in KNOWN_IDS else 404)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def alphafold_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _AlphaFoldHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def store(tmp_path, alphafold_server):
+    host, port = alphafold_server.server_address
+    store = AlphaFoldStructureStore(tmp_path, base_url=f"http://{host}:{port}/files", pool_size=4)
+    yield store
+    store.session.close()
+
+def test_downloads_once_then_serves_from_disk(store, alphafold_server, tmp_path):
+    assert store.get("p00001") == _pdb("P00001")
+    assert alphafold_server.requests == ["/files/AF-P00001-F1-model_v4.pdb"]
+
+    assert store.get("P00001") == _pdb("P00001")
+    assert len(alphafold_server.requests) == 1
+
+    # A fresh store over the same directory (e.g. after a restart) still hits the disk cache.
+    restarted = AlphaFoldStructureStore(tmp_path, base_url=store.base_url)
+    assert restarted.get("P00001") == _pdb("P00001")
+    assert len(alphafold_server.requests) == 1
+
+def test_unknown_ids_are_negatively_cached(store, alphafold_server):
+    for _ in range(3):
+        with pytest.raises(StructureNotFound):
+            store.get("Q99999")
+    assert len(alphafold_server.requests) == 1
+
+def test_expired_negative_cache_asks_again(store, alphafold_server):
+    store.negative_ttl = 0
+    for _ in range(2):
+        with pytest.raises(StructureNotFound):
+            store.get("Q99999")
+    assert len(alphafold_server.requests) == 2
+
+def test_invalid_ids_never_reach_the_server(store, alphafold_server):
+    with pytest.raises(StructureNotFound):
+        store.get("../etc/passwd")
+    assert alphafold_server.requests == []
+
+def test_prefetch_reuses_connections(store, alphafold_server):
+    results = store.prefetch(KNOWN_IDS + ["Q99999", KNOWN_IDS[0]], max_workers=4)
+
+    assert list(results) == KNOWN_IDS + ["Q99999"]
+    assert all(results[uniprot_id] == _pdb(uniprot_id) for uniprot_id in KNOWN_IDS)
+    assert isinstance(results["Q99999"], StructureNotFound)
+    assert len(alphafold_server.requests) == len(KNOWN_IDS) + 1
+    # 13 downloads over at most one pooled connection per worker.
+    assert alphafold_server.connections <= 4
@@ -0,0 +1,40 @@
+"""MeetingMemory: a long meeting stays within the memory's budget and keeps its most recent turns."""
+import random
+
+from team_meeting import MeetingMemory, excerpt, split_sentences
+
+AGENDA = "Design nanobodies against the spike protein with high binding affinity and stability."
+SPEAKERS = ["Immunologist", "Computational Biologist", "Critic"]
+TOPICS = ("nanobody affinity epitope spike binding stability expression yield humanization aggregation "
+          "docking mutation library screening").split()
+
+def turn(rng, round_number):
+    return " ".join(f"We should test {rng.choice(TOPICS)} and {rng.choice(TOPICS)} of candidate "
+                    f"{rng.randint(1, 99)} in round {round_number}." for _ in range(4))
+
+def test_long_meeting_stays_within_budget_and_keeps_recent_turns():
+    rng = random.Random(0)
+    memory = MeetingMemory(AGENDA, max_chars=800)
+    for round_number in range(1, 41):
+        for speaker in SPEAKERS:
+            memory.add(speaker, turn(rng, round_number), round_number)
+            assert len(memory.render()) <= memory.max_chars
+            assert (round_number, speaker) in {(n.round_number, n.speaker) for n in memory.notes}
+
+    last_round = [n.speaker for n in memory.notes if n.round_number == 40]
+    assert set(last_round) == set(SPEAKERS)
+    assert min(n.round_number for n in memory.notes) > 30
+    # Notes are rendered in speaking order.
+    order = [(n.round_number, SPEAKERS.index(n.speaker)) for n in memory.notes]
+    assert order == sorted(order)
+
+def test_each_turn_adds_its_most_salient_sentences():
+    memory = MeetingMemory(AGENDA, sentences_per_turn=1)
+    memory.add("Critic", "Thanks everyone for joining today. The spike epitope binding affinity looks weak.", 1)
+    assert [n.sentence for n in memory.notes] == ["The spike epitope binding affinity looks weak."]
+    assert memory.render() == "- [Round 1, Critic] The spike epitope binding affinity looks weak."
+
+def test_sentences_skip_markdown_and_excerpt_respects_its_budget():
+    text = "## Plan\n- **First** we clone the VHH library.\n1. Then we screen binders by ELISA."
+    assert split_sentences(text) == ["First we clone the VHH library.", "Then we screen binders by ELISA."]
+    assert excerpt(text, 40) == "First we clone the VHH library."
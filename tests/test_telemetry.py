@@ -0,0 +1,77 @@
+"""Telemetry: nearest-rank percentiles, span recording, and the JSONL and Prometheus exports."""
+import json
+
+import pytest
+
+from telemetry import Telemetry, percentile
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))                            # 1..100, out of order
+    values = values[::2] + values[1::2]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 100) == 100
+    assert percentile([7.0], 95) == 7.0
+    assert percentile([], 50) is None
+
+@pytest.fixture
+def telemetry():
+    telemetry = Telemetry(prompt_price_per_1k=1.0, completion_price_per_1k=2.0)
+    for wall_ms in range(10, 210, 10):                     # 10..200 ms
+        telemetry.record("writer", "chat", wall_ms, prompt_tokens=100, completion_tokens=50)
+    telemetry.record("writer", "chat", 1.0, cache_hit=True)
+    telemetry.record("writer", "chat", 5000.0, error="TimeoutError")
+    telemetry.record("search", "fetch", 40.0, ttft_ms=12.0)
+    return telemetry
+
+def test_summary_percentiles_leave_out_cache_hits_and_errors(telemetry):
+    writer, search = telemetry.summary()                    # slowest agent first
+    assert writer["agent"] == "writer" and search["agent"] == "search"
+    assert (writer["calls"], writer["errors"], writer["cache_hits"]) == (22, 1, 1)
+    assert writer["p50_ms"] == 100 and writer["p95_ms"] == 190
+    assert writer["prompt_tokens"] == 2000 and writer["completion_tokens"] == 1000
+    assert writer["cost"] == pytest.approx(4.0)
+    assert search["ttft_p50_ms"] == search["ttft_p95_ms"] == 12.0
+
+def test_span_records_errors_and_reraises():
+    telemetry = Telemetry()
+    with telemetry.span("editor", "chat") as call:
+        call["prompt_tokens"] = 3
+    with pytest.raises(ValueError):
+        with telemetry.span("editor", "chat"):
+            raise ValueError("bad")
+
+    ok, failed = telemetry.records()
+    assert ok["prompt_tokens"] == 3 and ok["error"] is None
+    assert failed["error"] == "ValueError"
+
+def test_jsonl_export_has_one_record_per_line(telemetry, tmp_path):
+    lines = telemetry.to_jsonl().splitlines()
+    assert len(lines) == 23
+    assert [json.loads(line) for line in lines] == telemetry.records()
+
+    path = tmp_path / "calls.jsonl"
+    mirrored = Telemetry(jsonl_path=path)
+    mirrored.record("writer", "chat", 12.5, prompt_tokens=7)
+    [line] = path.read_text(encoding="utf-8").splitlines()
+    assert json.loads(line)["wall_ms"] == 12.5 and json.loads(line)["prompt_tokens"] == 7
+
+def test_prometheus_text_format(telemetry):
+    telemetry.record('quote"agent', "chat", 10.0)
+    text = telemetry.prometheus()
+    lines = text.splitlines()
+
+    assert text.endswith("\n")
+    assert "# TYPE aira_agent_calls_total counter" in lines
+    assert 'aira_agent_calls_total{agent="writer"} 22' in lines
+    assert 'aira_agent_errors_total{agent="writer"} 1' in lines
+    assert 'aira_agent_tokens_total{agent="writer",type="prompt"} 2000' in lines
+    assert 'aira_agent_latency_seconds{agent="writer",quantile="0.5"} 0.1' in lines
+    assert 'aira_agent_latency_seconds{agent="writer",quantile="0.95"} 0.19' in lines
+    assert 'aira_agent_ttft_seconds{agent="search",quantile="0.95"} 0.012' in lines
+    assert 'aira_agent_calls_total{agent="quote\\"agent"} 1' in lines
+    # Every sample belongs to a metric with a TYPE line.
+    for line in lines:
+        if not line.startswith("#"):
+            name = line.split("{")[0]
+            assert f"# TYPE {name} counter" in lines or f"# TYPE {name} gauge" in lines
@@ -0,0 +1,18 @@
+"""The tokenizer shared by research retrieval, query routing and meeting memory."""
+from text_utils import tokenize
+
+def test_tokenize_keeps_compounds_and_folds_plurals():
+    assert tokenize("We're studying IL-6 and single-cell trials in 3 studies.") == [
+        "studying", "il-6", "single-cell", "trial", "study"]
+
+def test_modules_tokenize_the_same_way():
+    from agent_router import _STOPWORDS as router_stopwords, _terms as router_terms
+    from report_retrieval import _STOPWORDS as retrieval_stopwords
+    from team_meeting import _terms as meeting_terms
+
+    text = "The team reviewed clinical trials of IL-6 inhibitors."
+    words = tokenize(text, router_stopwords)
+    assert words == ["team", "reviewed", "clinical", "trial", "il-6", "inhibitor"]
+    assert router_terms(text)[:len(words)] == words  # followed by the bigrams
+    assert meeting_terms(text) == words[1:]  # "team" is meeting small talk
+    assert tokenize("Section on microglia", retrieval_stopwords) == ["microglia"]
@@ -0,0 +1,34 @@
+import re
+from typing import AbstractSet, List
+
+# --------------------------------------------------------------------------
+# --- SHARED TOKENIZER ---
+# --------------------------------------------------------------------------
+# Research retrieval (report_retrieval.py), query routing (agent_router.py) and
+# the team meeting memory (team_meeting.py) all score text by the terms it
+# contains, so they share one tokenizer: lower-cased alphanumeric words, with
+# hyphenated compounds ("single-cell", "il-6") kept whole, single characters and
+# stopwords dropped, and plurals folded onto the singular. Each module may add
+# its own boilerplate words to `STOPWORDS`, but the tokens themselves are the same.
+
+TOKEN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+# Common English words (and contraction fragments such as the "re" of "we're").
+STOPWORDS = frozenset(
+    "a about all also an and any are as at be between but by can could do does each for from had has have how i "
+    "in into is it its just like ll may me more most my not of on only or other our own re same should so some "
+    "such than that the their them then there these they this those to ve very was we well were what when where "
+    "which while who why will with within would you your".split()
+)
+
+def stem(token: str) -> str:
+    # Just enough normalisation for domain words: "trials" -> "trial", "studies" -> "study".
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+def tokenize(text: str, stopwords: AbstractSet[str] = STOPWORDS) -> List[str]:
+    """The stemmed terms of `text`, in order, without stopwords or single characters."""
+    return [stem(token) for token in TOKEN.findall(text.lower()) if len(token) > 1 and token not in stopwords]